@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+""" Offline index of the nuke and nukescripts API (plus any modules in se_api_index_modules), for completion.
+
+build_index() imports the modules once and records each of their names (and the ones of their classes and
+submodules) with its kind, signature and the first line of its docstring, in a text file next to the rest of the
+KnobScripter files, named after the Nuke version. It's a header line, then one tab-separated line per name, sorted:
+    qualified name, kind (module, class, function, property or constant), signature, doc
+The completer then reads it (streamed, the first time it's needed) instead of calling dir() while typing, and shows
+call tips from it, without importing anything.
+
+adrianpueyo.com
+
+"""
+
+import importlib
+import inspect
+import io
+import json
+import os
+import re
+import nuke
+
+from KnobScripter import config
+
+FORMAT = 1
+DOC_CHARS = 160  # Docstrings are cut to their first line, and to this many characters
+
+_index = None  # KSApiIndex of the running Nuke version
+
+
+def nuke_version():
+    return getattr(nuke, "NUKE_VERSION_STRING", "{0}.{1}".format(nuke.NUKE_VERSION_MAJOR, nuke.NUKE_VERSION_MINOR))
+
+
+def index_path(version=None):
+    """ Returns the path of the index file for a Nuke version (the running one by default). """
+    filename = config.prefs["ks_api_index_file"].format(re.sub(r"[^\w.]", "_", version or nuke_version()))
+    return os.path.join(config.ks_directory, filename)
+
+
+def index():
+    """ Returns the KSApiIndex of the running Nuke version (not loaded until used). """
+    global _index
+    if _index is None:
+        _index = KSApiIndex(index_path())
+    return _index
+
+
+def kind_of(obj):
+    if inspect.ismodule(obj):
+        return "module"
+    if inspect.isclass(obj):
+        return "class"
+    if inspect.isroutine(obj):
+        return "function"
+    if inspect.isdatadescriptor(obj):
+        return "property"
+    return "constant"
+
+
+def clean(text):
+    """ Returns text in one line (as unicode), cut to DOC_CHARS. """
+    if isinstance(text, bytes):
+        text = text.decode("utf-8", "replace")
+    return u" ".join(text.split())[:DOC_CHARS]
+
+
+def describe(name, obj, kind):
+    """ Returns (signature, doc) of obj. Builtins (like most of nuke) have their signature in the docstring. """
+    if kind in ("constant", "module"):
+        doc = inspect.getdoc(obj) if kind == "module" else None
+        return "", clean(doc.strip().splitlines()[0]) if doc and doc.strip() else ""
+    lines = [line.strip() for line in (inspect.getdoc(obj) or "").splitlines() if line.strip()]
+    signature = ""
+    if kind in ("function", "class"):
+        try:
+            if hasattr(inspect, "signature"):
+                signature = name + str(inspect.signature(obj))
+            else:
+                signature = name + inspect.formatargspec(*inspect.getargspec(obj))
+        except Exception:
+            pass  # Builtins, or no signature
+        if lines and re.match(r"(?:[\w.]+\.)?" + re.escape(name) + r"\s*\(", lines[0]):
+            if not signature:
+                signature = clean(lines[0])
+            lines = lines[1:]
+    return signature, clean(lines[0]) if lines else ""
+
+
+def defined_in(obj, module_name):
+    """
+    Whether a class was defined in the module or its submodules, and not just imported by it (i.e. a PySide class).
+    Leading underscores are ignored, as compiled modules are usually private ones (nuke's classes are in _nuke).
+    """
+    defined = (getattr(obj, "__module__", None) or "").lstrip("_")
+    module_name = module_name.lstrip("_")
+    return defined == module_name or defined.startswith(module_name + ".")
+
+
+def module_entries(module_name):
+    """
+    Imports a module and returns the (qualified name, kind, signature, doc) of its names, recursively into its
+    submodules and its own classes. Classes from other modules it imports are one entry each, without their members.
+    """
+    module = importlib.import_module(module_name)
+    entries = [(module_name, "module") + describe(module_name, module, "module")]
+    visited = set([id(module)])
+    pending = [(module, module_name)]
+    while pending:
+        obj, qualified = pending.pop()
+        for name in dir(obj):
+            if "__" in name:
+                continue  # Left out of completion anyway
+            try:
+                member = getattr(obj, name)
+            except Exception:
+                continue
+            full_name = "{0}.{1}".format(qualified, name)
+            kind = kind_of(member)
+            entries.append((full_name, kind) + describe(name, member, kind))
+            if id(member) in visited:
+                continue
+            if (kind == "class" and defined_in(member, module_name)) or (
+                    kind == "module" and getattr(member, "__name__", "") == full_name):
+                visited.add(id(member))  # Its classes and submodules (not the ones it imports)
+                pending.append((member, full_name))
+    return entries
+
+
+def build_index(modules=None, path=None):
+    """
+    Introspects the modules (se_api_index_modules by default) and writes their index to path (the one of the
+    running Nuke version by default). Modules that fail to import are skipped. Returns the number of names indexed.
+    """
+    global _index
+    modules = modules or config.prefs["se_api_index_modules"]
+    path = path or index_path()
+    entries = dict()
+    for module_name in modules:
+        try:
+            for entry in module_entries(module_name):
+                entries[entry[0]] = entry
+        except ImportError:
+            continue
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    header = {"format": FORMAT, "nuke_version": nuke_version(), "modules": list(modules)}
+    temp_path = path + ".tmp"
+    with io.open(temp_path, "w", encoding="utf-8") as f:
+        f.write(u"{0}\n".format(json.dumps(header)))
+        for qualified in sorted(entries):
+            f.write(u"\t".join(field.replace("\t", " ") for field in entries[qualified]) + u"\n")
+    if os.path.isfile(path):
+        os.remove(path)  # os.rename doesn't replace files on Windows
+    os.rename(temp_path, path)
+    if _index is not None and _index.path == path:
+        _index = None  # Read again when next needed
+    return len(entries)
+
+
+class KSApiIndex(object):
+    """
+    Names of an index file, by the qualified name of their parent (i.e. "nuke" -> ["Node", ...], sorted), and the
+    (kind, signature, doc) of each by its qualified name. The file is only read the first time it's queried.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.loaded = False
+        self.children = dict()
+        self.entries = dict()
+
+    def load(self):
+        """ Reads the index file, if not done already. A missing or outdated file leaves the index empty. """
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with io.open(self.path, "r", encoding="utf-8") as f:
+                header = json.loads(f.readline())
+                if header.get("format") != FORMAT:
+                    return
+                for line in f:
+                    fields = line.rstrip(u"\n").split(u"\t")
+                    if len(fields) != 4:
+                        continue
+                    parent, _, name = fields[0].rpartition(u".")
+                    self.entries[fields[0]] = tuple(fields[1:])
+                    if parent:
+                        self.children.setdefault(parent, []).append(name)
+        except (IOError, OSError, ValueError):
+            self.children = dict()
+            self.entries = dict()
+
+    def has(self, qualified):
+        """ Whether the index lists the names of qualified (a module or class, i.e. "nuke.Node"). """
+        self.load()
+        return qualified in self.children
+
+    def names(self, qualified):
+        """ Returns the sorted names of a module or class, or an empty list. """
+        self.load()
+        return self.children.get(qualified, [])
+
+    def callTip(self, qualified):
+        """ Returns the signature and doc of a function or class as one text, or None if not indexed. """
+        self.load()
+        entry = self.entries.get(qualified)
+        if entry is None or entry[0] not in ("function", "class"):
+            return None
+        signature, doc = entry[1] or qualified.rpartition(".")[2] + "(...)", entry[2]
+        return u"{0}\n{1}".format(signature, doc) if doc else signature
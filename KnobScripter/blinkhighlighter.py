@@ -10,7 +10,10 @@ try:
 except ImportError:
     from Qt import QtCore, QtGui, QtWidgets
 
-class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
+from KnobScripter import lexer
+from KnobScripter.kshighlighter import KSHighlighter
+
+class KSBlinkHighlighter(KSHighlighter):
     '''
     Blink code highlighter class!
     Modified over Foundry's nukescripts.blinkscripteditor module.
@@ -23,7 +26,7 @@ class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
         self.selected_text = ""
         self.selected_text_prev = ""
 
-        self.styles = self.loadStyles()  # Holds a dict for each style
+        self.styles = self.sharedStyles()  # Holds a dict for each style, compiled once per process
         self._style = style  # Can be set via setStyle
         self._style = "default"  # TODO REMOVE
         self.setStyle(self._style)  # Set default style
@@ -31,8 +34,9 @@ class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
         super(KSBlinkHighlighter, self).__init__(document)
 
     def loadStyles(self):
-        ''' Loads the different sets of rules '''
+        ''' Loads the different styles. They all share the same lexer, and only differ in their formats '''
         styles = dict()
+        block_lexer = self.loadLexer()
 
         # LOAD ANY STYLE
         default_styles_list = [
@@ -45,6 +49,7 @@ class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
                     'stringSingleQuote': ([110, 160, 121]),
                     'comment': ([188, 179, 84]),
                     'multiline_comment': ([188, 179, 84]),
+                    'preprocessor': ([190, 130, 220]),
                     'type': ([25, 25, 80]),
                     'variableKeyword': ([25, 25, 80]),
                     'function': ([3, 185, 191]),  # only needed till here for blink?
@@ -53,28 +58,21 @@ class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
                     'selected': ([255, 255, 255], 'bold underline'),
                     'underline': ([240, 240, 240], 'underline'),
                 },
-                "keywords": {},
             },
         ]
 
         for style_dict in default_styles_list:
             if all(k in style_dict.keys() for k in ["title", "styles"]):
-                styles[style_dict["title"]] = self.loadStyle(style_dict)
+                styles[style_dict["title"]] = self.loadStyle(style_dict, block_lexer)
 
         return styles
 
-    def loadStyle(self, style_dict):
+    def loadStyle(self, style_dict, block_lexer):
         '''
-        Given a dictionary of styles and keywords, returns the style as a dict
+        Given a dictionary of styles, returns the style as a dict: the lexer, and the format for each kind of token
         '''
 
-        styles = style_dict["styles"]
-
-        # 1. Base settings
-        if "base" in styles:
-            base_format = styles["base"]
-        else:
-            base_format = self.format([255, 255, 255])
+        styles = style_dict["styles"].copy()
 
         for key in styles:
             if type(styles[key]) == list:
@@ -82,6 +80,20 @@ class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
             elif styles[key][1]:
                 styles[key] = self.format(styles[key][0], styles[key][1])
 
+        if 'base' not in styles:
+            styles['base'] = self.format([255, 255, 255])
+
+        result = {
+            "lexer": block_lexer,
+            "formats": styles,
+        }
+        return result
+
+    def loadLexer(self):
+        '''
+        Returns the lexer for blink code. As for python, lexing doesn't depend on the style.
+        '''
+
         mainKeywords = [
             "char", "class", "const", "double", "enum", "explicit",
             "friend", "inline", "int", "long", "namespace", "operator",
@@ -91,13 +103,6 @@ class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
             "local", "param", "kernel",
         ]
 
-        operatorKeywords = [
-            '=', '==', '!=', '<', '<=', '>', '>=',
-            '\+', '-', '\*', '/', '//', '\%', '\*\*',
-            '\+=', '-=', '\*=', '/=', '\%=',
-            '\^', '\|', '\&', '\~', '>>', '<<', '\+\+'
-        ]
-
         variableKeywords = [
             "int", "int2", "int3", "int4",
             "float", "float2", "float3", "float4", "float3x3", "float4x4", "bool",
@@ -113,49 +118,27 @@ class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
             "define", "defineParam", "process", "init", "setRange", "setAxis", "median", "bilinear",
         ]
 
-        singletons = ['true', 'false']
-
-        if 'multiline_comments' in styles:
-            multiline_delimiter = (QtCore.QRegExp("/\\*"), QtCore.QRegExp("\\*/"), 1, styles['multiline_comments'])
-        else:
-            multiline_delimiter = (QtCore.QRegExp("/\\*"), QtCore.QRegExp("\\*/"), 1, base_format)
-
-        # 2. Rules
-        rules = []
-
-        # Keywords
-        if 'keyword' in styles:
-            rules += [(r'\b%s\b' % i, 0, styles['keyword']) for i in mainKeywords]
-
-        # Funcs
-        if 'function' in styles:
-            rules += [(r'\b%s\b' % i, 0, styles['function']) for i in blinkFunctions]
-
-        # Types
-        if 'type' in styles:
-            rules += [(r'\b%s\b' % i, 0, styles['type']) for i in blinkTypes]
-
-        if 'variableKeyword' in styles:
-            rules += [(r'\b%s\b' % i, 0, styles['variableKeyword']) for i in variableKeywords]
-
-        # String Literals
-        if 'stringDoubleQuote' in styles:
-            rules += [(r"\"([^\"\\\\]|\\\\.)*\"", 0, styles['stringDoubleQuote'])]
-
-        # String single quotes
-        if 'stringSingleQuote' in styles:
-            rules += [(r"'([^'\\\\]|\\\\.)*'", 0, styles['stringSingleQuote'])]
+        # 1. Regions, which can be left open for the next block.
+        # Block states: 1 = inside /* */, 2 = preprocessor line continued with a backslash,
+        # 3 and 4 = string continued with a backslash.
+        regions = [
+            lexer.Region('multiline_comment', r"/\*", r"\*/", state=1, multiline=True),
+            lexer.Region('comment', "//"),
+            lexer.Region('preprocessor', r"^[\s]*#", state=2, continuation=True),
+            lexer.Region('stringDoubleQuote', '"', '"', state=3, escape=True, continuation=True),
+            lexer.Region('stringSingleQuote', "'", "'", state=4, escape=True, continuation=True),
+        ]
 
-        # Comments
-        if 'comment' in styles:
-            rules += [(r"//[^\n]*", 0, styles['comment'])]
+        # 2. Rules for the code between regions, in order of precedence
+        rules = [
+            (lexer.words_pattern(variableKeywords), 'variableKeyword'),
+            (lexer.words_pattern(blinkTypes), 'type'),
+            (lexer.words_pattern(blinkFunctions), 'function'),
+            (lexer.words_pattern(mainKeywords), 'keyword'),
+            (r"[A-Za-z_][\w]*", None),  # Any other word is skipped as a whole
+        ]
 
-        # Return all rules
-        result = {
-            "rules": [(QtCore.QRegExp(pat), index, fmt) for (pat, index, fmt) in rules],
-            "multiline_delimiter": multiline_delimiter,
-        }
-        return result
+        return lexer.BlockLexer(regions, lexer.RuleSet(rules))
 
     def format(self, rgb, style=''):
         '''
@@ -175,62 +158,11 @@ class KSBlinkHighlighter(QtGui.QSyntaxHighlighter):
 
         return textFormat
 
-    def highlightBlock(self, text):
-        '''
-        Apply syntax highlighting to the given block of text.
-        '''
-
-        for expression, nth, format in self.styles[self._style]["rules"]:
-            index = expression.indexIn(text, 0)
-
-            while index >= 0:
-                # We actually want the index of the nth match
-                index = expression.pos(nth)
-                length = len(expression.cap(nth))
-                self.setFormat(index, length, format)
-                index = expression.indexIn(text, index + length)
-
-        self.setCurrentBlockState(0)
-
-        # Multi-line strings etc. based on selected scheme
-        in_multiline = self.match_multiline_blink(text, *self.styles[self._style]["multiline_delimiter"])
-
-    def match_multiline_blink(self, text, delimiter_start, delimiter_end, in_state, style):
+    def lex(self, text, state):
         '''
-        Check whether highlighting requires multiple lines.
+        Single left-to-right pass over the block, starting from the state left open by the previous block.
         '''
-        # If inside multiline comment, start at 0
-        if self.previousBlockState() == in_state:
-            start = 0
-            add = 0
-        # Otherwise, look for the delimiter on this line
-        else:
-            start = delimiter_start.indexIn(text)
-            # Move past this match
-            add = delimiter_start.matchedLength()
-
-        # As long as there's a delimiter match on this line...
-        while start >= 0:
-            # Look for the ending delimiter
-            end = delimiter_end.indexIn(text, start + add)
-            # Ending delimiter on this line?
-            if end >= add:
-                length = end - start + add + delimiter_end.matchedLength()
-                self.setCurrentBlockState(0)
-            # No; multi-line string
-            else:
-                self.setCurrentBlockState(in_state)
-                length = len(text) - start + add
-            # Apply formatting
-            self.setFormat(start, length, style)
-            # Look for the next match
-            start = delimiter_start.indexIn(text, start + length)
-
-        # Return True if still inside a multi-line string, False otherwise
-        if self.currentBlockState() == in_state:
-            return True
-        else:
-            return False
+        return self.styles[self._style]["lexer"].scan(text, state)
 
     def setStyle(self,style=""):
         pass
\ No newline at end of file
@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+""" Bracket matching for the KnobScripter script editors.
+
+The KSBracketIndex keeps a summary of the brackets of each block: their columns (leaving out the ones inside
+strings and comments, from the runs the highlighter stored in the block), and for each pair of brackets the net
+depth change across the block and the lowest depth reached in either direction. Summaries of consecutive blocks
+combine into the one of the whole range, so the blocks are kept in chunks, each with the summary of all its
+blocks, and a segment tree per pair of brackets (KSDepthTree) goes over the chunks. Looking for the partner of a
+bracket then finds the chunk where the depth gets to 0 in O(log n), and only walks the blocks of that chunk.
+
+Summaries are computed in the background, in time slices, and matching on each cursor frame only summarizes a
+few blocks (frame_blocks): further away, the partner is UNKNOWN until the background is done, which then has the
+editor highlight the brackets again. An edit (contentsChange) only forgets the summaries of the blocks it
+changed, as does the highlighter lexing a block again (blockRelexed).
+
+adrianpueyo.com
+
+"""
+
+import bisect
+import re
+import time
+import nuke
+
+try:
+    if nuke.NUKE_VERSION_MAJOR < 11:
+        from PySide import QtCore, QtGui, QtGui as QtWidgets
+        from PySide.QtCore import Qt
+    else:
+        from PySide2 import QtWidgets, QtGui, QtCore
+        from PySide2.QtCore import Qt
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+from KnobScripter import lineops
+from KnobScripter.kshighlighter import is_long_block, region_runs
+
+PAIRS = [("(", ")"), ("[", "]"), ("{", "}")]
+OPENERS = dict(PAIRS)
+PARTNERS = dict(PAIRS + [(closer, opener) for opener, closer in PAIRS])
+BRACKET = re.compile(r"[()\[\]{}]")
+
+IDENTITY = (0, 0, 0)  # (delta, forward_low, backward_low) of no brackets
+EMPTY_SUMMARY = ((), dict((opener, IDENTITY) for opener, _ in PAIRS))
+UNKNOWN = -2  # Partner not known yet, as the blocks up to it aren't summarized (see KSBracketIndex.find)
+MAX_SEQUENCES = 4096  # Depths of the bracket sequences seen, shared by the summaries (see summarize)
+_sequence_depths = {}
+
+
+def code_brackets(text, skip_runs=()):
+    """ Returns the (column, bracket) of the brackets in a line, except the ones within skip_runs (start, length). """
+    result = []
+    runs = iter(skip_runs)
+    run_end = -1
+    run_start = -1
+    for match in BRACKET.finditer(text):
+        column = match.start()
+        while column >= run_end:
+            run = next(runs, None)
+            if run is None:
+                run_start = run_end = len(text) + 1
+                break
+            run_start, run_end = run[0], run[0] + run[1]
+        if not run_start <= column < run_end:
+            result.append((column, match.group()))
+    return result
+
+
+def sequence_depths(sequence):
+    """ Returns {opener: (delta, forward_low, backward_low)} for a sequence of brackets (see summarize). """
+    forward = dict((opener, 0) for opener in OPENERS)
+    forward_low = dict(forward)
+    backward = dict(forward)
+    backward_low = dict(forward)
+    for bracket in sequence:
+        if bracket in OPENERS:
+            forward[bracket] += 1
+        else:
+            opener = PARTNERS[bracket]
+            forward[opener] -= 1
+            forward_low[opener] = min(forward_low[opener], forward[opener])
+    for bracket in reversed(sequence):
+        if bracket in OPENERS:
+            backward[bracket] -= 1
+            backward_low[bracket] = min(backward_low[bracket], backward[bracket])
+        else:
+            backward[PARTNERS[bracket]] += 1
+    return dict((opener, (forward[opener], forward_low[opener], backward_low[opener])) for opener in OPENERS)
+
+
+def summarize(brackets):
+    """
+    Returns the summary of a block from its brackets: (brackets, {opener: (delta, forward_low, backward_low)}).
+    delta is the number of openers minus closers. forward_low is the lowest depth reached going forward from the
+    start of the block (openers count +1, closers -1), and backward_low the lowest going backward from its end
+    (closers count +1, openers -1). Most lines have one of a few sequences of brackets, so depths are shared.
+    """
+    if not brackets:
+        return EMPTY_SUMMARY
+    sequence = "".join(bracket for _, bracket in brackets)
+    depths = _sequence_depths.get(sequence)
+    if depths is None:
+        depths = sequence_depths(sequence)
+        if len(_sequence_depths) >= MAX_SEQUENCES:
+            _sequence_depths.clear()
+        _sequence_depths[sequence] = depths
+    return tuple(brackets), depths
+
+
+def combine(left, right):
+    """ Returns the (delta, forward_low, backward_low) of two consecutive ranges of blocks, from theirs. """
+    return left[0] + right[0], min(left[1], left[0] + right[1]), min(right[2], left[2] - right[0])
+
+
+def chunk_depths(summaries):
+    """ Returns {opener: (delta, forward_low, backward_low)} of consecutive blocks, from their summaries. """
+    totals = dict((opener, [0, 0, 0]) for opener in OPENERS)
+    for summary in summaries:
+        if summary is EMPTY_SUMMARY:
+            continue
+        for opener, (delta, forward_low, backward_low) in summary[1].items():
+            total = totals[opener]
+            total[1] = min(total[1], total[0] + forward_low)
+            total[2] = min(backward_low, total[2] - delta)
+            total[0] += delta
+    return dict((opener, tuple(total)) for opener, total in totals.items())
+
+
+def scan(brackets, opener, forward, depth, column=None):
+    """
+    Scans the brackets of a block for the one that brings depth to 0, forward or backward from column (excluded),
+    or from the start or end of the block if column is None. Returns (its column or -1, the depth left).
+    """
+    closer = PARTNERS[opener]
+    if forward:
+        up, down = opener, closer
+        sequence = brackets
+    else:
+        up, down = closer, opener
+        sequence = reversed(brackets)
+    for bracket_column, bracket in sequence:
+        if column is not None and (bracket_column <= column if forward else bracket_column >= column):
+            continue
+        if bracket == up:
+            depth += 1
+        elif bracket == down:
+            depth -= 1
+            if depth == 0:
+                return bracket_column, depth
+    return -1, depth
+
+
+class KSDepthTree(object):
+    """
+    Segment tree of the (delta, forward_low, backward_low) of one pair of brackets over the chunks of a document.
+    forward and backward find the first chunk, from a given one, where a depth gets to 0, in O(log n).
+    """
+
+    def __init__(self, values):
+        size = 1
+        while size < len(values):
+            size *= 2
+        self.size = size
+        self.nodes = [IDENTITY] * (2 * size)
+        self.nodes[size:size + len(values)] = values
+        for node in range(size - 1, 0, -1):
+            self.nodes[node] = combine(self.nodes[2 * node], self.nodes[2 * node + 1])
+
+    def set(self, index, value):
+        node = index + self.size
+        self.nodes[node] = value
+        node //= 2
+        while node:
+            self.nodes[node] = combine(self.nodes[2 * node], self.nodes[2 * node + 1])
+            node //= 2
+
+    def cover(self, start, end):
+        """ Returns the nodes covering the chunks from start to end (excluded), from left to right. """
+        left, right = [], []
+        start += self.size
+        end += self.size
+        while start < end:
+            if start & 1:
+                left.append(start)
+                start += 1
+            if end & 1:
+                end -= 1
+                right.append(end)
+            start //= 2
+            end //= 2
+        return left + right[::-1]
+
+    def forward(self, start, depth):
+        """ Returns the first chunk from start on where depth gets to 0 going forward, and the depth entering it. """
+        nodes = self.nodes
+        for node in self.cover(start, self.size):
+            if depth + nodes[node][1] > 0:
+                depth += nodes[node][0]
+                continue
+            while node < self.size:
+                node *= 2
+                if depth + nodes[node][1] > 0:  # Not within the left half
+                    depth += nodes[node][0]
+                    node += 1
+            return node - self.size, depth
+        return -1, depth
+
+    def backward(self, start, depth):
+        """ Returns the first chunk from start down where depth gets to 0 going backward, and the depth entering it. """
+        nodes = self.nodes
+        for node in reversed(self.cover(0, start + 1)):
+            if depth + nodes[node][2] > 0:
+                depth -= nodes[node][0]
+                continue
+            while node < self.size:
+                node = 2 * node + 1
+                if depth + nodes[node][2] > 0:  # Not within the right half
+                    depth -= nodes[node][0]
+                    node -= 1
+            return node - self.size, depth
+        return -1, depth
+
+
+class KSBracketIndex(object):
+    """
+    Bracket summaries of the blocks of a script editor's document, for bracket matching (see summarize), in chunks
+    of consecutive blocks. Each chunk gets the depths of all its blocks together, and a KSDepthTree per pair of
+    brackets goes over those once they're all known.
+    """
+
+    chunk_blocks = 256  # Blocks per chunk. Chunks are split when they grow to twice as many
+    frame_blocks = 200  # Blocks summarized at most when matching with a budget (on each cursor frame)
+    slice_seconds = 0.008  # Time summarizing in each step of the background
+
+    def __init__(self, editor):
+        self.editor = editor
+        self.highlighter = None  # Highlighter the region kinds are from
+        self.region_kinds = frozenset()
+        self.count = 0  # Number of blocks
+        self.chunks = []  # Lists of block summaries (None until summarized)
+        self.starts = []  # Number of the first block of each chunk
+        self.depths = []  # Depths of each chunk (see chunk_depths), or None until all its blocks are summarized
+        self.trees = None  # {opener: KSDepthTree} over the depths of the chunks, until chunks are added or removed
+        self.budget = None  # Blocks that can still be summarized by the current match (None for any)
+        self.waiting = False  # A match was UNKNOWN: brackets are highlighted again when the background is done
+        self.timer = QtCore.QTimer(editor)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.summarizeStep)
+        self.reset()
+
+    def reset(self):
+        """ Forgets all the summaries (i.e. when the document or its highlighter change). """
+        self.count = self.editor.document().blockCount()
+        size = self.chunk_blocks
+        self.chunks = [[None] * min(size, self.count - start) for start in range(0, self.count, size)]
+        self.depths = [None] * len(self.chunks)
+        self.trees = None
+        self.updateStarts()
+        self.timer.start()
+
+    def updateStarts(self):
+        starts = []
+        total = 0
+        for chunk in self.chunks:
+            starts.append(total)
+            total += len(chunk)
+        self.starts = starts
+
+    def locate(self, number):
+        """ Returns the index of the chunk of the block number. """
+        return bisect.bisect_right(self.starts, number) - 1
+
+    def update(self, position, removed, added):
+        """ contentsChange slot: forgets the summaries of the blocks changed, and keeps the rest. """
+        changed = lineops.changed_blocks(self.editor.document(), position, added, self.count)
+        if changed is None:
+            return self.reset()
+        first, last, old_last = changed
+        self.splice(first, old_last, last - first + 1)
+
+    def splice(self, first, old_last, count):
+        """ Replaces the summaries of the blocks from first to old_last (numbered before the edit) with count new ones. """
+        old_count = old_last - first + 1
+        index = self.locate(first)
+        last_index = self.locate(old_last) if old_count else index
+        start = self.starts[index]
+        if index == last_index:
+            summaries = self.chunks[index]
+        else:
+            summaries = [summary for chunk in self.chunks[index:last_index + 1] for summary in chunk]
+        summaries[first - start:old_last + 1 - start] = [None] * count
+        self.count += count - old_count
+        if index == last_index and 0 < len(summaries) < 2 * self.chunk_blocks:
+            self.depths[index] = None
+        else:
+            size = self.chunk_blocks
+            pieces = [summaries[i:i + size] for i in range(0, len(summaries), size)]
+            self.chunks[index:last_index + 1] = pieces
+            self.depths[index:last_index + 1] = [None] * len(pieces)
+            if len(pieces) != last_index + 1 - index:
+                self.trees = None  # Built again in the background
+        if count != old_count:
+            self.updateStarts()
+        self.timer.start()
+
+    def summary(self, number, block=None):
+        """ Returns the summary of the block number (the block can be given, if known). """
+        index = self.locate(number)
+        chunk = self.chunks[index]
+        summary = chunk[number - self.starts[index]]
+        if summary is None:
+            if block is None:
+                block = self.editor.document().findBlockByNumber(number)
+            summary = self.summarizeBlock(block)
+            chunk[number - self.starts[index]] = summary
+        return summary
+
+    def summarizeBlock(self, block):
+        """ Finds the brackets of a block, skipping strings and comments if the highlighter has lexed it already. """
+        if is_long_block(block):
+            return EMPTY_SUMMARY
+        text = block.text()
+        if BRACKET.search(text) is None:
+            return EMPTY_SUMMARY
+        skip_runs = None
+        if self.highlighter is not None:
+            skip_runs = region_runs(block, self.region_kinds, text)
+        return summarize(code_brackets(text, skip_runs or ()))
+
+    def spend(self):
+        """ Takes one block from the budget of the current match. Returns False if there's none left. """
+        if self.budget is None:
+            return True
+        self.budget -= 1
+        return self.budget >= 0
+
+    def chunkDepths(self, index):
+        """ Returns the depths of a chunk, summarizing its blocks if needed, or None if that's over budget. """
+        depths = self.depths[index]
+        if depths is not None:
+            return depths
+        chunk = self.chunks[index]
+        block = None  # Looked up for the first block not summarized, then walked from it
+        for offset, summary in enumerate(chunk):
+            if summary is not None:
+                block = None
+                continue
+            if not self.spend():
+                return None
+            if block is None:
+                block = self.editor.document().findBlockByNumber(self.starts[index] + offset)
+            chunk[offset] = self.summarizeBlock(block)
+            block = block.next()
+        depths = chunk_depths(chunk)
+        self.depths[index] = depths
+        if self.trees is not None:
+            for opener, tree in self.trees.items():
+                tree.set(index, depths[opener])
+        return depths
+
+    def summarizeStep(self):
+        """ Background step: summarizes chunks for slice_seconds, then builds the trees once they're all done. """
+        self.checkSummaries()
+        deadline = time.time() + self.slice_seconds
+        for index, depths in enumerate(self.depths):
+            if depths is None:
+                self.chunkDepths(index)
+                if time.time() > deadline:
+                    return  # The timer calls again
+        if self.trees is None:
+            self.trees = dict((opener, KSDepthTree([depths[opener] for depths in self.depths])) for opener in OPENERS)
+        self.timer.stop()
+        if self.waiting:
+            self.waiting = False
+            self.editor.highlightMatchingBrackets()
+
+    def relexed(self, number):
+        """ blockRelexed slot: forgets the summary of a block whose strings or comments might have changed. """
+        if number < self.count:
+            index = self.locate(number)
+            self.chunks[index][number - self.starts[index]] = None
+            self.depths[index] = None
+            self.timer.start()
+
+    def checkSummaries(self):
+        """ Forgets all the summaries if the highlighter changed, or an edit wasn't notified. """
+        highlighter = self.editor.highlighter
+        if highlighter is not self.highlighter:
+            try:
+                self.highlighter.blockRelexed.disconnect(self.relexed)
+            except (AttributeError, RuntimeError, TypeError):
+                pass  # No highlighter before, or already deleted
+            self.highlighter = highlighter
+            self.region_kinds = frozenset()
+            if highlighter is not None:
+                self.region_kinds = highlighter.regionKinds()
+                highlighter.blockRelexed.connect(self.relexed)
+            self.reset()
+        elif self.count != self.editor.document().blockCount():
+            self.reset()
+
+    def bracketAt(self, position):
+        """ Returns the bracket at the position of the document (outside strings and comments), or None. """
+        self.checkSummaries()
+        block = self.editor.document().findBlock(position)
+        if not block.isValid():
+            return None
+        column = position - block.position()
+        for bracket_column, bracket in self.summary(block.blockNumber(), block)[0]:
+            if bracket_column == column:
+                return bracket
+        return None
+
+    def find(self, number, column, opener, forward, depth=1, budget=None):
+        """
+        Looks for the bracket that brings depth to 0, from column (excluded) of the block number, forward (for the
+        closer of opener) or backward (for the opener). Returns its position in the document, or -1. With a budget,
+        summarizes that many blocks at most, and returns UNKNOWN if more were needed (the background does them).
+        """
+        self.budget = budget
+        try:
+            found, depth = scan(self.summary(number)[0], opener, forward, depth, column)
+            if found >= 0:
+                return self.editor.document().findBlockByNumber(number).position() + found
+            step = 1 if forward else -1
+            index = self.locate(number)
+            result = self.findInChunk(index, number + step, opener, forward, depth)
+            while result is not None and result[1] < 0:
+                index, depth = self.findChunk(index + step, opener, forward, result[2])
+                if index is None:
+                    result = None
+                elif index < 0:
+                    return -1
+                else:
+                    first = self.starts[index] if forward else self.starts[index] + len(self.chunks[index]) - 1
+                    result = self.findInChunk(index, first, opener, forward, depth)
+            if result is None:
+                self.waiting = True
+                self.timer.start()
+                return UNKNOWN
+            return self.editor.document().findBlockByNumber(result[0]).position() + result[1]
+        finally:
+            self.budget = None
+
+    def findInChunk(self, index, number, opener, forward, depth):
+        """
+        Looks for the bracket that brings depth to 0 in the blocks of a chunk, from the block number on (forward or
+        backward). Returns (block number, column, depth left), with a column of -1 if not found, or None if over budget.
+        """
+        chunk = self.chunks[index]
+        start = self.starts[index]
+        offsets = range(number - start, len(chunk)) if forward else range(number - start, -1, -1)
+        block = None  # Only looked up for the blocks not summarized yet, walking from the previous one
+        for offset in offsets:
+            summary = chunk[offset]
+            if summary is not None:
+                block = None
+            else:
+                if not self.spend():
+                    return None
+                if block is None:
+                    block = self.editor.document().findBlockByNumber(start + offset)
+                summary = chunk[offset] = self.summarizeBlock(block)
+                block = block.next() if forward else block.previous()
+            brackets, depths = summary
+            delta, forward_low, backward_low = depths[opener]
+            if forward and depth + forward_low > 0:
+                depth += delta  # The depth doesn't get to 0 within this block
+            elif not forward and depth + backward_low > 0:
+                depth -= delta
+            else:
+                found, depth = scan(brackets, opener, forward, depth)
+                return start + offset, found, depth
+        return -1, -1, depth
+
+    def findChunk(self, index, opener, forward, depth):
+        """
+        Returns the first chunk from index on (forward or backward) where depth gets to 0, and the depth entering it:
+        from the trees if all the chunks are summarized, otherwise walking them. The chunk is -1 if there's none, or
+        None if summarizing the chunks on the way is over budget.
+        """
+        if not 0 <= index < len(self.chunks):
+            return -1, depth
+        if self.trees is not None and None in self.depths:  # Chunks edited since the trees were built
+            for stale in [i for i, depths in enumerate(self.depths) if depths is None]:
+                if self.chunkDepths(stale) is None:
+                    break  # Walking the chunks instead, up to the budget
+        if self.trees is not None and None not in self.depths:
+            tree = self.trees[opener]
+            return tree.forward(index, depth) if forward else tree.backward(index, depth)
+        step = 1 if forward else -1
+        while 0 <= index < len(self.chunks):
+            depths = self.chunkDepths(index)
+            if depths is None:
+                return None, depth
+            delta, forward_low, backward_low = depths[opener]
+            if forward and depth + forward_low > 0:
+                depth += delta
+            elif not forward and depth + backward_low > 0:
+                depth -= delta
+            else:
+                return index, depth
+            index += step
+        return -1, depth
+
+    def match(self, position, budget=None):
+        """
+        Returns the position of the partner of the bracket at position, -1 if it has none, UNKNOWN if it's too far
+        to find within budget (see find), or None if there's no bracket.
+        """
+        bracket = self.bracketAt(position)
+        if bracket is None:
+            return None
+        block = self.editor.document().findBlock(position)
+        forward = bracket in OPENERS
+        opener = bracket if forward else PARTNERS[bracket]
+        return self.find(block.blockNumber(), position - block.position(), opener, forward, budget=budget)
+
+    def enclosing(self, position):
+        """ Returns the position of the innermost opener whose pair contains position, or -1. """
+        self.checkSummaries()
+        block = self.editor.document().findBlock(position)
+        if not block.isValid():
+            return -1
+        column = position - block.position()
+        found = [self.find(block.blockNumber(), column, opener, False) for opener, _ in PAIRS]
+        return max(found)
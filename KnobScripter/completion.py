@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+""" Completion engine of the script editor: ranked prefix and fuzzy matching of the completion candidates.
+
+Each list of candidates (the attributes of a module, the names in the document, the blink keywords...) gets a
+KSCandidates: its names sorted, plus a case-folded copy, so exact and case-insensitive prefix matches are two
+bisects. Fuzzy matches follow: the candidates that have the typed text as a subsequence (i.e. "tN" or "thnd" for
+thisNode), scored by how much of it falls on word starts (after "_", "." or a lowercase to uppercase change) and in
+consecutive runs. In big lists, only the candidates starting with the same character are tried, and a
+KSCompletionSearch only filters its previous fuzzy matches when the text typed grows, so typing stays well under
+a millisecond with 50k candidates.
+
+Within each of those groups, the names picked more (and more recently) go first, given their usage scores (see
+usage.py). The results go to a KSCompletionModel, which applies the difference with the rows it has instead of
+resetting.
+
+adrianpueyo.com
+
+"""
+
+import bisect
+import re
+from collections import OrderedDict
+
+import nuke
+
+try:
+    if nuke.NUKE_VERSION_MAJOR < 11:
+        from PySide import QtCore, QtGui, QtGui as QtWidgets
+        from PySide.QtCore import Qt
+    else:
+        from PySide2 import QtWidgets, QtGui, QtCore
+        from PySide2.QtCore import Qt
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+from KnobScripter import config
+
+MAX_INDEXES = 64  # KSCandidates kept (see candidates)
+
+_indexes = OrderedDict()  # key -> (source list, KSCandidates), least recently used first
+
+
+def candidates(names, key=None, hide_dunder=False):
+    """
+    Returns the KSCandidates of a list of names, cached by the identity of the list (or by key, i.e. with a version,
+    for lists that change in place). The lists cached by identity must not change once given.
+    """
+    key = (id(names) if key is None else key, hide_dunder)
+    entry = _indexes.pop(key, None)
+    if entry is None or (key[0] == id(names) and entry[0] is not names):
+        entry = (names, KSCandidates(names, hide_dunder))
+        if len(_indexes) >= MAX_INDEXES:
+            _indexes.popitem(last=False)
+    _indexes[key] = entry  # Holding the list, so its id can't be reused while cached
+    return entry[1]
+
+
+def subsequence_pattern(query):
+    """
+    Returns a regex matching the case-folded names that have query as a subsequence (with match). Each character
+    skips up to the next occurrence of itself, so it never backtracks.
+    """
+    return re.compile(u"".join(u"[^{0}]*{0}".format(re.escape(char)) for char in query))
+
+
+def fuzzy_score(query, name):
+    """
+    Returns how well query (case-folded) matches name as a subsequence, or None if it doesn't. Characters on word
+    starts and right after the previous one count up, and the ones after a gap count down.
+    """
+    folded = name.lower()
+    score = 0
+    position = 0
+    previous = -2
+    for char in query:
+        found = folded.find(char, position)
+        if found < 0:
+            return None
+        if found == previous + 1:
+            score += 3
+        elif found == 0 or name[found - 1] in "_." or (name[found].isupper() and name[found - 1].islower()):
+            score += 2
+        else:
+            score -= 1
+        previous = found
+        position = found + 1
+    return score
+
+
+class KSCandidates(object):
+    """ A list of completion candidates, sorted, with the case-folded names sorted as well for bisecting. """
+
+    fuzzy_scan_limit = 1000  # Lists up to this long are scanned whole for fuzzy matches
+
+    def __init__(self, names, hide_dunder=False):
+        unique = set(names)
+        if hide_dunder:
+            unique = [name for name in unique if "__" not in name]
+        self.names = sorted(unique)
+        folded = sorted((name.lower(), name) for name in self.names)
+        self.folded = [pair[0] for pair in folded]
+        self.folded_names = [pair[1] for pair in folded]
+        self.by_folded = dict()  # Folded name -> names
+        for folded_name, name in folded:
+            self.by_folded.setdefault(folded_name, []).append(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def prefixed(self, prefix, limit=None):
+        """ Returns the names starting with prefix (case-sensitive), sorted, up to limit. """
+        names = self.names
+        i = bisect.bisect_left(names, prefix)
+        end = len(names) if limit is None else min(len(names), i + limit)
+        matches = []
+        while i < end and names[i].startswith(prefix):
+            matches.append(names[i])
+            i += 1
+        return matches
+
+    def foldedRange(self, prefix):
+        """ Returns the (start, end) of the names starting with prefix (case-folded) in folded. """
+        start = bisect.bisect_left(self.folded, prefix)
+        return start, bisect.bisect_left(self.folded, prefix + u"\uffff", start)
+
+    def fuzzyMatches(self, query):
+        """
+        Returns the folded names having query (case-folded) as a subsequence. In lists longer than fuzzy_scan_limit,
+        only the names starting with the same character are tried.
+        """
+        start, end = (0, len(self.folded)) if len(self.names) <= self.fuzzy_scan_limit else self.foldedRange(query[0])
+        match = subsequence_pattern(query).match
+        return [folded for folded in self.folded[start:end] if match(folded)]
+
+
+class KSCompletionSearch(object):
+    """
+    Ranks the candidates of one or more KSCandidates for a text typed. The fuzzy matches of the last search are
+    kept, so when the next text extends it (the usual case while typing) only those are tried again.
+    """
+
+    max_fuzzy = 50  # Fuzzy matches given after the prefix ones
+
+    def __init__(self):
+        self._query = None
+        self._sources = None  # The KSCandidates searched last
+        self._fuzzy = []  # Folded names matching the last query as a subsequence
+
+    def search(self, query, sources, limit=None, scores=None, used=None):
+        """
+        Returns the names of the sources matching query, best first: the ones starting with it as typed, then in
+        another case, then the fuzzy matches by score (from two characters typed on). Returns up to limit
+        (se_completion_max_results). scores ({name: usage score}, see usage.py) puts the most used first within
+        each group, and used (the KSCandidates of the names in scores) keeps the ones starting with query even
+        past limit.
+        """
+        if limit is None:
+            limit = config.prefs["se_completion_max_results"]
+        scores = scores or {}
+        if not query:
+            names = set()
+            for source in sources:
+                names.update(source.names[:limit])
+            return sorted(names, key=lambda name: (-scores.get(name, 0), name))[:limit]
+
+        folded_query = query.lower()
+        exact = []
+        seen = set()
+        truncated = False
+        for source in sources:
+            prefixed = source.prefixed(query, limit)
+            truncated = truncated or len(prefixed) == limit
+            for name in prefixed:
+                if name not in seen:
+                    seen.add(name)
+                    exact.append(name)
+        if truncated and used is not None:  # Some used names could be past the limit, alphabetically
+            for name in used.prefixed(query):
+                if name not in seen and any(name in source.by_folded.get(name.lower(), ()) for source in sources):
+                    seen.add(name)
+                    exact.append(name)
+        exact.sort(key=lambda name: (-scores.get(name, 0), name))
+        if len(exact) >= limit:
+            return exact[:limit]
+
+        other_case = []
+        for source in sources:
+            start, end = source.foldedRange(folded_query)
+            for name in source.folded_names[start:min(end, start + limit)]:
+                if name not in seen:
+                    seen.add(name)
+                    other_case.append(name)
+        other_case.sort(key=lambda name: (-scores.get(name, 0), name))
+        matches = exact + other_case
+        if len(matches) >= limit or len(query) < 2:
+            return matches[:limit]  # Any name has most single characters in it
+
+        sources = list(sources)
+        if self._query is not None and folded_query.startswith(self._query) and sources == self._sources:
+            match = subsequence_pattern(folded_query).match
+            fuzzy = [folded for folded in self._fuzzy if match(folded)]
+        else:
+            fuzzy = []
+            for source in sources:
+                fuzzy.extend(source.fuzzyMatches(folded_query))
+        self._query = folded_query
+        self._sources = sources
+        self._fuzzy = fuzzy
+
+        # Only the shortest ones are scored, as the best matches rarely have much more than the text typed
+        needed = min(limit - len(matches), self.max_fuzzy)
+        shortest = set(fuzzy)
+        if len(shortest) > 2 * needed + len(seen):
+            shortest = sorted(shortest, key=len)[:2 * needed + len(seen)]
+        scored = set()
+        for folded_name in shortest:
+            for source in sources:
+                for name in source.by_folded.get(folded_name, ()):
+                    if name not in seen:
+                        scored.add((-fuzzy_score(folded_query, name), -scores.get(name, 0), len(name), name))
+        return matches + [match[-1] for match in sorted(scored)[:needed]]
+
+
+class KSCompletionModel(QtCore.QAbstractListModel):
+    """
+    List model of the completer's matches. setMatches only removes and inserts the rows that differ from the ones
+    shown (keeping the common start and end), so the popup isn't reset on every key.
+    """
+
+    def __init__(self, parent=None):
+        super(KSCompletionModel, self).__init__(parent)
+        self.matches = []
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.matches)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        return self.matches[index.row()]
+
+    def setMatches(self, matches):
+        old = self.matches
+        start = 0
+        common = min(len(old), len(matches))
+        while start < common and old[start] == matches[start]:
+            start += 1
+        end = 0
+        while end < common - start and old[-1 - end] == matches[-1 - end]:
+            end += 1
+        if start + end < len(old):
+            self.beginRemoveRows(QtCore.QModelIndex(), start, len(old) - end - 1)
+            self.matches = old[:start] + old[len(old) - end:]
+            self.endRemoveRows()
+        if start + end < len(matches):
+            self.beginInsertRows(QtCore.QModelIndex(), start, len(matches) - end - 1)
+            self.matches = list(matches)
+            self.endInsertRows()
+        self.matches = list(matches)
@@ -20,12 +20,26 @@ prefs = {
     "ks_blink_autosave_on_compile": False,
     "ks_save_knob_state": 1,
     "ks_save_py_state": 2,
+    "ks_large_file_mb": 4,
+    "ks_document_cache_kb": 8192,
+    "ks_api_index_file": "api_index_{0}.txt",
+    "ks_usage_file": "usage.json",
     "code_style_python": "monokai",
     "code_style_blink": "default",
     "se_style": "default",
     "se_font_family": "Monospace",
     "se_font_size": 10,
     "se_tab_spaces": 4,
+    "se_lazy_highlight_blocks": 2000,
+    "se_highlight_cache_kb": 4096,
+    "se_semantic_highlighting": False,
+    "se_long_line_chars": 10000,
+    "se_introspection_cache_entries": 512,
+    "se_introspection_budget_ms": 50,
+    "se_api_index_modules": ["nuke", "nukescripts"],
+    "se_completion_max_results": 200,
+    "se_usage_half_life_days": 14,
+    "se_usage_max_entries": 2000,
     "qt_btn_size": 24,
     "qt_icon_size": 17,
 }
@@ -37,6 +51,10 @@ script_editor_styles = {
         "lineNumberAreaColor": (36, 36, 36),
         "lineNumberColor": (110, 110, 110),
         "currentLineNumberColor": (255, 170, 0),  # TODO: add scrollbar color
+        "occurrence_color": (255, 170, 0, 55),
+        "long_line_color": (200, 90, 60),
+        "bracket_match_color": (110, 160, 255, 70),
+        "bracket_unmatched_color": (230, 60, 60, 110),
     },
     "blink_default": {
         "stylesheet": 'background:#505050;color:#DEDEDE;',
@@ -44,6 +62,10 @@ script_editor_styles = {
         "lineNumberAreaColor": (72, 72, 72),
         "lineNumberColor": (34, 34, 34),
         "currentLineNumberColor": (255, 255, 255),
+        "occurrence_color": (255, 255, 255, 60),
+        "long_line_color": (230, 110, 70),
+        "bracket_match_color": (140, 190, 255, 90),
+        "bracket_unmatched_color": (255, 70, 70, 120),
     }
 }
 
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+""" Cache of the documents of a KnobScripter's script editor, by knob or script.
+
+Switching knobs (node mode) or scripts (script mode) used to set the new text into the same QTextDocument, which
+throws away its highlighting, layout and undo history, and rebuilds them all. Instead, each knob or script gets a
+QTextDocument of its own. The KSDocumentCache keeps the ones not shown (each with its highlighter) in LRU order,
+up to a total size (ks_document_cache_kb), so going back to one is just a swap of documents. A cached document
+highlighted with other styles than the current ones gets them when it's shown again (see KSScriptEditor.swapDocument).
+The size counts the undo history too (roughly, by steps): when the cache is full, the least recently used documents
+lose their undo history first, and are evicted (deleted, along with their highlighter) if that's not enough.
+
+adrianpueyo.com
+
+"""
+
+from collections import OrderedDict
+
+UNDO_STEP_BYTES = 256  # Rough size of an undo or redo step: the command, and the text it keeps in the document
+
+
+def text_signature(text):
+    """ Returns the (length, hash) of a text, to tell whether a document still has it without reading it back. """
+    return len(text), hash(text)
+
+
+def document_size(document):
+    """ Returns the estimated size of a QTextDocument in bytes: its text (as UTF-16), and its undo history. """
+    steps = document.availableUndoSteps() + document.availableRedoSteps()
+    return document.characterCount() * 2 + steps * UNDO_STEP_BYTES
+
+
+class KSDocumentState(object):
+    """
+    A QTextDocument, with the highlighter and code language it's shown with, and the markers of its folded headers
+    (see KSScriptEditor.swapDocument and KSFoldTree.folded).
+    """
+
+    def __init__(self, document, highlighter=None, code_language=None, folds=None):
+        self.document = document
+        self.highlighter = highlighter
+        self.code_language = code_language
+        self.folds = folds
+
+    def release(self):
+        """ Deletes the document, and with it its highlighter (which it owns) and undo stack. """
+        self.highlighter = None
+        self.document.deleteLater()
+
+
+class KSDocumentCache(object):
+    """
+    LRU cache of the documents of a script editor, by key, such as ("knob", node full name, knob name) or
+    ("script", folder, script). key is the one of the document shown, which isn't in the cache while shown.
+    The size of the documents is estimated in bytes (see document_size).
+    """
+
+    def __init__(self, editor, max_bytes=8 * 1024 * 1024):
+        self.editor = editor
+        self.max_bytes = max_bytes
+        self.key = None
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (KSDocumentState, size)
+        self._synced = dict()  # key -> text_signature of the text of its document, unless modified since
+
+    def show(self, key, text, keep=True):
+        """
+        Shows text in the editor, as the document of key. If it's the document shown already, the text is just set.
+        Otherwise the document shown is cached under its own key (unless keep is False, i.e. in large file mode),
+        and the one of key is taken from the cache, or created. A cached document keeps its undo history: its text
+        is only set if it differs (i.e. the knob was changed from elsewhere), which is told by the signature of the
+        text it had when cached, without reading the document back. Returns whether it was cached.
+        """
+        if key is not None and key == self.key:
+            self.setText(key, text)
+            return False
+        state = self._entries.pop(key, None) if key is not None else None
+        if state is None:
+            self.misses += 1
+        else:
+            state, size = state
+            self.size -= size
+            self.hits += 1
+        old_state = self.editor.swapDocument(state)
+        if self.key is not None and keep:
+            self.put(self.key, old_state)
+        else:
+            self._synced.pop(self.key, None)
+            old_state.release()
+        self.key = key
+        if state is None:
+            if text:
+                self.setText(key, text)
+            else:
+                self.synced(key, self.editor.document(), text)
+        elif self._synced.get(key) != text_signature(text):
+            self.setText(key, text)
+        return state is not None
+
+    def setText(self, key, text):
+        self.editor.setPlainText(text)
+        self.synced(key, self.editor.document(), text)
+
+    def synced(self, key, document, text):
+        """ Records the text of the document of key, from which its modified flag tells whether it was edited. """
+        document.setModified(False)
+        if key is not None:
+            self._synced[key] = text_signature(text)
+
+    def put(self, key, state):
+        """
+        Caches the document state for the key. To stay under max_bytes, the least recently used documents lose their
+        undo history, and then are evicted.
+        """
+        self.discard(key)
+        if state.document.isModified():
+            # Only documents edited while shown are read back
+            self.synced(key, state.document, state.document.toPlainText())
+        size = document_size(state.document)
+        if size > self.max_bytes:
+            state.document.clearUndoRedoStacks()
+            size = document_size(state.document)
+            if size > self.max_bytes:
+                state.release()
+                return
+        self._entries[key] = (state, size)
+        self.size += size
+        for old_key in list(self._entries):
+            if self.size <= self.max_bytes:
+                return
+            old_state, old_size = self._entries[old_key]
+            old_state.document.clearUndoRedoStacks()
+            new_size = document_size(old_state.document)
+            self._entries[old_key] = (old_state, new_size)
+            self.size += new_size - old_size
+        while self.size > self.max_bytes:
+            old_key, (old_state, old_size) = self._entries.popitem(last=False)
+            self._synced.pop(old_key, None)
+            old_state.release()
+            self.size -= old_size
+            self.evictions += 1
+
+    def discard(self, key):
+        """ Deletes the cached document of key (i.e. its script was deleted). The one shown is just not kept. """
+        if key == self.key:
+            self.key = None
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[0].release()
+            self.size -= entry[1]
+            self._synced.pop(key, None)
+
+    def clear(self):
+        for state, _ in self._entries.values():
+            state.release()
+        self._entries.clear()
+        self._synced.clear()
+        self.size = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
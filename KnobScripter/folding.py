@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+""" Indentation-based code folding for the KnobScripter script editors.
+
+A line is a fold header when the next non-blank line is more indented, and its fold spans all the following lines
+that are more indented than it (or blank, except the trailing blank lines). Lines that start inside a region left open
+by the previous one (i.e. a multi-line string, by the block states of the highlighter) are part of the fold whatever
+their indentation, and never start one. The KSFoldTree keeps the indentation
+of every block, measured lazily: an edit (contentsChange) only forgets the levels of the blocks it changed, so the
+tree costs the same per keystroke in any document. Folded lines are hidden through QTextBlock visibility (with a
+line count of 0), so the layout skips them and they're never painted. Folded headers are marked with a QTextCursor
+at their start, which the document moves along with the edits, so folds inside a folded one are remembered too.
+
+adrianpueyo.com
+
+"""
+
+import nuke
+
+try:
+    if nuke.NUKE_VERSION_MAJOR < 11:
+        from PySide import QtCore, QtGui, QtGui as QtWidgets
+        from PySide.QtCore import Qt
+    else:
+        from PySide2 import QtWidgets, QtGui, QtCore
+        from PySide2.QtCore import Qt
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+from KnobScripter import lineops
+
+BLANK = -1
+
+
+def indentation_level(text, tab_spaces=4):
+    """ Returns the width of the indentation of a line, or BLANK if the line is blank. """
+    stripped = text.lstrip()
+    if not stripped:
+        return BLANK
+    return len(text[:len(text) - len(stripped)].expandtabs(tab_spaces))
+
+
+class KSFoldTree(object):
+    """
+    Folds of a QTextDocument, by indentation. levels has the indentation of each block, or None for the blocks that
+    haven't been measured since they last changed. Headers and fold ranges are found from the levels when needed
+    (i.e. for the visible blocks when painting the gutter), so nothing is computed for the rest of the document.
+    """
+
+    def __init__(self, document, tab_spaces=4):
+        self.document = document
+        self.tab_spaces = tab_spaces
+        self.levels = []
+        self.folded = []  # QTextCursors at the start of the folded headers
+        self.has_folds = False  # Whether anything was folded since the last unfoldAll
+        self.checkLevels()
+
+    def setDocument(self, document, folded=None):
+        """ Switches to another document, with the markers of its folded headers (see KSDocumentState.folds). """
+        self.document = document
+        self.levels = []
+        self.folded = folded or []
+        self.has_folds = True  # Unknown: it might have been folded before
+        self.checkLevels()
+
+    def checkLevels(self):
+        """ Forgets all the levels if they don't match the blocks anymore (i.e. an edit wasn't notified). """
+        count = self.document.blockCount()
+        if len(self.levels) != count:
+            self.levels = [None] * count
+
+    def update(self, position, removed, added):
+        """ contentsChange slot: forgets the levels of the blocks changed, and keeps the rest. """
+        changed = lineops.changed_blocks(self.document, position, added, len(self.levels))
+        if changed is None:
+            self.levels = [None] * self.document.blockCount()
+            return
+        first, last, old_last = changed
+        self.levels[first:old_last + 1] = [None] * (last - first + 1)
+        self.checkLevels()
+
+    def level(self, block, number=None):
+        """ Returns the indentation level of the block (its number can be given, if known). """
+        if number is None:
+            number = block.blockNumber()
+        level = self.levels[number]
+        if level is None:
+            level = indentation_level(block.text(), self.tab_spaces)
+            self.levels[number] = level
+        return level
+
+    @staticmethod
+    def inRegion(block):
+        """ Whether the block starts inside a region (i.e. a string) left open by the previous block. """
+        previous = block.previous()
+        return previous.isValid() and previous.userState() > 0
+
+    def isHeader(self, block):
+        """ Whether the block starts a fold (the next non-blank block is more indented, or inside a region). """
+        self.checkLevels()
+        number = block.blockNumber()
+        level = self.level(block, number)
+        if level == BLANK or self.inRegion(block):
+            return False
+        open_region = block.userState() > 0
+        block = block.next()
+        while block.isValid():
+            number += 1
+            if open_region:
+                return True
+            next_level = self.level(block, number)
+            if next_level != BLANK:
+                return next_level > level
+            open_region = block.userState() > 0
+            block = block.next()
+        return False
+
+    def foldEnd(self, block):
+        """ Returns the number of the last block of the fold the block starts, or -1 if it's not a fold header. """
+        self.checkLevels()
+        number = block.blockNumber()
+        level = self.level(block, number)
+        last = -1
+        if level == BLANK or self.inRegion(block):
+            return last
+        open_region = block.userState() > 0
+        block = block.next()
+        while block.isValid():
+            number += 1
+            if open_region:  # Inside a multi-line string: its indentation doesn't end the fold
+                last = number
+            else:
+                next_level = self.level(block, number)
+                if next_level != BLANK:
+                    if next_level <= level:
+                        break
+                    last = number
+            open_region = block.userState() > 0
+            block = block.next()
+        return last
+
+    @staticmethod
+    def visibleBlock(block, forward=True):
+        """ Returns the first visible block from the block on, forwards or backwards (an invalid one if none). """
+        while block.isValid() and not block.isVisible():
+            block = block.next() if forward else block.previous()
+        return block
+
+    @staticmethod
+    def hidesNext(block):
+        """ Whether the block is visible, and the next block isn't (i.e. it's a folded header). """
+        next_block = block.next()
+        return block.isVisible() and next_block.isValid() and not next_block.isVisible()
+
+    def marker(self, block):
+        """ Returns the index of the marker of the block in folded, or -1 if it isn't marked as folded. """
+        number = block.blockNumber()
+        for index, cursor in enumerate(self.folded):
+            if cursor.blockNumber() == number:
+                return index
+        return -1
+
+    @staticmethod
+    def nextHidden(block):
+        next_block = block.next()
+        return next_block.isValid() and not next_block.isVisible()
+
+    def isFolded(self, block):
+        """ Whether the block is a folded header, visible or inside another fold: it's marked, and hides the next. """
+        return bool(self.folded) and self.nextHidden(block) and self.marker(block) >= 0
+
+    def hideFold(self, block):
+        """ Hides the blocks of the fold the block starts, without marking it. Returns whether it was a fold header. """
+        last = self.foldEnd(block)
+        if last < 0:
+            return False
+        self.setBlocksVisible(block.next(), last, False)
+        self.has_folds = True
+        return True
+
+    def fold(self, block):
+        """ Folds the fold the block starts. Returns whether it was a fold header. """
+        if not self.hideFold(block):
+            return False
+        if self.marker(block) < 0:
+            self.folded.append(QtGui.QTextCursor(block))
+        return True
+
+    def hiddenEnd(self, block):
+        """ Returns the number of the last of the hidden blocks that follow the block (its own if none do). """
+        last = block.blockNumber()
+        hidden = block.next()
+        while hidden.isValid() and not hidden.isVisible():
+            last += 1
+            hidden = hidden.next()
+        return last
+
+    def unfold(self, block):
+        """ Shows the hidden blocks after the block. The folds inside it that were folded stay folded. """
+        index = self.marker(block)
+        if index >= 0:
+            del self.folded[index]
+        first = block.blockNumber()
+        last = self.hiddenEnd(block)
+        if last == first:
+            return
+        self.setBlocksVisible(block.next(), last, True)
+        inner = sorted(cursor.blockNumber() for cursor in self.folded)
+        shown_from = first + 1  # Inner folds inside an inner fold folded again are hidden already
+        for number in inner:
+            if shown_from <= number <= last:
+                header = self.document.findBlockByNumber(number)
+                end = self.foldEnd(header)
+                if end > number:
+                    self.setBlocksVisible(header.next(), end, False)
+                    shown_from = end + 1
+
+    def toggle(self, block):
+        """ Folds or unfolds the fold the block starts. Returns whether anything changed. """
+        if self.hidesNext(block):
+            self.unfold(block)
+            return True
+        return self.fold(block)
+
+    def reveal(self, block):
+        """ Unfolds the folds that hide the block, if it's hidden. """
+        while not block.isVisible():
+            header = block
+            while header.isValid() and not header.isVisible():
+                header = header.previous()
+            if not header.isValid():
+                return
+            self.unfold(header)
+
+    def unfoldAll(self):
+        if not self.has_folds:
+            return
+        self.folded = []
+        block = self.document.firstBlock()
+        while block.isValid():
+            if self.hidesNext(block):
+                self.unfold(block)
+            block = block.next()
+        self.has_folds = False
+
+    def foldedLines(self):
+        """
+        Returns the numbers of the folded headers, also the ones inside other folds (i.e. to store them in the script
+        state). Markers left on blocks that don't hide the next one anymore are dropped.
+        """
+        self.folded = [cursor for cursor in self.folded if self.nextHidden(cursor.block())]
+        return sorted(set(cursor.blockNumber() for cursor in self.folded))
+
+    def setFoldedLines(self, lines):
+        """
+        Unfolds everything, and then folds the given headers (the ones that still are headers), innermost first, so
+        the folds inside another are folded before it hides them.
+        """
+        self.unfoldAll()
+        for number in sorted(set(int(number) for number in lines), reverse=True):
+            block = self.document.findBlockByNumber(number)
+            if block.isValid() and self.hideFold(block):
+                self.folded.append(QtGui.QTextCursor(block))
+
+    def setBlocksVisible(self, first_block, last, visible):
+        """
+        Shows or hides the blocks from first_block to the block number last, and relayouts the document without
+        marking its contents as changed (which would rehighlight them).
+        """
+        block = first_block
+        number = first_block.blockNumber()
+        while block.isValid() and number <= last:
+            block.setVisible(visible)
+            block.setLineCount(max(1, block.layout().lineCount()) if visible else 0)
+            block = block.next()
+            number += 1
+        layout = self.document.documentLayout()
+        layout.requestUpdate()
+        layout.documentSizeChanged.emit(layout.documentSize())
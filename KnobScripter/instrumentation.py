@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+""" Lightweight instrumentation for KnobScripter: named event counters, to tell how often things happen.
+
+Counting is just an increment, so it can stay in place in the editors (i.e. once per cursor update or per
+viewport relayout). rates() gives each counter per second since the last reset(), so a benchmark or a debugging
+session can check how many relayouts per second an interaction causes.
+
+adrianpueyo.com
+
+"""
+
+import time
+
+_counts = dict()
+_since = time.time()
+
+
+def count(name, amount=1):
+    """ Adds amount to the counter name. """
+    _counts[name] = _counts.get(name, 0) + amount
+
+
+def counts():
+    """ Returns a copy of the counters, as a dict of name -> count. """
+    return dict(_counts)
+
+
+def reset():
+    """ Clears the counters and starts measuring rates from now. """
+    global _since
+    _counts.clear()
+    _since = time.time()
+
+
+def elapsed():
+    """ Seconds since the last reset. """
+    return time.time() - _since
+
+
+def rates():
+    """ Returns the counters per second since the last reset, as a dict of name -> rate. """
+    seconds = max(elapsed(), 1e-6)
+    return dict((name, value / seconds) for name, value in _counts.items())
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+""" Cached introspection of python modules and objects, for the script editor's completion.
+
+Completing "nuke.a" has to dir() the nuke module, which used to happen on every keystroke, along with building
+and sorting the names of every module loaded. The KSIntrospectionCache keeps the dir() of the objects completed
+in LRU order, keyed by their identity and checked against a cheap version (the size of their __dict__), and the
+sorted names of the modules loaded until sys.modules changes, which also clears the rest of the cache.
+dir() can't be interrupted safely within Nuke's main thread, so objects whose dir() took longer than the time
+budget (se_introspection_budget_ms) keep their cached names from then on, instead of being listed again.
+
+adrianpueyo.com
+
+"""
+
+import sys
+import time
+from collections import OrderedDict
+
+from KnobScripter import config, instrumentation
+
+_cache = None  # Shared by all the script editors, as sys.modules is
+
+
+def cache():
+    """ Returns the KSIntrospectionCache shared by all the script editors, sized after the se_introspection prefs. """
+    global _cache
+    if _cache is None:
+        _cache = KSIntrospectionCache(config.prefs["se_introspection_cache_entries"],
+                                      config.prefs["se_introspection_budget_ms"] / 1000.0)
+    return _cache
+
+
+def version(obj):
+    """ Returns the number of attributes in the __dict__ of obj, or None if it has none. """
+    try:
+        return len(object.__getattribute__(obj, "__dict__"))  # Skipping any __getattr__ of obj
+    except Exception:
+        return None
+
+
+class KSIntrospectionCache(object):
+    """
+    LRU cache of dir() by object, up to max_entries, plus the names of the modules loaded. Objects are held by
+    their entry, so their id() can't be reused while cached. Hits and misses are also counted in instrumentation
+    (introspection_hits, introspection_misses and introspection_slow, for the dir() calls over budget).
+    """
+
+    def __init__(self, max_entries=512, budget=0.05):
+        self.max_entries = max_entries
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self._modules_count = -1  # len(sys.modules) the cache is valid for
+        self._names = dict()  # id(namespace) -> (namespace, len(namespace), sorted module and namespace names)
+        self._entries = OrderedDict()  # id(obj) -> (obj, version or None if slow, sorted names)
+
+    def checkModules(self):
+        """ Clears the cache if modules were imported or removed since it was filled. """
+        if len(sys.modules) != self._modules_count:
+            self._modules_count = len(sys.modules)
+            self._names.clear()
+            self._entries.clear()
+
+    def moduleNames(self, namespace):
+        """ Returns the sorted names of the modules loaded and the ones defined in namespace (i.e. globals()). """
+        self.checkModules()
+        entry = self._names.get(id(namespace))
+        if entry is None or entry[0] is not namespace or entry[1] != len(namespace):
+            entry = (namespace, len(namespace), sorted(set(sys.modules).union(namespace)))
+            self._names[id(namespace)] = entry
+        return entry[2]
+
+    def resolve(self, path, namespace):
+        """
+        Returns the object named by path: a module, a name in namespace, or an attribute of a module
+        (i.e. "os.path"). Returns None if not found.
+        """
+        if path in sys.modules:
+            return sys.modules[path]
+        if path in namespace:
+            return namespace[path]
+        parent, _, attribute = path.rpartition(".")
+        if parent in sys.modules:
+            try:
+                return getattr(sys.modules[parent], attribute, None)
+            except Exception:
+                return None  # Failing properties or __getattr__
+        return None
+
+    def attributes(self, obj):
+        """ Returns the sorted dir() of obj, or an empty list if it fails. """
+        self.checkModules()
+        key = id(obj)
+        entry = self._entries.pop(key, None)
+        obj_version = version(obj)
+        if entry is not None and entry[0] is obj and entry[1] in (None, obj_version):
+            self._entries[key] = entry  # Most recently used go last
+            self.hits += 1
+            instrumentation.count("introspection_hits")
+            return entry[2]
+        self.misses += 1
+        instrumentation.count("introspection_misses")
+        start = time.time()
+        try:
+            names = sorted(dir(obj))
+        except Exception:
+            names = []
+        if time.time() - start > self.budget:
+            obj_version = None  # Never listed again while cached
+            instrumentation.count("introspection_slow")
+        self._entries[key] = (obj, obj_version, names)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return names
+
+    def hitRate(self):
+        """ Returns the fraction of attributes() calls answered from the cache. """
+        return self.hits / float(max(self.hits + self.misses, 1))
+
+    def clear(self):
+        self._modules_count = -1
+        self._names.clear()
+        self._entries.clear()
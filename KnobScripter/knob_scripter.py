@@ -57,7 +57,7 @@ christmas = (now.month == 12 and now.day > 15) or (now.month == 1 and now.day <
 # ks imports
 from KnobScripter.info import __version__, __date__
 from KnobScripter import config, prefs, utils, dialogs, widgets, ksscripteditormain
-from KnobScripter import snippets, codegallery, script_output, findreplace, content
+from KnobScripter import snippets, codegallery, script_output, findreplace, content, largefile, outline, doccache
 
 # logging.basicConfig(level=logging.DEBUG)
 
@@ -147,6 +147,9 @@ class KnobScripterWidget(QtWidgets.QDialog):
         self.current_script_modified = False
         self.script_index = 0
         self.toAutosave = False
+        self.large_file_mode = False  # Degraded features, for big scripts (see largefile.py)
+        self.loaded_file = None  # largefile.file_signature of the script file last loaded
+        self.large_file_loader = None
         self.runInContext = config.prefs["ks_run_in_context"]  # Experimental, python only
         self.code_language = None
         self.current_knob_modified = False  # Convenience variable holding if the current script_editor is modified
@@ -318,6 +321,15 @@ class KnobScripterWidget(QtWidgets.QDialog):
         if self.frw_open:
             self.find_button.toggle()
 
+        # Outline button
+        self.outline_button = widgets.APToolButton("grid")
+        self.outline_button.setToolTip(
+            "Show the outline of the code: classes, functions and top-level variables.\nShortcut: Ctrl+Shift+O")
+        self.outline_button.setShortcut('Ctrl+Shift+O')
+        self.outline_button.setCheckable(True)
+        self.outline_button.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.outline_button.clicked[bool].connect(self.toggleOutline)
+
         # Gallery
         self.codegallery_button = widgets.APToolButton("enter")
         self.codegallery_button.setToolTip("Open the code gallery panel.")
@@ -345,6 +357,7 @@ class KnobScripterWidget(QtWidgets.QDialog):
         self.top_right_bar_layout.addWidget(self.backup_button)
         self.top_right_bar_layout.addWidget(self.codegallery_button)
         self.top_right_bar_layout.addWidget(self.find_button)
+        self.top_right_bar_layout.addWidget(self.outline_button)
         # self.top_right_bar_layout.addWidget(self.snippets_button)
         # self.top_right_bar_layout.addSpacing(10)
         self.top_right_bar_layout.addWidget(self.prefs_button)
@@ -390,11 +403,25 @@ class KnobScripterWidget(QtWidgets.QDialog):
             self.script_editor.setTabStopWidth(
                 config.prefs["se_tab_spaces"] * QtGui.QFontMetrics(config.script_editor_font).horizontalAdvance(' '))
 
+        # Documents of the knobs or scripts shown before, to switch back to them instantly (see doccache.py)
+        self.document_cache = doccache.KSDocumentCache(self.script_editor,
+                                                       config.prefs["ks_document_cache_kb"] * 1024)
+
         # Add input and output to splitter
         self.splitter.addWidget(self.script_output)
         self.splitter.addWidget(self.script_editor)
         self.splitter.setStretchFactor(0, 0)
 
+        # Outline panel, at the left of the input and output
+        self.outline_panel = outline.KSOutlinePanel(self.script_editor, self)
+        self.outline_panel.setVisible(False)
+        self.outline_splitter = QtWidgets.QSplitter(Qt.Horizontal)
+        self.outline_splitter.addWidget(self.outline_panel)
+        self.outline_splitter.addWidget(self.splitter)
+        self.outline_splitter.setStretchFactor(0, 0)
+        self.outline_splitter.setStretchFactor(1, 1)
+        self.outline_splitter.setSizes([180, 600])
+
         # FindReplace widget
         self.frw = findreplace.FindReplaceWidget(self.script_editor, self)
         self.frw.setVisible(self.frw_open)
@@ -404,7 +431,9 @@ class KnobScripterWidget(QtWidgets.QDialog):
         self.scripting_layout = QtWidgets.QVBoxLayout()
         self.scripting_layout.setContentsMargins(0, 0, 0, 0)
         self.scripting_layout.setSpacing(0)
-        self.scripting_layout.addWidget(self.splitter)
+        self.large_file_banner = largefile.KSLargeFileBanner(self)
+        self.scripting_layout.addWidget(self.large_file_banner)
+        self.scripting_layout.addWidget(self.outline_splitter)
         self.scripting_layout.addWidget(self.frw)
 
         # ---------------
@@ -600,6 +629,17 @@ class KnobScripterWidget(QtWidgets.QDialog):
                 counter += 1
         return
 
+    def showDocument(self, key, text):
+        """
+        Shows text in the script editor as the document of key, a knob ("knob", node full name, knob name) or a script
+        ("script", folder, script name). Documents shown before are cached, so switching back to a knob or script keeps
+        its highlighting and undo history. Returns whether the document was cached.
+        """
+        cached = self.document_cache.show(key, text, keep=not self.large_file_mode)
+        if self.outline_panel.index.document is not self.script_editor.document():
+            self.outline_panel.index.setDocument(self.script_editor.document())
+        return cached
+
     def loadKnobValue(self, check=True, update_dict=False):
         """ Get the content of the knob value and populate the editor """
         if not self.to_load_knob:
@@ -655,21 +695,22 @@ class KnobScripterWidget(QtWidgets.QDialog):
         # If order comes from a dropdown update, update value from dictionary if possible, otherwise update normally
         self.setWindowTitle("KnobScripter - %s %s" % (self.node.name(), self.knob))
         self.script_editor.blockSignals(True)
+        knob_key = ("knob", self.node.fullName(), self.knob)
         if update_dict:
             if self.knob in self.unsaved_knobs:
                 if self.unsaved_knobs[self.knob] == obtained_knob_value: #first is str, second is bytes
-                    self.script_editor.setPlainText(obtained_knob_value)
+                    self.showDocument(knob_key, obtained_knob_value)
                     self.setKnobModified(False)
                 else:
                     obtained_knob_value = self.unsaved_knobs[self.knob]
-                    self.script_editor.setPlainText(obtained_knob_value)
+                    self.showDocument(knob_key, obtained_knob_value)
                     self.setKnobModified(True)
             else:
-                self.script_editor.setPlainText(obtained_knob_value)
+                self.showDocument(knob_key, obtained_knob_value)
                 self.setKnobModified(False)
 
         else:
-            self.script_editor.setPlainText(obtained_knob_value)
+            self.showDocument(knob_key, obtained_knob_value)
 
         self.setCodeLanguage(knob_language)
         self.script_editor.blockSignals(False)
@@ -905,6 +946,8 @@ class KnobScripterWidget(QtWidgets.QDialog):
         self.clear_console_button.setVisible(code_language != "blink")
         self.save_recompile_button.setVisible(code_language == "blink")
         self.backup_button.setVisible(code_language == "blink")
+        self.outline_button.setVisible(code_language != "blink")
+        self.outline_panel.setOutlineEnabled(new_code_language == "python" and not self.large_file_mode)
 
     def loadKnobState(self):
         """
@@ -945,6 +988,10 @@ class KnobScripterWidget(QtWidgets.QDialog):
         # current_node_state_dict: {"cursor_pos":{},"scroll_pos":{},"open_knob"=None}
         node_state_dict = self.current_node_state_dict
 
+        if "folds" in node_state_dict:
+            if self.knob in node_state_dict["folds"]:
+                self.script_editor.fold_tree.setFoldedLines(node_state_dict["folds"][self.knob])
+
         if "cursor_pos" in node_state_dict:
             if self.knob in node_state_dict["cursor_pos"]:
                 cursor = self.script_editor.textCursor()
@@ -976,7 +1023,12 @@ class KnobScripterWidget(QtWidgets.QDialog):
         self.current_node_state_dict["cursor_pos"][self.knob] = [self.script_editor.textCursor().position(),
                                                                  self.script_editor.textCursor().anchor()]
 
-        # 1.3. Save current open knob in own dict
+        # 1.3. Save folded lines in own dict
+        if "folds" not in self.current_node_state_dict:
+            self.current_node_state_dict["folds"] = {}
+        self.current_node_state_dict["folds"][self.knob] = self.script_editor.fold_tree.foldedLines()
+
+        # 1.4. Save current open knob in own dict
         self.current_node_state_dict["open_knob"] = self.knob
 
         logging.debug("Current knob state dict for this knob...:")
@@ -1320,29 +1372,34 @@ class KnobScripterWidget(QtWidgets.QDialog):
             folder = self.current_folder
         script_path = os.path.join(config.py_scripts_dir, folder, self.current_script)
         script_path_temp = script_path + ".autosave"
+        script_key = ("script", folder, self.current_script)
         if (self.current_folder + "/" + self.current_script) in self.py_scroll_positions:
             obtained_scroll_value = self.py_scroll_positions[self.current_folder + "/" + self.current_script]
         # if (self.current_folder + "/" + self.current_script) in self.cursorPos:
         #     obtained_cursor_pos_value = self.cursorPos[self.current_folder + "/" + self.current_script]
 
+        self.stopLargeFileLoad()
+
         # 1: If autosave exists and pyOnly is false, load it
         if os.path.isfile(script_path_temp) and not py_only:
             logging.debug("Loading .py.autosave file\n---")
-            with io.open(script_path_temp, 'r', encoding="utf-8") as script:
-                script_content = script.read()
-            self.script_editor.setPlainText(script_content)
-            self.setScriptModified(True)
-            self.script_editor.verticalScrollBar().setValue(obtained_scroll_value)
+            self.loadScriptFile(script_path_temp, obtained_scroll_value, modified=True, key=script_key)
 
         # 2: Try to load the .py as first priority, if it exists
         elif os.path.isfile(script_path):
             logging.debug("Loading .py file\n---")
-            with io.open(script_path, 'r', encoding="utf-8") as script: # Takes to Text??? (py2: unicode, py3: str)
-                script_content = script.read() # Unicode str if needed
-
-            current_text = self.script_editor.toPlainText() # str type: Text (py2: unicode, py3: str)
-
-            if check and current_text != script_content and current_text.strip() != "":
+            differs = False
+            if check and largefile.is_large_file(script_path):
+                # Not read and diffed on the GUI thread: it differs if either side changed since it was loaded
+                differs = not self.script_editor.document().isEmpty() and (
+                    self.current_script_modified or largefile.file_signature(script_path) != self.loaded_file)
+            elif check:
+                with io.open(script_path, 'r', encoding="utf-8") as script: # Takes to Text??? (py2: unicode, py3: str)
+                    script_content = script.read() # Unicode str if needed
+                current_text = self.script_editor.toPlainText() # str type: Text (py2: unicode, py3: str)
+                differs = current_text != script_content and current_text.strip() != ""
+
+            if differs:
                 msg_box = QtWidgets.QMessageBox()
                 msg_box.setText("The script has been modified.")
                 msg_box.setInformativeText("Do you want to overwrite the current code on this editor?")
@@ -1358,9 +1415,7 @@ class KnobScripterWidget(QtWidgets.QDialog):
                 os.remove(script_path_temp)
                 logging.debug("Removed " + script_path_temp)
             self.setScriptModified(False)
-            self.script_editor.setPlainText(script_content)
-            self.script_editor.verticalScrollBar().setValue(obtained_scroll_value)
-            self.setScriptModified(False)
+            self.loadScriptFile(script_path, obtained_scroll_value, modified=False, key=script_key)
 
         # 3: If .py doesn't exist... only then stick to the autosave
         elif os.path.isfile(script_path_temp):
@@ -1389,7 +1444,8 @@ class KnobScripterWidget(QtWidgets.QDialog):
 
         else:
             script_content = ""
-            self.script_editor.setPlainText(script_content)
+            self.showDocument(script_key, script_content)
+            self.setLargeFileMode(False)
             self.setScriptModified(False)
             if self.current_folder + "/" + self.current_script in self.py_scroll_positions:
                 del self.py_scroll_positions[self.current_folder + "/" + self.current_script]
@@ -1399,8 +1455,63 @@ class KnobScripterWidget(QtWidgets.QDialog):
         self.setWindowTitle("KnobScripter - %s/%s" % (self.current_folder, self.current_script))
         return
 
+    def loadScriptFile(self, path, scroll_value=0, modified=False, key=None):
+        """
+        Loads the file at path into the editor, as the document of key (see showDocument), and sets the script as
+        modified or not. Large files (ks_large_file_mb) are loaded in chunks, in large file mode.
+        """
+        self.loaded_file = largefile.file_signature(path)
+        if not largefile.is_large_file(path):
+            with io.open(path, 'r', encoding="utf-8") as script:
+                script_content = script.read()
+            self.showDocument(key, script_content)
+            self.setLargeFileMode(False)
+            self.setScriptModified(modified)
+            self.script_editor.verticalScrollBar().setValue(scroll_value)
+            return
+
+        logging.debug("Loading " + path + " in large file mode")
+        self.showDocument(key, "")
+        self.setLargeFileMode(True)
+        self.large_file_banner.showFile(path)
+        loader = largefile.KSChunkedLoader(self.script_editor, path, parent=self)
+        loader.progress.connect(self.large_file_banner.setProgress)
+        loader.finished.connect(lambda: self.largeFileLoaded(modified, scroll_value))
+        self.large_file_loader = loader
+        loader.start()
+
+    def largeFileLoaded(self, modified, scroll_value):
+        self.large_file_loader = None
+        self.setScriptModified(modified)
+        self.toAutosave = False
+        self.script_editor.verticalScrollBar().setValue(scroll_value)
+
+    def isLoadingScript(self):
+        """ Whether a large script is still being loaded into the editor. """
+        return self.large_file_loader is not None
+
+    def stopLargeFileLoad(self):
+        if self.large_file_loader is not None:
+            self.large_file_loader.stop()
+            self.large_file_loader = None
+
+    def setLargeFileMode(self, large_file=True):
+        """ Turns large file mode on or off: syntax highlighting, completion and autosave diffing. """
+        if not large_file:
+            self.stopLargeFileLoad()
+            self.large_file_banner.setVisible(False)
+        if large_file == self.large_file_mode:
+            return
+        self.large_file_mode = large_file
+        self.script_editor.set_code_language(None if large_file else self.code_language)
+        self.script_editor.completion_enabled = not large_file
+        self.outline_panel.setOutlineEnabled(self.code_language == "python" and not large_file)
+
     def saveScriptContents(self, temp=True):
         """ Save the current contents of the editor into the python file. If temp == True, saves a .py.autosave file """
+        if self.isLoadingScript():
+            logging.debug("Not saving: the script is still loading.")
+            return
         logging.debug("\n# About to save script contents now.")
         logging.debug("Temp mode is: " + str(temp))
         logging.debug("self.current_folder: " + self.current_folder)
@@ -1410,7 +1521,12 @@ class KnobScripterWidget(QtWidgets.QDialog):
         orig_content = ""
         script_content = self.script_editor.toPlainText() # str type: Text (py2: unicode, py3: str)
 
-        if temp:
+        if temp and self.large_file_mode:
+            # No diffing against the .py: the autosave is only written if the script was edited
+            if self.current_script_modified:
+                with io.open(script_path_temp, 'w', encoding="utf-8") as script:
+                    script.write(script_content)
+        elif temp:
             if os.path.isfile(script_path):
                 with io.open(script_path, 'r', encoding="utf-8") as script:
                     orig_content = script.read()
@@ -1465,6 +1581,7 @@ class KnobScripterWidget(QtWidgets.QDialog):
             os.remove(script_path)
             logging.debug("Removed " + script_path)
 
+        self.document_cache.discard(("script", folder, self.current_script))
         return True
 
     def folderDropdownChanged(self):
@@ -1578,7 +1695,9 @@ class KnobScripterWidget(QtWidgets.QDialog):
                     # Success creating the script
                     self.saveScriptContents(temp=True)
                     if self.current_script != "Untitled.py":
-                        self.script_editor.setPlainText("")
+                        self.showDocument(("script", self.current_folder, script_name), "")
+                    else:
+                        self.document_cache.key = ("script", self.current_folder, script_name)  # Untitled becomes it
                     self.updateScriptsDropdown()
                     self.current_script = script_name
                     self.setCurrentScript(script_name)
@@ -1618,6 +1737,7 @@ class KnobScripterWidget(QtWidgets.QDialog):
                         self.saveScriptContents(temp=True)
                         self.updateScriptsDropdown()
                         # self.script_editor.setPlainText("")
+                        self.document_cache.key = ("script", self.current_folder, script_name)  # Shown as the copy
                         self.current_script = script_name
                         self.setCurrentScript(script_name)
                         self.script_editor.setFocus()
@@ -1727,8 +1847,17 @@ class KnobScripterWidget(QtWidgets.QDialog):
         """
         script_fullname = self.current_folder + "/" + self.current_script
 
+        if self.isLoadingScript():
+            self.large_file_loader.finished.connect(self.setScriptState)  # Positions only make sense once loaded
+            return
+
         logging.debug("Setting script state")
 
+        if "folds" in self.py_state_dict:
+            folds_dict = self.py_state_dict["folds"]
+            if script_fullname in folds_dict:
+                self.script_editor.fold_tree.setFoldedLines(folds_dict[script_fullname])
+
         if "cursor_pos" in self.py_state_dict:
             cp_dict = self.py_state_dict["cursor_pos"]
             if script_fullname in cp_dict:
@@ -1749,6 +1878,8 @@ class KnobScripterWidget(QtWidgets.QDialog):
         """ Stores the current state of the script into the self.py_state_dict. Then, also stores the full dict
         into the location specified in preferences (None, memory or disk).
         """
+        if self.isLoadingScript():
+            return
         logging.debug("Saving script state")
 
         script_fullname = self.current_folder + "/" + self.current_script
@@ -1766,7 +1897,12 @@ class KnobScripterWidget(QtWidgets.QDialog):
         cursor_pos = [self.script_editor.textCursor().position(), self.script_editor.textCursor().anchor()]
         self.py_state_dict["cursor_pos"][script_fullname] = cursor_pos
 
-        # 1.3. Last folder, script and splitter sizes
+        # 1.3. Save folded lines into own dict
+        if "folds" not in self.py_state_dict:
+            self.py_state_dict["folds"] = {}
+        self.py_state_dict["folds"][script_fullname] = self.script_editor.fold_tree.foldedLines()
+
+        # 1.4. Last folder, script and splitter sizes
         self.py_state_dict['last_folder'] = self.current_folder
         self.py_state_dict['last_script'] = self.current_script
         self.py_state_dict['splitter_sizes'] = self.splitter.sizes()
@@ -1800,6 +1936,8 @@ class KnobScripterWidget(QtWidgets.QDialog):
 
     # Global stuff
     def setTextSelection(self):
+        if self.script_editor.highlighter is None:  # i.e. large file mode
+            return
         self.script_editor.highlighter.selected_text = self.script_editor.textCursor().selection().toPlainText() # string()
         return
 
@@ -1887,7 +2025,8 @@ class KnobScripterWidget(QtWidgets.QDialog):
             self.knob = "knobChanged"
 
 
-        self.script_editor.setPlainText("")
+        self.showDocument(None, "")
+        self.setLargeFileMode(False)
         self.unsaved_knobs = {}
         # self.knob_scroll_positions = {}
         self.setWindowTitle("KnobScripter - %s %s" % (self.node.fullName(), self.knob))
@@ -1934,6 +2073,14 @@ class KnobScripterWidget(QtWidgets.QDialog):
             self.script_editor.setFocus()
         return
 
+    def toggleOutline(self, outline_pressed):
+        self.outline_panel.setVisible(outline_pressed)
+        if outline_pressed:
+            self.outline_panel.refresh()
+            self.outline_panel.filter_line_edit.setFocus()
+        else:
+            self.script_editor.setFocus()
+
     def open_multipanel(self, tab="code_gallery", lang=None):
         """ Open the floating multipanel (although it can also be opened as pane) """
         if self.isPane:
@@ -2013,6 +2160,7 @@ class KnobScripterWidget(QtWidgets.QDialog):
             self.saveScriptState()
             self.autosave()
 
+        self.document_cache.clear()
         if self in config.all_knobscripters:
             config.all_knobscripters.remove(self)
         close_event.accept()
@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+""" Base syntax highlighter class for KnobScripter.
+
+The KSHighlighter is a QSyntaxHighlighter with lazy highlighting for big documents: the visible blocks are
+highlighted first, and the rest of the document is completed in small time slices whenever the UI is idle.
+Both the python and blink highlighters are built on it, and share their compiled styles across instances.
+
+adrianpueyo.com
+
+"""
+
+import time
+import nuke
+
+try:
+    if nuke.NUKE_VERSION_MAJOR < 11:
+        from PySide import QtCore, QtGui, QtGui as QtWidgets
+        from PySide.QtCore import Qt
+    else:
+        from PySide2 import QtWidgets, QtGui, QtCore
+        from PySide2.QtCore import Qt
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+from KnobScripter import config, lexer
+
+PENDING_STATE = -2  # Block state of the blocks waiting to be highlighted
+
+FORMAT_PREFS = ("code_style_python", "code_style_blink", "se_font_family", "se_font_size")  # How the code looks
+LEXING_PREFS = ("se_long_line_chars", "se_highlight_cache_kb")  # How it's lexed, and the runs cached
+
+_style_tables = dict()  # Highlighter class -> its compiled styles, shared by all the instances
+_style_prefs = None  # Values of FORMAT_PREFS and LEXING_PREFS the style tables were built with
+_run_cache = None  # Lexed blocks shared by all the highlighters
+_run_cache_prefs = None  # Values of LEXING_PREFS the run cache was built with
+
+
+def pref_values(names):
+    return tuple(config.prefs.get(name) for name in names)
+
+
+def invalidate_styles(runs=True):
+    """
+    Discards the compiled style tables, and the cached runs unless runs is False, so they get built again on the
+    next use.
+    """
+    global _run_cache
+    _style_tables.clear()
+    if runs:
+        _run_cache = None
+
+
+def refresh_styles():
+    """
+    After prefs changes: discards the style tables only if a pref they depend on changed since they were built, and
+    the cached runs only if a lexing one did (restyling reuses them). Returns whether the tables were discarded.
+    """
+    if not _style_tables or _style_prefs == pref_values(FORMAT_PREFS + LEXING_PREFS):
+        return False
+    invalidate_styles(runs=_run_cache is not None and _run_cache_prefs != pref_values(LEXING_PREFS))
+    return True
+
+
+def is_long_line(text):
+    """
+    Whether a line is pathologically long (i.e. pasted JSON, base64 or minified code), longer than se_long_line_chars.
+    Long lines only get their start highlighted, and are left out of other per-line work.
+    """
+    return len(text) > config.prefs["se_long_line_chars"]
+
+
+def is_long_block(block):
+    """ is_long_line for a QTextBlock, without copying its text (its length counts the newline). """
+    return block.length() - 1 > config.prefs["se_long_line_chars"]
+
+
+def region_runs(block, kinds, text=None):
+    """
+    Returns the runs of the given kinds (i.e. strings and comments, see KSHighlighter.regionKinds) of a QTextBlock,
+    or None if the highlighter didn't lex the block as it is now (i.e. it's still pending lazy highlighting).
+    """
+    data = block.userData()
+    if text is None:
+        text = block.text()
+    if isinstance(data, KSBlockData) and data.text == text and block.userState() >= 0:
+        return [run for run in data.runs if run[2] in kinds]
+    return None
+
+
+def run_cache():
+    """ Returns the lexer.RunCache shared by all the highlighters, sized after the se_highlight_cache_kb pref. """
+    global _run_cache, _run_cache_prefs
+    if _run_cache is None:
+        _run_cache = lexer.RunCache(config.prefs["se_highlight_cache_kb"] * 1024)
+        _run_cache_prefs = pref_values(LEXING_PREFS)
+    return _run_cache
+
+
+class KSBlockData(QtGui.QTextBlockUserData):
+    """
+    The semantic runs of a block, along with the text and incoming state they were lexed from. Also holds the runs
+    of the optional semantic layer (semantic.py), which only apply while the block's text is still semantic_text.
+    """
+
+    def __init__(self, text, in_state, runs, state):
+        super(KSBlockData, self).__init__()
+        self.update(text, in_state, runs, state)
+        self.semantic = ()
+        self.semantic_text = None
+
+    def update(self, text, in_state, runs, state):
+        self.text = text
+        self.in_state = in_state
+        self.runs = runs
+        self.state = state
+
+
+class KSHighlighter(QtGui.QSyntaxHighlighter):
+    """
+    Base KnobScripter highlighter, with lazy (viewport-first) highlighting.
+
+    While lazy, highlightBlock only highlights the blocks in the requested range (the visible ones, set through
+    setVisibleRange) and the ones already completed, leaving the rest pending. An idle timer then highlights the
+    pending blocks in order, in chunks of lazy_chunk_blocks and time slices of lazy_time_slice seconds, until the whole document is done.
+
+    Subclasses implement lex(text, state), returning the (start, length, kind) runs of a block and the state it
+    leaves open. Lexing must not depend on the style: the kinds (i.e. "keyword") are mapped to the formats of the
+    current style when highlighting. Blocks are lexed through the shared run cache, and each block keeps its runs
+    (KSBlockData), so switching styles only has to apply the new formats.
+
+    blockRelexed is emitted with the number of each block whose runs changed (i.e. lexed for the first time, or
+    again because a string opened above it). Highlighting doesn't change the document's contents, so per-block
+    indexes that skip strings and comments (brackets.py, symbols.py) listen to it to forget what they found in it.
+    """
+
+    blockRelexed = QtCore.Signal(int)
+
+    lazy_time_slice = 0.008
+    lazy_chunk_blocks = 200
+
+    def __init__(self, document):
+        self.lazy = False
+        self._lazy_upto = 0  # Blocks before this one can be highlighted
+        self._lazy_next = 0  # Next block to check while completing
+        self._lazy_first = 0  # Requested (visible) range
+        self._lazy_last = -1
+        self._lazy_rehighlighting = False
+        self._lazy_found_pending = False
+        self._deferred_first = 0  # Range of blocks being edited (deferEdits)
+        self._deferred_last = -1
+
+        super(KSHighlighter, self).__init__(document)
+
+        self._lazy_timer = QtCore.QTimer(self)
+        self._lazy_timer.setInterval(0)
+        self._lazy_timer.timeout.connect(self.lazyStep)
+
+    def highlightBlock(self, text):
+        """
+        Apply syntax highlighting to the given block of text.
+        """
+        if self.deferBlock():
+            return
+
+        # The runs stored in the block are still valid if its text and incoming state didn't change (i.e. restyling)
+        in_state = max(0, self.previousBlockState())
+        long_line = is_long_line(text)
+        data = self.currentBlockUserData()
+        if isinstance(data, KSBlockData) and data.text == text and data.in_state == in_state:
+            runs, state = data.runs, data.state
+        else:
+            lex = self.lexLongBlock if long_line else self.lexBlock
+            runs, state = lex(text, in_state)
+            if isinstance(data, KSBlockData):
+                relexed = data.runs != runs
+                data.update(text, in_state, runs, state)
+            else:
+                relexed = True
+                data = KSBlockData(text, in_state, runs, state)
+                self.setCurrentBlockUserData(data)
+            if relexed:
+                self.blockRelexed.emit(self.currentBlock().blockNumber())
+
+        formats = self.styles[self._style]["formats"]
+        for start, length, kind in runs:
+            if kind in formats:
+                self.setFormat(start, length, formats[kind])
+        if data.semantic and data.semantic_text == text and not long_line:
+            for start, length, kind in data.semantic:
+                if kind in formats:
+                    self.setFormat(start, length, formats[kind])
+        self.setCurrentBlockState(state)
+
+    def lexBlock(self, text, state):
+        """ Returns (runs, state) for the text given the incoming state, from the run cache when possible. """
+        cache = run_cache()
+        key = (type(self), text, state)
+        result = cache.get(key)
+        if result is None:
+            runs, out_state = self.lex(text, state)
+            result = cache.put(key, runs, out_state, len(text))
+        return result
+
+    def lexLongBlock(self, text, state):
+        """
+        Lexing a long line could take seconds, so only its first se_long_line_chars characters are lexed (and cached),
+        and the incoming state is passed on as is.
+        """
+        runs, _ = self.lexBlock(text[:config.prefs["se_long_line_chars"]], state)
+        return runs, state
+
+    def lex(self, text, state):
+        """ Returns the (start, length, kind) runs of the text, and the state left open for the next block. """
+        raise NotImplementedError
+
+    def regionKinds(self):
+        """ Returns the kinds of the delimited regions (strings, comments...) of the current style's lexer. """
+        return frozenset(region.kind for region in self.styles[self._style]["lexer"].regions.values())
+
+    def sharedStyles(self):
+        """
+        Returns the compiled styles (loadStyles) of this highlighter class. They're built once per process and
+        shared by all the instances, so they must be treated as read-only.
+        """
+        global _style_prefs
+        highlighter_class = type(self)
+        if highlighter_class not in _style_tables:
+            if not _style_tables:
+                _style_prefs = pref_values(FORMAT_PREFS + LEXING_PREFS)
+            _style_tables[highlighter_class] = self.loadStyles()
+        return _style_tables[highlighter_class]
+
+    def reloadStyles(self):
+        """ Picks up the current compiled styles, i.e. after refresh_styles(). """
+        self.styles = self.sharedStyles()
+
+    @staticmethod
+    def isBigDocument(block_count):
+        """ Whether a document with the given number of blocks should be highlighted lazily. """
+        return block_count >= config.prefs["se_lazy_highlight_blocks"]
+
+    def startLazy(self):
+        """ Highlights the document lazily from now on, visible blocks first. """
+        self.lazy = True
+        self._lazy_upto = 0
+        self._lazy_next = 0
+        self._lazy_found_pending = False
+        self._lazy_timer.start()
+
+    def stopLazy(self):
+        self.lazy = False
+        self._lazy_timer.stop()
+
+    def deferBlock(self):
+        """
+        Called at the start of highlightBlock. If the current block has to wait for its turn,
+        marks it as pending and returns True. Otherwise returns False, and the block must be highlighted.
+        """
+        if not self.lazy:
+            return False
+        number = self.currentBlock().blockNumber()
+        if self._lazy_first <= number <= self._lazy_last:
+            return False
+        if not self._deferred_first <= number <= self._deferred_last:
+            if not self._lazy_rehighlighting and self.currentBlockState() >= 0:
+                return False  # Already highlighted: an edit or a change in the previous block's state
+            if number < self._lazy_upto:
+                return False
+        self.setCurrentBlockState(PENDING_STATE)
+        return True
+
+    def rehighlight(self):
+        """ Rehighlights the whole document. If it's a big one, lazily. """
+        document = self.document()
+        if document is None or not self.isBigDocument(document.blockCount()):
+            return super(KSHighlighter, self).rehighlight()
+        self.startLazy()
+        self._lazy_rehighlighting = True
+        try:
+            super(KSHighlighter, self).rehighlight()
+        finally:
+            self._lazy_rehighlighting = False
+
+    def deferEdits(self, first=0, last=-1):
+        """
+        While editing the blocks from first to last (i.e. indenting thousands of lines at once), leaves the edited ones
+        pending but for the visible ones, and completes them lazily afterwards. Call without a range to stop deferring.
+        """
+        if first <= last:
+            self.startLazy()
+        self._deferred_first = first
+        self._deferred_last = last
+
+    def setVisibleRange(self, first, last):
+        """ Requests the blocks from first to last (block numbers) to be highlighted right away. """
+        self._lazy_first = first
+        self._lazy_last = last
+        if not self.lazy or self.document() is None:
+            return
+        block = self.document().findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() <= last:
+            if block.userState() < 0:
+                self.rehighlightBlock(block)
+            block = block.next()
+
+    def lazyStep(self):
+        """ Highlights the next pending blocks, for lazy_time_slice seconds at most. """
+        document = self.document()
+        if not self.lazy or document is None:
+            self.stopLazy()
+            return
+
+        deadline = time.time() + self.lazy_time_slice
+        block = document.findBlockByNumber(self._lazy_next)
+        while block.isValid():
+            number = block.blockNumber()
+            if block.userState() < 0:
+                # Highlighting a pending block cascades through the next ones (as their state changes) up to upto
+                self._lazy_found_pending = True
+                self._lazy_upto = max(self._lazy_upto, number + self.lazy_chunk_blocks)
+                self.rehighlightBlock(block)
+            block = block.next()
+            self._lazy_next = number + 1
+            if time.time() > deadline:
+                return
+
+        # Edits can shift pending blocks above the completion point, so check again until a pass finds none
+        if self._lazy_found_pending:
+            self._lazy_next = 0
+            self._lazy_found_pending = False
+        else:
+            self.stopLazy()
+
+    @staticmethod
+    def clearBlockStates(document):
+        """ Resets the state of all the blocks of a document, i.e. before attaching a different highlighter. """
+        block = document.begin()
+        while block.isValid():
+            block.setUserState(-1)
+            block = block.next()
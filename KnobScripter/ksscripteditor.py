@@ -14,6 +14,7 @@ adrianpueyo.com
 import nuke
 import re
 import logging
+from collections import OrderedDict
 
 try:
     if nuke.NUKE_VERSION_MAJOR < 11:
@@ -25,7 +26,11 @@ try:
 except ImportError:
     from Qt import QtCore, QtGui, QtWidgets
 
-from KnobScripter import config, blinkhighlighter, pythonhighlighter
+from KnobScripter import config, blinkhighlighter, pythonhighlighter, semantic, lineops, instrumentation, folding
+from KnobScripter import brackets, doccache
+from KnobScripter.kshighlighter import KSHighlighter, is_long_block
+
+SCREEN_CHANGE_EVENT = getattr(QtCore.QEvent, "ScreenChangeInternal", None)  # Not in PySide (Qt4)
 
 
 class KSScriptEditor(QtWidgets.QPlainTextEdit):
@@ -36,6 +41,8 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
     Starting from his code, I changed the style and added extra functionality.
     """
 
+    frame_ms = 16  # Cursor-dependent updates are coalesced to at most one per frame
+
     def __init__(self, knob_scripter=""):
         super(KSScriptEditor, self).__init__()
 
@@ -44,6 +51,7 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
 
         self.highlighter = None
         self.code_language = None
+        self.semantic_layer = None  # Optional semantic highlighting of python code (se_semantic_highlighting)
 
         # Setup line numbers
         self.tab_spaces = config.prefs["se_tab_spaces"]
@@ -52,98 +60,302 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
         self.lineNumberAreaColor = None
         self.lineNumberColor = None
         self.currentLineNumberColor = None
-        self.setColorStyle()
-        self.setFont(config.script_editor_font)
+        self.occurrenceColor = None
+        self.longLineColor = None
+        self.bracketMatchColor = None
+        self.bracketUnmatchedColor = None
+
+        # Extra selections are kept in named layers (current line, occurrences...) and merged when applied
+        self.extra_selection_layers = OrderedDict([("current_line", []), ("occurrences", []), ("brackets", [])])
+        self.extra_selections_dirty = False
+
+        # Cursor-dependent updates (current line, gutter number, extra selections) happen once per frame,
+        # however many times the cursor moves in between (i.e. holding an arrow key, or a replace all)
+        self.cursor_line = -1
+        self.cursor_position = -1  # Position of the cursor on the last frame, to scroll to it only if it moved
+        self.in_cursor_frame = False  # Layers set during a frame are applied by it, not by another one
+        self.cursor_frame_timer = QtCore.QTimer(self)
+        self.cursor_frame_timer.setSingleShot(True)
+        self.cursor_frame_timer.setInterval(self.frame_ms)
+        self.cursor_frame_timer.timeout.connect(self.updateCursorFrame)
+
+        # Occurrences of the selected text, found (debounced) in the visible blocks only
+        self.occurrence_regex = None
+        self.occurrence_index = {}  # Block number -> positions in the block where the selected text appears
+        self.occurrences_timer = QtCore.QTimer(self)
+        self.occurrences_timer.setSingleShot(True)
+        self.occurrences_timer.setInterval(150)
+        self.occurrences_timer.timeout.connect(self.updateOccurrences)
+        self.selectionChanged.connect(self.selectionOccurrencesChanged)
+
+        # Indentation-based folding, from the markers in the gutter
+        self.fold_tree = folding.KSFoldTree(self.document(), self.tab_spaces or 4)
+
+        # Matching brackets, found from per-block bracket summaries
+        self.bracket_index = brackets.KSBracketIndex(self)
+
+        # Slots following the edits of the document (moved to the new one when documents are swapped)
+        self.document_slots = [self.clearOccurrenceIndex, self.updateFolds, self.bracket_index.update]
+        for slot in self.document_slots:
+            self.document().contentsChange.connect(slot)
 
         self.lineNumberArea = KSLineNumberArea(self)
+        self.line_number_area_width = None
+        self.line_number_digits = None  # The width only changes when the number of digits (or the font) does
         self.blockCountChanged.connect(self.updateLineNumberAreaWidth)
         self.updateRequest.connect(self.updateLineNumberArea)
         self.updateLineNumberAreaWidth()
 
+        self.setColorStyle()
+        self.setFont(config.script_editor_font)
+
         # Highlight line
-        self.cursorPositionChanged.connect(self.highlightCurrentLine)
+        self.cursorPositionChanged.connect(self.scheduleCursorFrame)
+
+        # Lazy highlighting of big documents: the visible blocks go first
+        self.verticalScrollBar().valueChanged.connect(self.highlightVisibleBlocks)
+        self.verticalScrollBar().valueChanged.connect(self.scheduleOccurrences)
 
     def lineNumberAreaWidth(self):
-        digits = 1
-        max_num = max(1, self.blockCount())
-        while max_num >= 10:
-            max_num /= 10
-            digits += 1
+        digits = len(str(max(1, self.blockCount())))
+        return 7 + self.fontMetrics().horizontalAdvance('9') * digits + self.foldMarkerWidth()
 
-        space = 7 + self.fontMetrics().horizontalAdvance('9') * digits
-        return space
+    def foldMarkerWidth(self):
+        return self.fontMetrics().horizontalAdvance('9') + 2
 
     def updateLineNumberAreaWidth(self):
-        self.setViewportMargins(self.lineNumberAreaWidth(), 0, 0, 0)
+        digits = len(str(max(1, self.blockCount())))
+        if digits == self.line_number_digits:
+            return
+        self.line_number_digits = digits
+        width = self.lineNumberAreaWidth()
+        if width != self.line_number_area_width:  # Resetting the same margins still relayouts the viewport
+            self.line_number_area_width = width
+            self.setViewportMargins(width, 0, 0, 0)
+            cr = self.contentsRect()
+            self.lineNumberArea.setGeometry(QtCore.QRect(cr.left(), cr.top(), width, cr.height()))
 
     def updateLineNumberArea(self, rect, dy):
-
+        """ Scrolls the gutter along with the text (only the exposed strip gets painted), or updates the dirty rect. """
+        instrumentation.count("editor_updates")
         if dy:
             self.lineNumberArea.scroll(0, dy)
         else:
             self.lineNumberArea.update(0, rect.y(), self.lineNumberArea.width(), rect.height())
 
-        if rect.contains(self.viewport().rect()):
+    def changeEvent(self, event):
+        if event.type() == QtCore.QEvent.FontChange:
+            self.line_number_digits = None
             self.updateLineNumberAreaWidth()
+            self.updateLineNumberStyle()
+        QtWidgets.QPlainTextEdit.changeEvent(self, event)
 
     def resizeEvent(self, event):
         QtWidgets.QPlainTextEdit.resizeEvent(self, event)
 
         cr = self.contentsRect()
-        self.lineNumberArea.setGeometry(QtCore.QRect(cr.left(), cr.top(), self.lineNumberAreaWidth(), cr.height()))
+        self.lineNumberArea.setGeometry(QtCore.QRect(cr.left(), cr.top(), self.line_number_area_width, cr.height()))
+        self.highlightVisibleBlocks()
+
+    def setPlainText(self, text):
+        """ Sets the text. Big documents get highlighted lazily: the visible blocks first, the rest when idle. """
+        if self.highlighter is not None:
+            if self.highlighter.isBigDocument(text.count("\n") + 1):
+                self.highlighter.startLazy()
+            else:
+                self.highlighter.stopLazy()
+        QtWidgets.QPlainTextEdit.setPlainText(self, text)
+        self.highlightVisibleBlocks()
+
+    def swapDocument(self, state=None):
+        """
+        Shows another document, with its highlighter and code language, from a doccache.KSDocumentState returned by
+        a previous swap (or a new empty document, in the current code language, if None). Returns the state of the
+        document shown until now, which keeps its text, undo history, layout and highlighting.
+        """
+        old_document = self.document()
+        old_state = doccache.KSDocumentState(old_document, self.highlighter, self.code_language,
+                                             self.fold_tree.folded)
+        old_document.setParent(self)  # setDocument would delete it if it was still the editor's own
+        for slot in self.document_slots:
+            try:
+                old_document.contentsChange.disconnect(slot)
+            except (RuntimeError, TypeError):
+                pass
+
+        if state is None:
+            document = QtGui.QTextDocument(self)
+            document.setDocumentLayout(QtWidgets.QPlainTextDocumentLayout(document))
+            state = doccache.KSDocumentState(document)
+        document = state.document
+        if document.defaultFont() != old_document.defaultFont():
+            document.setDefaultFont(old_document.defaultFont())  # The font might have changed since it was shown
+        if document.defaultTextOption().tabStopDistance() != old_document.defaultTextOption().tabStopDistance():
+            document.setDefaultTextOption(old_document.defaultTextOption())
+        self.setDocument(document)
+        for slot in self.document_slots:
+            document.contentsChange.connect(slot)
+
+        self.highlighter = state.highlighter
+        self.code_language = state.code_language
+        if state.highlighter is None and state.code_language is None:
+            self.set_code_language(old_state.code_language)  # A new document
+        else:
+            if self.code_language != old_state.code_language:
+                self.setColorStyle("blink_default" if self.code_language == "blink" else "default")
+            self.refreshHighlighterStyle()
+        self.fold_tree.setDocument(document, state.folds)
+        self.bracket_index.reset()
+        self.occurrence_index = {}
+        for name in self.extra_selection_layers:
+            self.extra_selection_layers[name] = []
+        self.extra_selections_dirty = True
+        self.cursor_line = -1
+        self.cursor_position = -1
+        self.updateLineNumberAreaWidth()
+        if self.semantic_layer is not None:
+            self.semantic_layer.documentChanged(old_document)
+        self.updateSemanticLayer()
+        self.highlightVisibleBlocks()
+        self.scheduleCursorFrame()
+        return old_state
+
+    def refreshHighlighterStyle(self):
+        """
+        Makes the highlighter use the current compiled styles and the code style pref of its language, as a cached
+        document keeps the ones it was highlighted with (prefs might have changed since). Rehighlights if they did.
+        """
+        highlighter = self.highlighter
+        if highlighter is None:
+            return
+        changed = False
+        if highlighter.styles is not highlighter.sharedStyles():
+            highlighter.reloadStyles()
+            changed = True
+        if self.code_language == "python" and highlighter.style != config.prefs["code_style_python"]:
+            highlighter.setStyle(config.prefs["code_style_python"])
+            changed = True
+        if changed:
+            highlighter.rehighlight()
+
+    def visibleBlockRange(self):
+        """ Returns the first and last block numbers in the viewport, plus a page of margin above and below. """
+        first = self.firstVisibleBlock().blockNumber()
+        page = self.viewport().height() // max(1, self.fontMetrics().height()) + 1
+        return max(0, first - page), first + 2 * page
+
+    def highlightVisibleBlocks(self):
+        """ Makes sure the blocks in the viewport (plus a page of margin) are highlighted right away. """
+        if self.highlighter is None:
+            return
+        self.highlighter.setVisibleRange(*self.visibleBlockRange())
 
     # def toPlainText(self):
     #     return utils.string(QtWidgets.QPlainTextEdit.toPlainText(self))
 
+    def updateLineNumberStyle(self):
+        """ Passes the font and colors of the line numbers to the gutter. Called when they change, not on paint. """
+        if self.lineNumberColor is None:
+            return
+        font_size = config.prefs["se_font_size"] if self.knobScripter != "" else None
+        self.lineNumberArea.setStyle(config.script_editor_font, font_size, self.lineNumberColor,
+                                     self.currentLineNumberColor)
+
     def lineNumberAreaPaintEvent(self, event):
 
         if self.isReadOnly():
             return
 
-        painter = QtGui.QPainter(self.lineNumberArea)
-        painter.fillRect(event.rect(), self.lineNumberAreaColor)  # Number bg
+        area = self.lineNumberArea
+        rect = event.rect()
+        painter = QtGui.QPainter(area)
+        painter.fillRect(rect, self.lineNumberAreaColor)  # Number bg
 
         block = self.firstVisibleBlock()
-        block_number = block.blockNumber()
         top = int(self.blockBoundingGeometry(block).translated(self.contentOffset()).top())
-        bottom = top + int(self.blockBoundingRect(block).height())
-        current_line = self.document().findBlock(self.textCursor().position()).blockNumber()
-
-        painter.setPen(self.palette().color(QtGui.QPalette.Text))
+        current_line = self.textCursor().blockNumber() if self.hasFocus() else -1
+        marker_width = self.foldMarkerWidth()
+        right = area.width() - marker_width - 3
 
-        painter_font = config.script_editor_font
-        if self.knobScripter != "":
-            painter_font.setPointSize(config.prefs["se_font_size"])
-        painter.setFont(painter_font)
-
-        while block.isValid() and top <= event.rect().bottom():
-
-            text_color = self.lineNumberColor  # Numbers
-
-            if block_number == current_line and self.hasFocus():
-                text_color = self.currentLineNumberColor  # Number highlighted
-
-            painter.setPen(text_color)
+        # Only the lines within the dirty rect get drawn (i.e. the exposed strip when scrolling)
+        while block.isValid() and top <= rect.bottom():
+            bottom = top + int(self.blockBoundingRect(block).height())
+            if bottom >= rect.top() and block.isVisible():
+                number = block.blockNumber()
+                pixmap, width = area.numberPixmap(number + 1, number == current_line)
+                painter.drawPixmap(right - width, top, pixmap)
+                if is_long_block(block):  # Flag the long lines, which get degraded highlighting
+                    painter.fillRect(0, top, 2, bottom - top, self.longLineColor)
+                if self.fold_tree.isHeader(block):
+                    pixmap = area.foldMarkerPixmap(marker_width, self.fold_tree.hidesNext(block))
+                    painter.drawPixmap(area.width() - marker_width, top, pixmap)
+            block = block.next()
+            top = bottom
+        painter.end()
 
-            number = "%s" % str(block_number + 1)
-            painter.drawText(-3, top, self.lineNumberArea.width(), self.fontMetrics().height(), QtCore.Qt.AlignRight,
-                             number)
+    def lineNumberAreaMousePressEvent(self, event):
+        """ Clicking the fold marker of a line folds or unfolds it. """
+        if event.pos().x() < self.lineNumberArea.width() - self.foldMarkerWidth() - 2:
+            return
+        block = self.cursorForPosition(QtCore.QPoint(0, event.pos().y())).block()
+        if self.fold_tree.isHeader(block):
+            self.toggleFold(block)
 
-            # Move to the next block
+    def toggleFold(self, block):
+        """ Folds or unfolds the block. A cursor that gets hidden by folding goes to the end of the block. """
+        if not self.fold_tree.toggle(block):
+            return
+        cursor = self.textCursor()
+        if not cursor.block().isVisible():
+            cursor.setPosition(block.position() + block.length() - 1)
+            self.setTextCursor(cursor)
+        self.lineNumberArea.update()
+        self.highlightVisibleBlocks()
+
+    def moveCursorOverFolds(self, event):
+        """
+        Up or Down when something is folded: moves the cursor as usual, but if it lands in a folded line it goes on
+        to the next visible one (or stays in the header, if the fold reaches the end), instead of unfolding it.
+        """
+        down = event.key() == Qt.Key_Down
+        column = self.textCursor().positionInBlock()
+        QtWidgets.QPlainTextEdit.keyPressEvent(self, event)
+        cursor = self.textCursor()
+        if cursor.block().isVisible():
+            return
+        block = self.fold_tree.visibleBlock(cursor.block(), down)
+        if not block.isValid():
+            block = self.fold_tree.visibleBlock(cursor.block(), not down)
+            column = block.length() - 1
+        shift = bool(int(event.modifiers()) & int(Qt.ShiftModifier))
+        mode = QtGui.QTextCursor.KeepAnchor if shift else QtGui.QTextCursor.MoveAnchor
+        cursor.setPosition(block.position() + min(column, block.length() - 1), mode)
+        self.setTextCursor(cursor)
+
+    def updateFolds(self, position, removed, added):
+        """
+        contentsChange: updates the fold tree, and unfolds the edited blocks that hide the next ones but aren't folded
+        headers anymore (i.e. a header was unindented, or a line was added at the end of a folded header).
+        """
+        self.fold_tree.update(position, removed, added)
+        if not self.fold_tree.has_folds:
+            return
+        block = self.document().findBlock(position)
+        end = position + added
+        while block.isValid() and block.position() <= end:
+            if self.fold_tree.hidesNext(block):
+                if not (self.fold_tree.isFolded(block) and self.fold_tree.isHeader(block)):
+                    self.fold_tree.unfold(block)
             block = block.next()
-            top = bottom
-            bottom = top + int(self.blockBoundingRect(block).height())
-            block_number += 1
 
     def keyPressEvent(self, event):
         """
         Custom actions for specific keystrokes
         """
         key = event.key()
-        ctrl = bool(event.modifiers() & Qt.ControlModifier)
-        # alt = bool(event.modifiers() & Qt.AltModifier)
-        shift = bool(event.modifiers() & Qt.ShiftModifier)
-        pre_scroll = self.verticalScrollBar().value()
+        ctrl = bool(int(event.modifiers()) & int(Qt.ControlModifier))
+        # alt = bool(int(event.modifiers()) & int(Qt.AltModifier))
+        shift = bool(int(event.modifiers()) & int(Qt.ShiftModifier))
         # modifiers = QtWidgets.QApplication.keyboardModifiers()
         # ctrl = (modifiers == Qt.ControlModifier)
         # shift = (modifiers == Qt.ShiftModifier)
@@ -165,34 +377,15 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
                 QtWidgets.QPlainTextEdit.keyPressEvent(self, event)
         else:
             # COOL BEHAVIORS SIMILAR TO SUBLIME GO NEXT!
+            # Only the lines where the selection starts and ends are read, so keystrokes cost the same in any document
             cursor = self.textCursor()
-            cpos = cursor.position()
-            apos = cursor.anchor()
-            text_before_cursor = self.toPlainText()[:min(cpos, apos)]
-            text_after_cursor = self.toPlainText()[max(cpos, apos):]
-            text_all = self.toPlainText()
-            to_line_start = text_before_cursor[::-1].find("\n")
-            if to_line_start == -1:
-                linestart_pos = 0  # Position of the start of the line that includes the cursor selection start
-            else:
-                linestart_pos = len(text_before_cursor) - to_line_start
+            context = KSCursorContext(cursor)
+            cpos = context.position
+            apos = context.anchor
+            text_before_cursor = context.before()
+            text_after_cursor = context.after()
+            selection = context.selection
 
-            to_line_end = text_after_cursor.find("\n")
-            if to_line_end == -1:
-                lineend_pos = len(text_all)  # Position of the end of the line that includes the cursor selection end
-            else:
-                lineend_pos = max(cpos, apos) + to_line_end
-
-            text_before_lines = text_all[:linestart_pos]
-            text_after_lines = text_all[lineend_pos:]
-            if len(text_after_lines) and text_after_lines.startswith("\n"):
-                text_after_lines = text_after_lines[1:]
-            text_lines = text_all[linestart_pos:lineend_pos]
-
-            if cursor.hasSelection():
-                selection = cursor.selection().toPlainText()
-            else:
-                selection = ""
             if key == Qt.Key_ParenLeft and (len(selection) > 0 or re.match(r"[\s)}\];]+", text_after_cursor) or not len(
                     text_after_cursor)):  # (
                 cursor.insertText("(" + selection + ")")
@@ -226,7 +419,7 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
                     cursor.insertText('"' + selection + '"')
                     cursor.setPosition(apos + 1, QtGui.QTextCursor.MoveAnchor)
                     cursor.setPosition(cpos + 1, QtGui.QTextCursor.KeepAnchor)
-                elif text_after_cursor.startswith('"') and '"' in text_before_cursor.split("\n")[-1]:
+                elif text_after_cursor.startswith('"') and '"' in context.line_before:
                     cursor.movePosition(QtGui.QTextCursor.NextCharacter)
                 elif not re.match(r"(?:[\s)\]]+|$)", text_after_cursor):  # If chars after cursor, act normal
                     QtWidgets.QPlainTextEdit.keyPressEvent(self, event)
@@ -243,7 +436,7 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
                     cursor.insertText("'" + selection + "'")
                     cursor.setPosition(apos + 1, QtGui.QTextCursor.MoveAnchor)
                     cursor.setPosition(cpos + 1, QtGui.QTextCursor.KeepAnchor)
-                elif text_after_cursor.startswith("'") and "'" in text_before_cursor.split("\n")[-1]:
+                elif text_after_cursor.startswith("'") and "'" in context.line_before:
                     cursor.movePosition(QtGui.QTextCursor.NextCharacter)
                 elif not re.match(r"(?:[\s)\]]+|$)", text_after_cursor):  # If chars after cursor, act normal
                     QtWidgets.QPlainTextEdit.keyPressEvent(self, event)
@@ -256,13 +449,13 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
                     cursor.setPosition(cpos + 1, QtGui.QTextCursor.KeepAnchor)
                 self.setTextCursor(cursor)
             elif key == 35 and len(selection):  # # (yes, a hash)
-                # If there's a selection, insert a hash at the start of each line.. how?
-                if selection != "":
-                    selection_split = selection.split("\n")
-                    if all(i.startswith("#") for i in selection_split):
-                        selection_commented = "\n".join([s[1:] for s in selection_split])  # Uncommented
+                if u"\n" in selection:  # Multiple lines: comment them out (or in)
+                    self.toggleComment()
+                else:
+                    if selection.startswith("#"):
+                        selection_commented = selection[1:]  # Uncommented
                     else:
-                        selection_commented = "#" + "\n#".join(selection_split)
+                        selection_commented = "#" + selection
                     cursor.insertText(selection_commented)
                     if apos > cpos:
                         cursor.setPosition(apos + len(selection_commented) - len(selection),
@@ -274,15 +467,16 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
                                            QtGui.QTextCursor.KeepAnchor)
                     self.setTextCursor(cursor)
 
+            elif key == Qt.Key_Slash and ctrl:  # Ctrl+/, to comment or uncomment the line/s
+                self.toggleComment()
+
+            elif key == Qt.Key_M and ctrl:  # Ctrl+M, to jump to the matching bracket
+                self.jumpToMatchingBracket()
+
             elif key == 68 and ctrl and shift:  # Ctrl+Shift+D, to duplicate text or line/s
 
                 if not len(selection):
-                    self.setPlainText(text_before_lines + text_lines + "\n" + text_lines + "\n" + text_after_lines)
-                    cursor.setPosition(apos + len(text_lines) + 1, QtGui.QTextCursor.MoveAnchor)
-                    cursor.setPosition(cpos + len(text_lines) + 1, QtGui.QTextCursor.KeepAnchor)
-                    self.setTextCursor(cursor)
-                    self.verticalScrollBar().setValue(pre_scroll)
-                    self.scrollToCursor()
+                    self.duplicateLines()
                 else:
                     if text_before_cursor.endswith("\n") and not selection.startswith("\n"):
                         cursor.insertText(selection + "\n" + selection)
@@ -294,51 +488,13 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
                         cursor.setPosition(cpos + len(selection), QtGui.QTextCursor.KeepAnchor)
                     self.setTextCursor(cursor)
 
-            elif key == up_arrow and ctrl and shift and len(
-                    text_before_lines):  # Ctrl+Shift+Up, to move the selected line/s up
-                prev_line_start_distance = text_before_lines[:-1][::-1].find("\n")
-                if prev_line_start_distance == -1:
-                    prev_line_start_pos = 0  # Position of the start of the previous line
-                else:
-                    prev_line_start_pos = len(text_before_lines) - 1 - prev_line_start_distance
-                prev_line = text_before_lines[prev_line_start_pos:]
-
-                text_before_prev_line = text_before_lines[:prev_line_start_pos]
+            elif key == up_arrow and ctrl and shift and not context.first_line:  # Ctrl+Shift+Up, to move line/s up
+                self.moveLines(-1)
 
-                if prev_line.endswith("\n"):
-                    prev_line = prev_line[:-1]
+            elif key == down_arrow and ctrl and shift:  # Ctrl+Shift+Down, to move the selected line/s down
+                self.moveLines(1)
 
-                if len(text_after_lines):
-                    text_after_lines = "\n" + text_after_lines
-
-                self.setPlainText(text_before_prev_line + text_lines + "\n" + prev_line + text_after_lines)
-                cursor.setPosition(apos - len(prev_line) - 1, QtGui.QTextCursor.MoveAnchor)
-                cursor.setPosition(cpos - len(prev_line) - 1, QtGui.QTextCursor.KeepAnchor)
-                self.setTextCursor(cursor)
-                self.verticalScrollBar().setValue(pre_scroll)
-                self.scrollToCursor()
-                return
-
-            elif key == down_arrow and ctrl and shift:  # Ctrl+Shift+Up, to move the selected line/s up
-                if not len(text_after_lines):
-                    text_after_lines = ""
-                next_line_end_distance = text_after_lines.find("\n")
-                if next_line_end_distance == -1:
-                    next_line_end_pos = len(text_all)
-                else:
-                    next_line_end_pos = next_line_end_distance
-                next_line = text_after_lines[:next_line_end_pos]
-                text_after_next_line = text_after_lines[next_line_end_pos:]
-
-                self.setPlainText(text_before_lines + next_line + "\n" + text_lines + text_after_next_line)
-                cursor.setPosition(apos + len(next_line) + 1, QtGui.QTextCursor.MoveAnchor)
-                cursor.setPosition(cpos + len(next_line) + 1, QtGui.QTextCursor.KeepAnchor)
-                self.setTextCursor(cursor)
-                self.verticalScrollBar().setValue(pre_scroll)
-                self.scrollToCursor()
-                return
-
-            elif key == up_arrow and not len(text_before_lines):  # If up key and nothing happens, go to start
+            elif key == up_arrow and context.first_line:  # If up key and nothing happens, go to start
                 if not shift:
                     cursor.setPosition(0, QtGui.QTextCursor.MoveAnchor)
                     self.setTextCursor(cursor)
@@ -346,14 +502,17 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
                     cursor.setPosition(0, QtGui.QTextCursor.KeepAnchor)
                     self.setTextCursor(cursor)
 
-            elif key == down_arrow and not len(text_after_lines):  # If up key and nothing happens, go to start
+            elif key == down_arrow and context.last_line:  # If up key and nothing happens, go to start
                 if not shift:
-                    cursor.setPosition(len(text_all), QtGui.QTextCursor.MoveAnchor)
+                    cursor.movePosition(QtGui.QTextCursor.End, QtGui.QTextCursor.MoveAnchor)
                     self.setTextCursor(cursor)
                 else:
-                    cursor.setPosition(len(text_all), QtGui.QTextCursor.KeepAnchor)
+                    cursor.movePosition(QtGui.QTextCursor.End, QtGui.QTextCursor.KeepAnchor)
                     self.setTextCursor(cursor)
 
+            elif key in (up_arrow, down_arrow) and not ctrl and self.fold_tree.has_folds:
+                self.moveCursorOverFolds(event)
+
             # if enter or return, match indent level
             elif key in [16777220, 16777221]:
                 self.indentNewLine()
@@ -376,9 +535,7 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
 
     def scrollToCursor(self):
         self.cursor = self.textCursor()
-        self.cursor.movePosition(
-            QtGui.QTextCursor.NoMove)  # Does nothing, but makes the scroll go to the right place...
-        self.setTextCursor(self.cursor)
+        self.ensureCursorVisible()
 
     def getCursorInfo(self):
 
@@ -455,8 +612,7 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
         self.insertPlainText(' ' * int(self.tab_spaces * indent_level))
 
     def indentation(self, mode):
-
-        pre_scroll = self.verticalScrollBar().value()
+        """ Indents or unindents the selected lines (or, with no selection, indents at the cursor). """
         self.getCursorInfo()
 
         # if nothing is selected and mode is set to indent, simply insert as many
@@ -466,84 +622,122 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
             self.insertPlainText(' ' * remaining_spaces)
             return
 
-        selected_blocks = self.findBlocks(self.firstChar, self.lastChar)
-        before_blocks = self.findBlocks(last=self.firstChar - 1, exclude=selected_blocks)
-        after_blocks = self.findBlocks(first=self.lastChar + 1, exclude=selected_blocks)
-
-        before_blocks_text = self.blocks2list(before_blocks)
-        selected_blocks_text = self.blocks2list(selected_blocks, mode)
-        after_blocks_text = self.blocks2list(after_blocks)
-
-        combined_text = '\n'.join(before_blocks_text + selected_blocks_text + after_blocks_text)
-
-        # make sure the line count stays the same
-        original_block_count = len(self.toPlainText().split('\n'))
-        combined_text = '\n'.join(combined_text.split('\n')[:original_block_count])
-
-        self.clear()
-        self.setPlainText(combined_text)
-
-        if self.noSelection:
-            self.cursor.setPosition(self.lastChar)
-
-        # check whether the the orignal selection was from top to bottom or vice versa
+        first, last = lineops.block_range(self.cursor)
+        if mode == 'indent':
+            self.editLines(lineops.indent, first, last, self.tab_spaces)
         else:
-            if self.originalPosition == self.firstChar:
-                first = self.lastChar
-                last = self.firstChar
-                first_block_snap = QtGui.QTextCursor.EndOfBlock
-                last_block_snap = QtGui.QTextCursor.StartOfBlock
-            else:
-                first = self.firstChar
-                last = self.lastChar
-                first_block_snap = QtGui.QTextCursor.StartOfBlock
-                last_block_snap = QtGui.QTextCursor.EndOfBlock
-
-            self.cursor.setPosition(first)
-            self.cursor.movePosition(first_block_snap, QtGui.QTextCursor.MoveAnchor)
-            self.cursor.setPosition(last, QtGui.QTextCursor.KeepAnchor)
-            self.cursor.movePosition(last_block_snap, QtGui.QTextCursor.KeepAnchor)
-
-        self.setTextCursor(self.cursor)
-        self.verticalScrollBar().setValue(pre_scroll)
-
-    def findBlocks(self, first=0, last=None, exclude=None):
-        exclude = exclude or []
-        blocks = []
-        if last is None:
-            last = self.document().characterCount()
-        for pos in range(first, last + 1):
-            block = self.document().findBlock(pos)
-            if block not in blocks and block not in exclude:
-                blocks.append(block)
-        return blocks
-
-    def blocks2list(self, blocks, mode=None):
-        text = []
-        for block in blocks:
-            block_text = block.text()
-            if mode == 'unindent':
-                if block_text.startswith(' ' * self.tab_spaces):
-                    block_text = block_text[self.tab_spaces:]
-                    self.lastChar -= self.tab_spaces
-                elif block_text.startswith(' '):
-                    block_text = block_text[1:]
-                    self.lastChar -= 1
-
-            elif mode == 'indent':
-                block_text = ' ' * self.tab_spaces + block_text
-                self.lastChar += self.tab_spaces
-
-            text.append(block_text)
-
-        return text
+            self.editLines(lineops.unindent, first, last, self.tab_spaces)
+
+        # With a selection, select the whole lines, keeping the direction of the original selection
+        if not self.noSelection:
+            self.selectLines(first, last, self.originalPosition == self.firstChar)
+
+    def toggleComment(self):
+        """ Comments or uncomments the selected lines, or the current one. """
+        cursor = self.textCursor()
+        first, last = lineops.block_range(cursor)
+        prefix = "//" if self.code_language == "blink" else "#"
+        self.editLines(lineops.toggle_comment, first, last, prefix)
+        if cursor.hasSelection():
+            self.selectLines(first, last, cursor.position() < cursor.anchor())
+
+    def duplicateLines(self):
+        """ Duplicates the selected lines, or the current one, moving the cursor to the copy. """
+        cursor = self.textCursor()
+        apos = cursor.anchor()
+        cpos = cursor.position()
+        length = self.editLines(lineops.duplicate, *lineops.block_range(cursor))
+        cursor.setPosition(apos + length, QtGui.QTextCursor.MoveAnchor)
+        cursor.setPosition(cpos + length, QtGui.QTextCursor.KeepAnchor)
+        self.setTextCursor(cursor)
+
+    def moveLines(self, direction):
+        """ Moves the selected lines, or the current one, one line up (direction -1) or down (1). """
+        cursor = self.textCursor()
+        apos = cursor.anchor()
+        cpos = cursor.position()
+        first, last = lineops.block_range(cursor)
+        shift = self.editLines(lineops.move, first, last, direction)
+        if shift:
+            cursor.setPosition(apos + shift, QtGui.QTextCursor.MoveAnchor)
+            cursor.setPosition(cpos + shift, QtGui.QTextCursor.KeepAnchor)
+            self.setTextCursor(cursor)
+
+    def editLines(self, operation, first, last, *args):
+        """
+        Runs a lineops operation on the lines from first to last and returns its result. If they're many, the
+        highlighter only highlights the visible ones right away, and the rest lazily.
+        """
+        defer = self.highlighter is not None and last - first >= self.highlighter.lazy_chunk_blocks
+        if defer:
+            # Also covers the line moved over, or the copies when duplicating
+            self.highlighter.deferEdits(max(0, first - 1), 2 * last - first + 2)
+        try:
+            return operation(self.document(), first, last, *args)
+        finally:
+            if defer:
+                self.highlighter.deferEdits()
+
+    def selectLines(self, first, last, reverse=False):
+        """ Selects the lines from first to last, whole. If reverse, the cursor ends up at the start. """
+        start = self.document().findBlockByNumber(first).position()
+        last_block = self.document().findBlockByNumber(last)
+        end = last_block.position() + last_block.length() - 1
+        if reverse:
+            start, end = end, start
+        cursor = self.textCursor()
+        cursor.setPosition(start, QtGui.QTextCursor.MoveAnchor)
+        cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+        self.setTextCursor(cursor)
+
+    def scheduleCursorFrame(self):
+        """ The cursor moved: the cursor-dependent updates run on the next frame, once for all the moves until then. """
+        instrumentation.count("cursor_moves")
+        if not self.cursor_frame_timer.isActive():
+            self.cursor_frame_timer.start()
+
+    def updateCursorFrame(self):
+        """
+        Updates everything that depends on the cursor: current line, its number in the gutter, extra selections.
+        It only scrolls to the cursor if it moved, so the view can be scrolled away from it meanwhile.
+        """
+        self.cursor_frame_timer.stop()
+        instrumentation.count("cursor_frames")
+        self.in_cursor_frame = True
+        try:
+            cursor = self.textCursor()
+            cursor_block = cursor.block()
+            if not cursor_block.isVisible():  # i.e. a find result inside a fold (Up and Down skip folds instead)
+                self.fold_tree.reveal(cursor_block)
+            line = cursor_block.blockNumber()
+            current_line = self.extra_selection_layers["current_line"]
+            if line != self.cursor_line or not current_line or current_line[0].cursor.blockNumber() != line:
+                self.highlightCurrentLine()
+            if line != self.cursor_line:
+                self.updateLineNumber(self.cursor_line)
+                self.updateLineNumber(line)
+                self.cursor_line = line
+            self.highlightMatchingBrackets()
+            self.updateExtraSelections()
+        finally:
+            self.in_cursor_frame = False
+        if cursor.position() != self.cursor_position:
+            self.cursor_position = cursor.position()
+            self.ensureCursorVisible()
+
+    def updateLineNumber(self, line):
+        """ Repaints the number of the given line in the gutter, if it's visible. """
+        block = self.document().findBlockByNumber(line)
+        if line < 0 or not block.isValid() or not block.isVisible():
+            return
+        rect = self.blockBoundingGeometry(block).translated(self.contentOffset()).toRect()
+        if rect.bottom() >= 0 and rect.top() <= self.viewport().height():
+            self.lineNumberArea.update(0, rect.top(), self.lineNumberArea.width(), rect.height())
 
     def highlightCurrentLine(self):
         """
         Highlight currently selected line
         """
-        extra_selections = []
-
         selection = QtWidgets.QTextEdit.ExtraSelection()
 
         selection.format.setBackground(self.lineColor)
@@ -551,10 +745,148 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
         selection.cursor = self.textCursor()
         selection.cursor.clearSelection()
 
-        extra_selections.append(selection)
+        self.setSelectionLayer("current_line", [selection])
 
-        self.setExtraSelections(extra_selections)
-        self.scrollToCursor()
+    def cursorBracket(self, budget=None):
+        """
+        Returns the position of the bracket next to the cursor (the one after it, or else the one before it), and the
+        position of its partner (-1 if unmatched, or brackets.UNKNOWN if not found within budget, see
+        KSBracketIndex.find). Returns (-1, -1) if there's no bracket next to the cursor.
+        """
+        position = self.textCursor().position()
+        for bracket_position in [position, position - 1]:
+            if bracket_position < 0:
+                continue
+            partner = self.bracket_index.match(bracket_position, budget)
+            if partner is not None:
+                return bracket_position, partner
+        return -1, -1
+
+    def highlightMatchingBrackets(self):
+        """
+        Highlights the bracket next to the cursor and its partner, or the bracket alone if it's unmatched. A partner
+        too far to find on this frame is highlighted when the bracket index has summarized the blocks up to it.
+        """
+        selections = []
+        if not self.textCursor().hasSelection():
+            bracket, partner = self.cursorBracket(self.bracket_index.frame_blocks)
+            if partner == brackets.UNKNOWN:
+                bracket = -1
+            for position in [bracket, partner]:
+                if position < 0:
+                    continue
+                selection = QtWidgets.QTextEdit.ExtraSelection()
+                selection.format.setBackground(self.bracketMatchColor if partner >= 0 else self.bracketUnmatchedColor)
+                selection.cursor = self.textCursor()
+                selection.cursor.setPosition(position)
+                selection.cursor.setPosition(position + 1, QtGui.QTextCursor.KeepAnchor)
+                selections.append(selection)
+        self.setSelectionLayer("brackets", selections)
+
+    def jumpToMatchingBracket(self):
+        """
+        Moves the cursor to the partner of the bracket next to it. Away from brackets, moves it to the closer of the
+        innermost brackets around it.
+        """
+        bracket, partner = self.cursorBracket()
+        if bracket < 0:
+            opener = self.bracket_index.enclosing(self.textCursor().position())
+            partner = self.bracket_index.match(opener) if opener >= 0 else -1
+        if partner is None or partner < 0:
+            return
+        cursor = self.textCursor()
+        cursor.setPosition(partner)
+        self.setTextCursor(cursor)
+
+    def setSelectionLayer(self, name, selections):
+        """
+        Sets the extra selections of the layer name (new layers go on top of the existing ones). They're applied,
+        merged with the rest of the layers, on the next frame (or at the end of the current one, if set by it).
+        """
+        if not selections and not self.extra_selection_layers.get(name):
+            return
+        self.extra_selection_layers[name] = selections
+        self.extra_selections_dirty = True
+        if not self.in_cursor_frame and not self.cursor_frame_timer.isActive():
+            self.cursor_frame_timer.start()
+
+    def setExtraSelections(self, selections):
+        """ Extra selections set from outside go to their own layer, instead of replacing the editor's ones. """
+        self.setSelectionLayer("extra", selections)
+
+    def updateExtraSelections(self):
+        """ Applies the extra selections of all the layers, if they changed. """
+        if not self.extra_selections_dirty:
+            return
+        self.extra_selections_dirty = False
+        extra_selections = []
+        for selections in self.extra_selection_layers.values():
+            extra_selections += selections
+        instrumentation.count("extra_selections")
+        QtWidgets.QPlainTextEdit.setExtraSelections(self, extra_selections)
+
+    def selectionOccurrencesChanged(self):
+        """
+        The selection changed: cancels the pending search of occurrences, and schedules a new one if the selection
+        is a good candidate (single line, not blank).
+        """
+        self.occurrences_timer.stop()
+        cursor = self.textCursor()
+        selected_text = cursor.selectedText() if abs(cursor.position() - cursor.anchor()) <= 200 else ""
+        if not selected_text.strip() or u"\u2029" in selected_text or len(selected_text) > 200:
+            regex = None
+        elif re.match(r"^\w+$", selected_text):
+            regex = re.compile(r"\b{0}\b".format(re.escape(selected_text)))
+        else:
+            regex = re.compile(re.escape(selected_text))
+
+        if regex is None or self.occurrence_regex is None or regex.pattern != self.occurrence_regex.pattern:
+            self.occurrence_regex = regex
+            self.occurrence_index = {}
+            self.setSelectionLayer("occurrences", [])
+        self.scheduleOccurrences()
+
+    def scheduleOccurrences(self):
+        if self.occurrence_regex is not None:
+            self.occurrences_timer.start()
+
+    def clearOccurrenceIndex(self, *args):
+        """ The document changed: the positions indexed aren't valid anymore. """
+        self.occurrence_index = {}
+        self.scheduleOccurrences()
+
+    def updateOccurrences(self):
+        """
+        Highlights the occurrences of the selected text in the visible blocks (plus a margin),
+        from the occurrence index. Blocks that aren't indexed yet are searched now.
+        """
+        regex = self.occurrence_regex
+        if regex is None:
+            return
+        first, last = self.visibleBlockRange()
+        index = dict()
+        selections = []
+        block = self.document().findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() <= last:
+            number = block.blockNumber()
+            if number in self.occurrence_index:
+                spans = self.occurrence_index[number]
+            elif is_long_block(block):
+                spans = []
+            else:
+                spans = [match.span() for match in regex.finditer(block.text())]
+            index[number] = spans
+            for start, end in spans:
+                selection = QtWidgets.QTextEdit.ExtraSelection()
+                selection.format.setBackground(self.occurrenceColor)
+                selection.cursor = QtGui.QTextCursor(block)
+                selection.cursor.setPosition(block.position() + start)
+                selection.cursor.setPosition(block.position() + end, QtGui.QTextCursor.KeepAnchor)
+                selections.append(selection)
+            block = block.next()
+
+        self.occurrence_index = index  # Only the range around the viewport is kept
+        self.setSelectionLayer("occurrences", selections)
 
     @staticmethod
     def format(rgb, style=''):
@@ -591,8 +923,12 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
         self.lineNumberAreaColor = QtGui.QColor(*styles[style]["lineNumberAreaColor"])
         self.lineNumberColor = QtGui.QColor(*styles[style]["lineNumberColor"])
         self.currentLineNumberColor = QtGui.QColor(*styles[style]["currentLineNumberColor"])
+        self.occurrenceColor = QtGui.QColor(*styles[style]["occurrence_color"])
+        self.longLineColor = QtGui.QColor(*styles[style]["long_line_color"])
+        self.bracketMatchColor = QtGui.QColor(*styles[style]["bracket_match_color"])
+        self.bracketUnmatchedColor = QtGui.QColor(*styles[style]["bracket_unmatched_color"])
+        self.updateLineNumberStyle()
         self.highlightCurrentLine()
-        self.scrollToCursor()
         return True
 
     def set_code_language(self, lang="python"):
@@ -602,13 +938,19 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
             self.highlighter.setDocument(None)
             self.highlighter = None
             self.code_language = None
+            self.bracket_index.reset()
+            self.updateSemanticLayer()
 
         if isinstance(lang, str):
             if lang != self.code_language:
                 lang = lang.lower()
+                self.bracket_index.reset()  # Brackets in strings and comments depend on the highlighter
                 if self.highlighter:
                     self.highlighter.setDocument(None)
                     self.highlighter = None
+                big_document = KSHighlighter.isBigDocument(self.blockCount())
+                if big_document:
+                    KSHighlighter.clearBlockStates(self.document())
                 if lang == "blink":
                     self.highlighter = blinkhighlighter.KSBlinkHighlighter(self.document())
                     self.highlighter.setStyle(config.prefs["code_style_blink"])
@@ -620,19 +962,169 @@ class KSScriptEditor(QtWidgets.QPlainTextEdit):
                 else:
                     self.setColorStyle("default")
                     self.code_language = None
+                    self.updateSemanticLayer()
                     return
+                if big_document:
+                    self.highlighter.startLazy()
+                    self.highlightVisibleBlocks()
             self.code_language = lang
+            self.updateSemanticLayer()
         else:
             logging.debug("Lang type not valid: " + str(type(lang)))
 
+    def updateSemanticLayer(self):
+        """ Starts or stops the semantic highlighting, depending on the code language and the prefs. """
+        enabled = self.code_language == "python" and config.prefs["se_semantic_highlighting"]
+        if self.semantic_layer is not None and not enabled:
+            self.semantic_layer.stop()
+            self.semantic_layer.deleteLater()
+            self.semantic_layer = None
+        if enabled and self.semantic_layer is None:
+            self.semantic_layer = semantic.KSSemanticLayer(self)
+            self.semantic_layer.startAnalysis()
+
+
+class KSCursorContext(object):
+    """
+    Block-local view of the text around a cursor. Only the blocks where its selection starts and ends are read,
+    so it costs the same whatever the size of the document.
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.position = cursor.position()
+        self.anchor = cursor.anchor()
+        start = cursor.selectionStart()
+        end = cursor.selectionEnd()
+        self.first_block = lineops.block_at(cursor, start)
+        self.last_block = self.first_block if end == start else lineops.block_at(cursor, end)
+        self.line_before = self.first_block.text()[:start - self.first_block.position()]  # Before the selection
+        self.line_after = self.last_block.text()[end - self.last_block.position():]  # After the selection
+        self.selection = cursor.selection().toPlainText() if cursor.hasSelection() else ""
+
+    @property
+    def first_line(self):
+        """ Whether the selection starts on the first line of the document. """
+        return not self.first_block.previous().isValid()
+
+    @property
+    def last_line(self):
+        """ Whether the selection ends on the last line of the document. """
+        return not self.last_block.next().isValid()
+
+    def before(self):
+        """ The text before the selection, as far as its line goes. Starts with a newline if there's a line above. """
+        return self.line_before if self.first_line else "\n" + self.line_before
+
+    def after(self):
+        """ The text after the selection, as far as its line goes. Ends with a newline if there's a line below. """
+        return self.line_after if self.last_line else self.line_after + "\n"
+
 
 class KSLineNumberArea(QtWidgets.QWidget):
+    """
+    Line number gutter of a KSScriptEditor. Keeps what painting the numbers needs between repaints: the font and its
+    metrics, and the numbers already rendered to pixmaps, so repainting a line is a single pixmap blit.
+    """
+
+    max_cached_numbers = 2000
+
     def __init__(self, script_editor):
         super(KSLineNumberArea, self).__init__(script_editor)
 
         self.scriptEditor = script_editor
         self.setStyleSheet("text-align: center;")
 
+        self.style_args = None  # The arguments of the last setStyle
+        self.style_key = None
+        self.numbers_font = None
+        self.font_metrics = None
+        self.colors = ()
+        self.number_pixmaps = {}  # (number, current line) -> (pixmap, width)
+
+    def setStyle(self, font, font_size, color, current_color):
+        """
+        Sets the font (at font_size, if given) and colors of the numbers. Rendered numbers are kept if unchanged.
+        Called by the editor when the font or colors change (and here when the pixel ratio does), never on paint.
+        """
+        self.style_args = (font, font_size, color, current_color)
+        key = (font.toString(), font_size, color.rgba(), current_color.rgba(), self.pixelRatio())
+        if key == self.style_key:
+            return
+        self.style_key = key
+        self.numbers_font = QtGui.QFont(font)
+        if font_size is not None:
+            self.numbers_font.setPointSize(font_size)
+        self.font_metrics = QtGui.QFontMetrics(self.numbers_font)
+        self.colors = (color, current_color)
+        self.number_pixmaps = {}
+
+    def pixelRatio(self):
+        return self.devicePixelRatioF() if hasattr(self, "devicePixelRatioF") else 1
+
+    def numberPixmap(self, number, current=False):
+        """ Returns (pixmap, width) with the number rendered, in the current line's color if current. """
+        key = (number, current)
+        cached = self.number_pixmaps.get(key)
+        if cached is not None:
+            return cached
+        if len(self.number_pixmaps) >= self.max_cached_numbers:
+            self.number_pixmaps = {}
+
+        text = str(number)
+        ratio = self.pixelRatio()
+        width = self.font_metrics.horizontalAdvance(text)
+        height = self.font_metrics.height()
+        pixmap = QtGui.QPixmap(int(width * ratio) + 1, int(height * ratio) + 1)
+        if ratio != 1:
+            pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        painter.setFont(self.numbers_font)
+        painter.setPen(self.colors[current])
+        painter.drawText(0, self.font_metrics.ascent(), text)
+        painter.end()
+
+        self.number_pixmaps[key] = (pixmap, width)
+        return pixmap, width
+
+    def foldMarkerPixmap(self, width, folded=False):
+        """ Returns the fold marker (an arrow, pointing right if folded or down if not) for a line, as a pixmap. """
+        key = ("fold", width, folded)
+        cached = self.number_pixmaps.get(key)
+        if cached is not None:
+            return cached
+        ratio = self.pixelRatio()
+        height = self.font_metrics.height()
+        pixmap = QtGui.QPixmap(int(width * ratio) + 1, int(height * ratio) + 1)
+        if ratio != 1:
+            pixmap.setDevicePixelRatio(ratio)
+        pixmap.fill(QtCore.Qt.transparent)
+        size = min(width - 2, height) / 2.0
+        x, y = width / 2.0, height / 2.0
+        if folded:
+            points = [(x - size / 2, y - size), (x + size / 2, y), (x - size / 2, y + size)]
+        else:
+            points = [(x - size, y - size / 2), (x + size, y - size / 2), (x, y + size / 2)]
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(self.colors[folded])
+        painter.drawPolygon(QtGui.QPolygonF([QtCore.QPointF(*point) for point in points]))
+        painter.end()
+
+        self.number_pixmaps[key] = pixmap
+        return pixmap
+
+    def event(self, event):
+        # Moved to a screen with another pixel ratio: the numbers are rendered again
+        if event.type() == SCREEN_CHANGE_EVENT and self.style_args is not None:
+            self.setStyle(*self.style_args)
+        return super(KSLineNumberArea, self).event(event)
+
     def paintEvent(self, event):
         self.scriptEditor.lineNumberAreaPaintEvent(event)
         return
+
+    def mousePressEvent(self, event):
+        self.scriptEditor.lineNumberAreaMousePressEvent(event)
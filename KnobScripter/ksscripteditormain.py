@@ -11,7 +11,7 @@ adrianpueyo.com
 
 import nuke
 import re
-import sys
+import zlib
 
 try:
     if nuke.NUKE_VERSION_MAJOR < 11:
@@ -24,14 +24,17 @@ except ImportError:
     from Qt import QtCore, QtGui, QtWidgets
 
 
-from KnobScripter.ksscripteditor import KSScriptEditor
-from KnobScripter import keywordhotbox, content, dialogs
+from KnobScripter.ksscripteditor import KSScriptEditor, KSCursorContext
+from KnobScripter.kshighlighter import is_long_line
+from KnobScripter import keywordhotbox, content, dialogs, config, symbols, introspection, apiindex, completion, usage
 
-def best_ending_match(text, match_list):
+def best_ending_match(text, match_list, scores=None):
     '''
     If the text ends with a key in the match_list, it returns the key and value.
     match_list example: [["ban","banana"],["ap","apple"],["or","orange"]]
     If there are several matches, returns the longest one.
+    Among equally long ones (the same key, in the language's snippets and in "all"), returns the most used one,
+    given their usage scores ({snippet_usage_name: score}, see usage.py).
     Except if one starts with space, in which case return the other.
     False if no matches.
     '''
@@ -49,11 +52,20 @@ def best_ending_match(text, match_list):
         return False
 
     # 2. If multiple matches, decide which is the best one
-    # Order by length
-    ending_matches = sorted(ending_matches, key = lambda a: len(a[0]))
+    # Order by length, then by usage
+    scores = scores or {}
+    ending_matches = sorted(ending_matches, key = lambda a: (len(a[0]), scores.get(snippet_usage_name(*a), 0)))
 
     return ending_matches[-1]
 
+def snippet_usage_name(key, snippet):
+    '''
+    Returns the name a snippet's usage is recorded under: its key and a checksum of its text, so different snippets
+    with the same key don't share it.
+    '''
+    data = snippet if isinstance(snippet, bytes) else snippet.encode("utf-8")
+    return u"{0}\t{1:08x}".format(key, zlib.crc32(data) & 0xffffffff)
+
 def get_last_word(text):
     '''
     Return the last word (azAZ09_) appearing in the text or False.
@@ -76,6 +88,12 @@ class KSScriptEditorMain(KSScriptEditor):
         self.script_output = output
         self.nukeCompleter = None
         self.currentNukeCompletion = None
+        self.completion_enabled = True  # Off in large file mode
+
+        # Names defined in the document, for completion
+        self.symbol_index = symbols.KSSymbolIndex(self)
+        self.document_slots.append(self.symbol_index.update)
+        self.document().contentsChange.connect(self.symbol_index.update)
 
         ########
         # FROM NUKE's SCRIPT EDITOR START
@@ -87,10 +105,9 @@ class KSScriptEditorMain(KSScriptEditor):
         self.nukeCompleter.setWidget(self)
         self.nukeCompleter.setCompletionMode(QtWidgets.QCompleter.UnfilteredPopupCompletion)
         self.nukeCompleter.setCaseSensitivity(Qt.CaseSensitive)
-        try:
-            self.nukeCompleter.setModel(QtGui.QStringListModel())
-        except:
-            self.nukeCompleter.setModel(QtCore.QStringListModel())
+        self.completion_model = completion.KSCompletionModel(self)  # Ranked matches (see completion.py)
+        self.completion_search = completion.KSCompletionSearch()
+        self.nukeCompleter.setModel(self.completion_model)
 
         self.nukeCompleter.activated.connect(self.insertNukeCompletion)
         self.nukeCompleter.highlighted.connect(self.completerHighlightChanged)
@@ -98,6 +115,11 @@ class KSScriptEditorMain(KSScriptEditor):
         # FROM NUKE's SCRIPT EDITOR END
         ########
 
+    def swapDocument(self, state=None):
+        old_state = super(KSScriptEditorMain, self).swapDocument(state)
+        self.symbol_index.reset()
+        return old_state
+
     def placeholderToEnd(self, text, placeholder):
         '''Returns distance (int) from the first ocurrence of the placeholder, to the end of the string with placeholders removed'''
         search = re.search(placeholder, text)
@@ -175,11 +197,15 @@ class KSScriptEditorMain(KSScriptEditor):
 
     def keyPressEvent(self, event):
 
-        ctrl = bool(event.modifiers() & Qt.ControlModifier)
-        alt = bool(event.modifiers() & Qt.AltModifier)
-        shift = bool(event.modifiers() & Qt.ShiftModifier)
+        ctrl = bool(int(event.modifiers()) & int(Qt.ControlModifier))
+        alt = bool(int(event.modifiers()) & int(Qt.AltModifier))
+        shift = bool(int(event.modifiers()) & int(Qt.ShiftModifier))
         key = event.key()
 
+        # Call tip of the function being opened
+        if event.text() == "(" and self.completion_enabled and self.knobScripter.code_language == "python":
+            self.showCallTip()
+
         # ADAPTED FROM NUKE's SCRIPT EDITOR:
         # Get completer state
         self.nukeCompleterShowing = self.nukeCompleter.popup().isVisible()
@@ -216,19 +242,7 @@ class KSScriptEditorMain(KSScriptEditor):
             else:
                 QtWidgets.QPlainTextEdit.keyPressEvent(self, event)
                 # Edit completion model
-                colNum = tc.columnNumber()
-                posNum = tc.position()
-                inputText = self.toPlainText()
-                inputTextSplit = inputText.splitlines()
-                runningLength = 0
-                currentLine = None
-                for line in inputTextSplit:
-                    length = len(line)
-                    runningLength += length
-                    if runningLength >= posNum:
-                        currentLine = line
-                        break
-                    runningLength += 1
+                currentLine = tc.block().text()
                 if currentLine:
                     completionPart = currentLine.split(" ")[-1]
                     if "(" in completionPart:
@@ -245,14 +259,13 @@ class KSScriptEditorMain(KSScriptEditor):
                 # 1. Set the cursor
                 self.cursor = self.textCursor()
 
-                # 2. Save text before and after
-                cpos = self.cursor.position()
-                text_before_cursor = self.toPlainText()[:cpos]
-                line_before_cursor = text_before_cursor.split('\n')[-1]
+                # 2. Save the text before the cursor, in its line (reading the whole document would be O(n) per Tab)
+                context = KSCursorContext(self.cursor)
+                text_before_cursor = context.before()
+                line_before_cursor = context.line_before
                 # Remove tabs too, so it doesn't count as active space
                 while line_before_cursor.startswith(" "*max(1,self.tab_spaces)):
                     line_before_cursor = line_before_cursor[self.tab_spaces:]
-                text_after_cursor = self.toPlainText()[cpos:]
 
                 # Abort mission if there's a tab or nothing before
                 if any([text_before_cursor.endswith(_) for _ in ["\t","\n"]]) or not len(line_before_cursor.strip()):
@@ -287,7 +300,9 @@ class KSScriptEditorMain(KSScriptEditor):
                     if "all" in content.all_snippets:
                         snippets_all = content.all_snippets["all"]
                     snippets_list = snippets_lang + snippets_all
-                    match_key, match_snippet = best_ending_match(line_before_cursor, snippets_list)
+                    snippets_scope = "snippets/" + self.knobScripter.code_language
+                    match_key, match_snippet = best_ending_match(line_before_cursor, snippets_list,
+                                                                 usage.store().scores(snippets_scope))
                     for i in range(len(match_key)):
                         self.cursor.deletePreviousChar()
                     new_line_before_cursor = text_before_cursor[:-len(match_key)].split('\n')[-1]
@@ -297,17 +312,16 @@ class KSScriptEditorMain(KSScriptEditor):
                     if new_line_before_cursor.endswith("."):
                         word_before_cursor = get_last_word(new_line_before_cursor[:-1].strip())
                     self.addSnippetText(match_snippet,last_word = word_before_cursor)  # Add the appropriate snippet and move the cursor
+                    usage.store().record(snippets_scope, snippet_usage_name(match_key, match_snippet))
                 except:  # Meaning snippet not found...
                     # 3.1. Go with nuke/python completer
-                    if self.knobScripter.code_language in ["python","blink"]:
+                    if self.knobScripter.code_language in ["python","blink"] and self.completion_enabled:
                         # ADAPTED FROM NUKE's SCRIPT EDITOR:
                         tc = self.textCursor()
-                        allCode = self.toPlainText()
                         colNum = tc.columnNumber()
-                        posNum = tc.position()
 
                         # ...and if there's text in the editor
-                        if len(allCode.split()) > 0:
+                        if not self.document().isEmpty():
                             # There is text in the editor
                             currentLine = tc.block().text()
 
@@ -369,30 +383,17 @@ class KSScriptEditorMain(KSScriptEditor):
         lines = text_clean.split("\n")
         text_clean = ""
         for line in lines:
+            if is_long_line(line):
+                continue  # Scanning pathological long lines (i.e. pasted JSON) could hang the completer
             line_clean = '""'.join(line.split('"')[::2])
             line_clean = '""'.join(line_clean.split("'")[::2])
             line_clean = line_clean.split("#")[0]
             text_clean += line_clean + "\n"
 
-        # 3. Split into segments (lines plus ";")
-        segments = re.findall(r"[^\n;]+", text_clean)
-
-        # 4. Go case by case.
-        for s in segments:
-            # Declared vars
-            matches += re.findall(r"([\w.]+)(?=[,\s\w]*=[^=]+$)", s)
-            # Def functions and arguments
-            function = re.findall(r"[\s]*def[\s]+([\w.]+)[\s]*\([\s]*", s)
-            if len(function):
-                matches += function
-                args = re.split(r"[\s]*def[\s]+([\w.]+)[\s]*\([\s]*", s)
-                if len(args) > 1:
-                    args = args[-1]
-                    matches += re.findall(r"(?<![=\"\'])[\s]*([\w.]+)[\s]*(?=[=,)])", args)
-            # Lambda
-            matches += re.findall(r"^[^#]*lambda[\s]+([\w.]+)[\s()\w,]+", s)
-            # Classes
-            matches += re.findall(r"^[^#]*class[\s]+([\w.]+)[\s()\w,]+", s)
+        # 3. Split into segments (lines plus ";"), and go case by case (declared vars, defs and their arguments,
+        # lambdas and classes)
+        for s in symbols.SEGMENT.findall(text_clean):
+            matches += symbols.segment_symbols(s)
         return matches
 
     # Find category in keyword_dict
@@ -414,30 +415,7 @@ class KSScriptEditorMain(KSScriptEditor):
             return self.blinkCompletions(completionPart)
 
     def pythonCompletions(self,completionPart):
-        def findModules(searchString):
-            sysModules = sys.modules
-            globalModules = globals()
-            allModules = dict(sysModules, **globalModules)
-            allKeys = list(set(list(globals().keys()) + list(sys.modules.keys())))
-            allKeysSorted = [x for x in sorted(set(allKeys))]
-
-            if searchString == '':
-                matching = []
-                for x in allModules:
-                    if x.startswith(searchString):
-                        matching.append(x)
-                return matching
-            else:
-                try:
-                    if sys.modules.has_key(searchString):
-                        return dir(sys.modules['%s' % searchString])
-                    elif globals().has_key(searchString):
-                        return dir(globals()['%s' % searchString])
-                    else:
-                        return []
-                except:
-                    return None
-
+        introspector = introspection.cache()
         completerText = completionPart
 
         # Get text before last dot
@@ -447,38 +425,46 @@ class KSScriptEditorMain(KSScriptEditor):
         fragmentSearchString = completerText.split('.')[-1] if completerText.split('.')[
                                                                    -1] != moduleSearchString else ''
 
-        # Get all the modules that match module search string
-        allModules = findModules(moduleSearchString)
-
-        # If no modules found, do a dir
-        if not allModules:
-            if len(moduleSearchString.split('.')) == 1:
-                matchedModules = []
-            else:
-                try:
-                    trimmedModuleSearchString = '.'.join(moduleSearchString.split('.')[:-1])
-                    matchedModules = [x for x in dir(
-                        getattr(sys.modules[trimmedModuleSearchString], moduleSearchString.split('.')[-1])) if
-                                      '__' not in x and x.startswith(fragmentSearchString)]
-                except:
-                    matchedModules = []
+        # Get the names of the modules loaded, or the attributes of the one searched: the ones in the offline API index
+        # (see apiindex.py), which knows them even before importing, plus the live ones found by inspecting it
+        # (cached, see introspection.py), i.e. added by plugins or not in the index at all
+        if moduleSearchString == '':
+            allModules = [introspector.moduleNames(globals())]
         else:
-            matchedModules = [x for x in allModules if '__' not in x and x.startswith(fragmentSearchString)]
-
-        selfObjects = list(set(self.getPyObjects(self.toPlainText())))
-        for i in selfObjects:
-            if i.startswith(completionPart):
-                matchedModules.append(i)
+            module = introspector.resolve(moduleSearchString, globals())
+            allModules = [apiindex.index().names(moduleSearchString),
+                          introspector.attributes(module) if module is not None else []]
+
+        # Rank them (each name once), along with the names defined in the document if not completing an attribute
+        sources = [completion.candidates(names, hide_dunder=True) for names in allModules]
+        if moduleSearchString == '':
+            self.symbol_index.refresh()
+            sources.append(completion.candidates(self.symbol_index.names,
+                                                 key=(id(self.symbol_index), self.symbol_index.version)))
+        matchedModules = self.completion_search.search(fragmentSearchString, sources,
+                                                       **self.usageRanking("completions/python"))
+        if moduleSearchString != '':
+            matchedModules += self.symbol_index.complete(completionPart)
 
         return matchedModules
 
+    def showCallTip(self):
+        """ Shows the signature and doc of the function before the cursor, if it's in the offline API index. """
+        match = re.search(r"[\w.]+$", KSCursorContext(self.textCursor()).line_before)
+        if not match:
+            return
+        tip = apiindex.index().callTip(match.group())
+        if tip:
+            QtWidgets.QToolTip.showText(self.mapToGlobal(self.cursorRect().bottomLeft()), tip, self)
+
     def blinkCompletions(self, completionPart):
-        blink_keywords = content.blink_keywords
-        matchedModules = []
-        for i in blink_keywords:
-            if i.startswith(completionPart):
-                matchedModules.append(i)
-        return matchedModules
+        return self.completion_search.search(completionPart, [completion.candidates(content.blink_keywords)],
+                                             **self.usageRanking("completions/blink"))
+
+    def usageRanking(self, scope):
+        """ Returns the usage scores of a scope and the KSCandidates of their names, to rank completions by. """
+        store = usage.store()
+        return {"scores": store.scores(scope), "used": completion.candidates(store.names(scope))}
 
     def completeNukePartUnderCursor(self, completionPart):
 
@@ -486,7 +472,7 @@ class KSScriptEditorMain(KSScriptEditor):
         completionList = self.completionsForcompletionPart(completionPart)
         if len(completionList) == 0:
             return
-        self.nukeCompleter.model().setStringList(completionList)
+        self.completion_model.setMatches(completionList)
         self.nukeCompleter.setCompletionPrefix(completionPart)
 
         if self.nukeCompleter.popup().isVisible():
@@ -517,12 +503,19 @@ class KSScriptEditorMain(KSScriptEditor):
             else:
                 completionPartFragment = completionPart.split('.')[-1]
 
-            textToInsert = completion[len(completionPartFragment):]
             tc = self.textCursor()
+            if completion.startswith(completionPartFragment):
+                textToInsert = completion[len(completionPartFragment):]
+            else:
+                # A fuzzy match (i.e. "thisNode" for "tN"): replaces the fragment typed
+                tc.movePosition(QtGui.QTextCursor.Left, QtGui.QTextCursor.KeepAnchor, len(completionPartFragment))
+                tc.removeSelectedText()
+                textToInsert = completion
             if self.code_language == "python":
                 tc.insertText(textToInsert)
             elif self.code_language == "blink":
                 self.addSnippetText(textToInsert)
+            usage.store().record("completions/" + self.code_language, completion)  # Ranks it higher next time
         return
 
     def completerHighlightChanged(self, highlighted):
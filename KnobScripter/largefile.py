@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+""" Large file mode for the KnobScripter's script mode.
+
+Scripts from ks_large_file_mb megabytes on (i.e. multi-megabyte generated scripts) aren't read and set in one go,
+which would block Nuke: the KSChunkedLoader appends them to the editor in chunks, in short time slices, reporting
+its progress. While a large file is open, some features are degraded (DEGRADED_FEATURES), which the
+KSLargeFileBanner tells the user about.
+
+adrianpueyo.com
+
+"""
+
+import io
+import os
+import time
+import nuke
+
+try:
+    if nuke.NUKE_VERSION_MAJOR < 11:
+        from PySide import QtCore, QtGui, QtGui as QtWidgets
+        from PySide.QtCore import Qt
+    else:
+        from PySide2 import QtWidgets, QtGui, QtCore
+        from PySide2.QtCore import Qt
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+from KnobScripter import config
+
+DEGRADED_FEATURES = ["syntax highlighting", "completion", "autosave diffing"]
+
+
+def is_large_file(path):
+    """ Whether the file at path should be opened in large file mode. """
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+    return size >= config.prefs["ks_large_file_mb"] * 1024 * 1024
+
+
+def file_signature(path):
+    """
+    Returns (path, size, modification time) of a file, or None if it doesn't exist. Two equal signatures mean the
+    file didn't change in between, without reading it.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return path, stat.st_size, stat.st_mtime
+
+
+def size_label(size):
+    """ Returns a readable label for a size in bytes, i.e. "12.3 MB". """
+    return "{0:.1f} MB".format(size / (1024.0 * 1024.0))
+
+
+class KSChunkedLoader(QtCore.QObject):
+    """
+    Loads a text file into a script editor in chunks of chunk_chars characters, from a timer, for time_slice seconds
+    at a time, so the UI keeps responding. The editor is read-only and without undo history while loading.
+    """
+
+    progress = QtCore.Signal(int)  # Percentage
+    finished = QtCore.Signal()
+
+    chunk_chars = 64 * 1024
+    time_slice = 0.03
+
+    def __init__(self, editor, path, parent=None):
+        super(KSChunkedLoader, self).__init__(parent)
+        self.editor = editor
+        self.path = path
+        self.size = max(1, os.path.getsize(path))
+        self.file = None
+        self.read_only = editor.isReadOnly()
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.step)
+
+    def start(self):
+        self.file = io.open(self.path, "r", encoding="utf-8")
+        self.editor.setReadOnly(True)
+        self.editor.setUndoRedoEnabled(False)
+        self.editor.setPlainText("")
+        self.progress.emit(0)
+        self.timer.start()
+
+    def isLoading(self):
+        return self.file is not None
+
+    def step(self):
+        """ Appends the next chunks of the file to the editor, for time_slice seconds at most. """
+        deadline = time.time() + self.time_slice
+        cursor = QtGui.QTextCursor(self.editor.document())
+        cursor.movePosition(QtGui.QTextCursor.End)
+        while time.time() < deadline:
+            chunk = self.file.read(self.chunk_chars)
+            if not chunk:
+                self.stop()
+                self.progress.emit(100)
+                self.finished.emit()
+                return
+            cursor.insertText(chunk)
+        self.progress.emit(min(99, int(100 * self.file.buffer.tell() / self.size)))
+
+    def stop(self):
+        """ Stops loading (what's loaded so far stays in the editor), and restores the editor. """
+        self.timer.stop()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.editor.setUndoRedoEnabled(True)
+            self.editor.setReadOnly(self.read_only)
+
+
+class KSLargeFileBanner(QtWidgets.QFrame):
+    """ Banner above the script editor telling that a large file is open, which features are off, and the loading. """
+
+    def __init__(self, parent=None):
+        super(KSLargeFileBanner, self).__init__(parent)
+        self.setStyleSheet("background:#4a3b22;color:#EEE;")
+        layout = QtWidgets.QHBoxLayout()
+        layout.setContentsMargins(6, 2, 6, 2)
+        self.label = QtWidgets.QLabel()
+        layout.addWidget(self.label)
+        layout.addStretch()
+        self.progress_bar = QtWidgets.QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setFixedWidth(120)
+        self.progress_bar.setFixedHeight(14)
+        layout.addWidget(self.progress_bar)
+        self.setLayout(layout)
+        self.setVisible(False)
+
+    def showFile(self, path):
+        """ Shows the banner for the file at path, while it loads. """
+        self.label.setText("Large file mode ({0}): {1} off.".format(
+            size_label(os.path.getsize(path)), ", ".join(DEGRADED_FEATURES)))
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(True)
+        self.setVisible(True)
+
+    def setProgress(self, value):
+        self.progress_bar.setValue(value)
+        self.progress_bar.setVisible(value < 100)
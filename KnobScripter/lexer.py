@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+""" Lexer: KnobScripter's fast lexing core, shared by the syntax highlighters.
+
+Instead of running every highlighting rule over a block of text (one full scan per rule), a RuleSet
+compiles an ordered list of rules into a single regex alternation, so each block is scanned only once,
+left to right. On top of it, a BlockLexer handles the delimited regions (strings, comments...) that can span
+several blocks, and keeps a compact integer state per block so each block can be lexed on its own.
+This module doesn't depend on Qt, so it can be used (and benchmarked) on its own.
+
+adrianpueyo.com
+
+"""
+
+import re
+from collections import OrderedDict
+
+
+class RuleSet(object):
+    """
+    Ordered highlighting rules compiled into one combined regex alternation.
+
+    Each rule is a tuple (pattern, kinds):
+        - pattern (str): Regular expression to match.
+        - kinds (str, tuple or None): The kind (i.e. "keyword") given to the whole match, or a tuple with one kind
+          per capturing group in the pattern. None means that the match (or group) is consumed but not formatted.
+
+    Rules are in order of precedence: when several rules match at the same position, the first one wins.
+    When a rule only formats some of its groups, the text around them is scanned again, so other rules
+    still apply there (i.e. the "def" in "def foo" is a keyword, and "foo" the function name).
+    """
+
+    def __init__(self, rules, flags=0):
+        self.rules = list(rules)
+        self.groups = dict()  # Outer group index -> list of (group index, kind) to format
+
+        patterns = []
+        group_index = 1
+        for i, (pattern, kinds) in enumerate(self.rules):
+            inner_groups = re.compile(pattern, flags).groups
+            if kinds is None or isinstance(kinds, str):
+                self.groups[group_index] = [(group_index, kinds)]
+            else:
+                if len(kinds) > inner_groups:
+                    raise ValueError("Rule {0} has more kinds than groups: {1}".format(i, pattern))
+                self.groups[group_index] = [(group_index + 1 + j, kind) for j, kind in enumerate(kinds)]
+            patterns.append("({0})".format(pattern))
+            group_index += 1 + inner_groups
+
+        self.regex = re.compile("|".join(patterns), flags)
+
+    def scan(self, text, pos=0, endpos=None):
+        """ Returns a list of (start, length, kind) runs for the given text, found in a single pass. """
+        runs = []
+        if endpos is None:
+            endpos = len(text)
+        self._scan(text, pos, endpos, runs)
+        return runs
+
+    def _scan(self, text, pos, endpos, runs):
+        search = self.regex.search
+        groups = self.groups
+        while pos < endpos:
+            match = search(text, pos, endpos)
+            if match is None:
+                return
+            start, end = match.span()
+            cursor = start
+            for group, kind in groups[match.lastindex]:
+                group_start, group_end = match.span(group)
+                if group_end <= group_start:
+                    continue
+                if group_start > cursor:
+                    # Text before the group is left for the other rules
+                    self._scan(text, cursor, group_start, runs)
+                if kind is not None:
+                    runs.append((group_start, group_end - group_start, kind))
+                cursor = group_end
+            if start < cursor < end:
+                self._scan(text, cursor, end, runs)
+            pos = max(end, start + 1)
+
+
+class Region(object):
+    """
+    A delimited region of text, such as a string or a comment, which is lexed as a single run.
+
+    Args:
+        kind (str): Kind of the run (i.e. "string").
+        start (str): Pattern of the opening delimiter.
+        end (str, optional): Pattern of the closing delimiter. None means the region runs until the end of the line.
+        state (int, optional): Block state while the region is left open at the end of a block.
+        multiline (bool, optional): Whether the region can span several blocks (i.e. triple-quoted strings).
+        escape (bool, optional): Whether a backslash escapes the next character.
+        continuation (bool, optional): Whether a backslash at the end of the block continues the region
+            on the next block, even if not multiline.
+    """
+
+    def __init__(self, kind, start, end=None, state=0, multiline=False, escape=False, continuation=False):
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self.state = state
+        self.multiline = multiline
+        self.escape = escape
+        self.continuation = continuation
+        if end is None:
+            self.end_regex = None
+        elif escape:
+            self.end_regex = re.compile(r"(\\[\s\S])|(?:{0})".format(end))
+        else:
+            self.end_regex = re.compile(end)
+
+    def find_end(self, text, pos):
+        """ Returns (end, state): where the region ends in text (from pos), and the state it leaves open. """
+        if self.end_regex is not None:
+            for match in self.end_regex.finditer(text, pos):
+                if not self.escape or match.group(1) is None:
+                    return match.end(), 0
+        end = len(text)
+        if self.multiline:
+            return end, self.state
+        if self.continuation and (end - len(text.rstrip("\\"))) % 2:
+            return end, self.state
+        return end, 0
+
+
+class BlockLexer(object):
+    """
+    Lexes one block (line) at a time, given the state the previous block left open.
+
+    Delimited regions (strings, comments...) are found first, and the code between them is scanned with
+    the RuleSet. The state is a small integer (0 = nothing open, otherwise the state of the open Region),
+    meant to be stored per block through QSyntaxHighlighter.setCurrentBlockState. As the output of a block
+    only depends on its text and incoming state, QSyntaxHighlighter re-lexes the edited blocks only, and
+    stops as soon as a block's output state is the same as it was before.
+    """
+
+    def __init__(self, regions, rules=None, flags=0):
+        self.regions = dict()
+        self.states = dict()
+        self.rules = rules
+
+        patterns = []
+        for i, region in enumerate(regions):
+            name = "region{0}".format(i)
+            self.regions[name] = region
+            if region.state:
+                self.states[region.state] = region
+            patterns.append("(?P<{0}>{1})".format(name, region.start))
+        self.start_regex = re.compile("|".join(patterns), flags)
+
+    def scan(self, text, state=0):
+        """ Returns (runs, state): the (start, length, kind) runs of the block, and the state left open. """
+        runs = []
+        pos = 0
+        end = len(text)
+
+        # 1. Finish the region left open by the previous block
+        if state > 0 and state in self.states:
+            region = self.states[state]
+            pos, state = region.find_end(text, 0)
+            if pos:
+                runs.append((0, pos, region.kind))
+            if state:
+                return runs, state
+
+        # 2. Regions and the code between them
+        search = self.start_regex.search
+        while pos < end:
+            match = search(text, pos)
+            code_end = match.start() if match else end
+            if code_end > pos and self.rules is not None:
+                self.rules._scan(text, pos, code_end, runs)
+            if match is None:
+                break
+            region = self.regions[match.lastgroup]
+            pos, state = region.find_end(text, match.end())
+            runs.append((code_end, pos - code_end, region.kind))
+            if state:
+                return runs, state
+        return runs, 0
+
+
+class RunCache(object):
+    """
+    LRU cache of lexed blocks: maps a key such as (language, text, incoming state) to its (runs, state).
+
+    Script code is very repetitive (the same "n = nuke.thisNode()" appears everywhere), so repeated or unchanged
+    lines skip the regexes entirely. The memory used is estimated per entry and kept under max_bytes, evicting the
+    least recently used entries first.
+    """
+
+    ENTRY_BYTES = 200  # Rough cost of an entry: key and value tuples, dict and LRU bookkeeping
+    RUN_BYTES = 72  # Rough cost of each (start, length, kind) run
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> ((runs, state), size)
+
+    def get(self, key):
+        """ Returns the cached (runs, state) for the key, or None. """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries[key] = entry  # Most recently used go last
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, runs, state, text_length=0):
+        """ Caches the runs (as a tuple, as they're shared) and state for the key. Returns them. """
+        value = (tuple(runs), state)
+        size = self.ENTRY_BYTES + text_length + self.RUN_BYTES * len(runs)
+        if size > self.max_bytes:
+            return value
+        old_entry = self._entries.pop(key, None)
+        if old_entry is not None:
+            self.size -= old_entry[1]
+        self._entries[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, old_size) = self._entries.popitem(last=False)
+            self.size -= old_size
+            self.evictions += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self):
+        """ Returns a dict with the counters of the cache. """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": float(self.hits) / lookups if lookups else 0.0,
+        }
+
+
+def words_pattern(words):
+    """ Returns a pattern matching any of the given words as a whole word. Longest words go first. """
+    words = sorted(set(words), key=len, reverse=True)
+    return r"\b(?:{0})\b".format("|".join(re.escape(w) for w in words))
+
+
+def symbols_pattern(symbols):
+    """ Returns a pattern matching any of the given symbols (i.e. operators). Longest symbols go first. """
+    symbols = sorted(set(symbols), key=len, reverse=True)
+    return "|".join(re.escape(s) for s in symbols)
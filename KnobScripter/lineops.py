@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+""" Line operations for the KnobScripter script editors: indent, unindent, comment, duplicate and move lines.
+
+Every operation works on a range of block numbers (first to last, both included) of a QTextDocument. It builds
+the new text of the lines in python, and replaces the span that differs with a single QTextCursor edit, so it's one
+undo step and one relayout however many lines change, and the rest of the document isn't copied nor set again.
+
+adrianpueyo.com
+
+"""
+
+import nuke
+
+try:
+    if nuke.NUKE_VERSION_MAJOR < 11:
+        from PySide import QtCore, QtGui, QtGui as QtWidgets
+        from PySide.QtCore import Qt
+    else:
+        from PySide2 import QtWidgets, QtGui, QtCore
+        from PySide2.QtCore import Qt
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+
+def block_at(cursor, position):
+    """
+    Returns the QTextBlock at a position of the cursor's document. It's found through a copy of the cursor rather
+    than cursor.document(), as some PySide2 builds delete the document returned along with a temporary cursor.
+    """
+    if position == cursor.position():
+        return cursor.block()
+    cursor = QtGui.QTextCursor(cursor)
+    cursor.setPosition(position)
+    return cursor.block()
+
+
+def block_range(cursor):
+    """ Returns the first and last block numbers of the lines the cursor's selection spans. """
+    first = block_at(cursor, cursor.selectionStart()).blockNumber()
+    if not cursor.hasSelection():
+        return first, first
+    return first, block_at(cursor, cursor.selectionEnd()).blockNumber()
+
+
+def changed_blocks(document, position, added, old_count):
+    """
+    For a contentsChange(position, removed, added) of a document that had old_count blocks, returns the first and
+    last block numbers changed, and the number the last one had before the change. Returns None if they don't add up
+    (i.e. a change wasn't notified), so the caller has to start over.
+    """
+    count = document.blockCount()
+    first = document.findBlock(position).blockNumber()
+    end_block = document.findBlock(position + added)
+    last = end_block.blockNumber() if end_block.isValid() else count - 1
+    old_last = last - (count - old_count)
+    if first < 0 or old_last < first - 1 or old_last >= old_count:
+        return None
+    return first, last, old_last
+
+
+def line_texts(document, first, last):
+    """ Returns the texts of the lines from first to last, read with a single selection rather than block by block. """
+    cursor = QtGui.QTextCursor(document.findBlockByNumber(first))
+    last_block = document.findBlockByNumber(last)
+    cursor.setPosition(last_block.position() + last_block.length() - 1, QtGui.QTextCursor.KeepAnchor)
+    return cursor.selectedText().split(u"\u2029")  # selectedText separates the blocks with paragraph separators
+
+
+def lines_text(document, first, last):
+    """ Returns the text of the lines from first to last, joined by newlines. """
+    return "\n".join(line_texts(document, first, last))
+
+
+def indentation(text):
+    """ Returns the number of leading spaces of a line. """
+    return len(text) - len(text.lstrip(" "))
+
+
+def common_prefix(a, b):
+    """ Returns the length of the common start of two strings. """
+    length = min(len(a), len(b))
+    if a[:length] == b[:length]:
+        return length
+    low, high = 0, length  # The common start is at least low characters long, and shorter than high
+    while high - low > 1:
+        middle = (low + high) // 2
+        if a[:middle] == b[:middle]:
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def replace_lines(document, first, old_texts, texts):
+    """
+    Replaces the lines from first on, which have the texts old_texts (see line_texts), with texts (as many), in a
+    single edit of the span that differs. Cursors before or after it aren't disturbed, so a one-line change moves
+    them as typing it would.
+    """
+    start, end = 0, len(old_texts)
+    while start < end and old_texts[start] == texts[start]:
+        start += 1
+    while end > start and old_texts[end - 1] == texts[end - 1]:
+        end -= 1
+    if start == end:
+        return
+    # The common start and end are looked for in the first and last lines that differ, not in the whole span
+    prefix = common_prefix(old_texts[start], texts[start])
+    old_last, last = old_texts[end - 1], texts[end - 1]
+    if end - 1 == start:
+        old_last, last = old_last[prefix:], last[prefix:]
+    suffix = common_prefix(old_last[::-1], last[::-1])
+    old_length = sum(len(text) for text in old_texts[start:end]) + end - start - 1
+    new_text = "\n".join(texts[start:end])
+    position = document.findBlockByNumber(first + start).position() + prefix
+    cursor = QtGui.QTextCursor(document)
+    cursor.beginEditBlock()
+    cursor.setPosition(position)
+    cursor.setPosition(position + old_length - prefix - suffix, QtGui.QTextCursor.KeepAnchor)
+    cursor.insertText(new_text[prefix:len(new_text) - suffix])
+    cursor.endEditBlock()
+
+
+def remove_text(cursor, position, length):
+    cursor.setPosition(position)
+    cursor.setPosition(position + length, QtGui.QTextCursor.KeepAnchor)
+    cursor.removeSelectedText()
+
+
+def insert_text(cursor, position, text):
+    cursor.setPosition(position)
+    cursor.insertText(text)
+
+
+def indent(document, first, last, spaces):
+    """ Adds an indentation level (spaces) at the start of the lines. """
+    prefix = " " * spaces
+    texts = line_texts(document, first, last)
+    replace_lines(document, first, texts, [prefix + text for text in texts])
+
+
+def unindent(document, first, last, spaces):
+    """ Removes an indentation level from the lines: the given spaces if the line starts with them, or else one. """
+
+    def unindented(text):
+        length = min(indentation(text), spaces)
+        if 0 < length < spaces:
+            length = 1
+        return text[length:]
+
+    texts = line_texts(document, first, last)
+    replace_lines(document, first, texts, [unindented(text) for text in texts])
+
+
+def toggle_comment(document, first, last, prefix="#"):
+    """
+    Comments the lines out with the prefix, placed at their lowest indentation. If all of them (but the blank
+    ones) are already commented, uncomments them instead. Returns True if the lines got commented.
+    """
+    texts = line_texts(document, first, last)
+    code = [text for text in texts if text.strip()]
+    if not code:
+        return False
+
+    if all(text.lstrip().startswith(prefix) for text in code):
+        def uncommented(text):
+            column = indentation(text)
+            return text[:column] + text[column + len(prefix):] if text.strip() else text
+        replace_lines(document, first, texts, [uncommented(text) for text in texts])
+        return False
+
+    column = min(indentation(text) for text in code)
+    replace_lines(document, first, texts, [text[:column] + prefix + text[column:] if text.strip() else text
+                                           for text in texts])
+    return True
+
+
+def duplicate(document, first, last):
+    """ Inserts a copy of the lines below them. Returns the length of the inserted text. """
+    text = "\n" + lines_text(document, first, last)
+    last_block = document.findBlockByNumber(last)
+    cursor = QtGui.QTextCursor(document)
+    cursor.beginEditBlock()
+    insert_text(cursor, last_block.position() + last_block.length() - 1, text)
+    cursor.endEditBlock()
+    return len(text)
+
+
+def move(document, first, last, direction):
+    """
+    Moves the lines one line up (direction -1) or down (direction 1), swapping them with the line they move over.
+    Returns how many characters the lines moved (negative if up), or 0 if they can't move.
+    """
+    first_block = document.findBlockByNumber(first)
+    last_block = document.findBlockByNumber(last)
+    cursor = QtGui.QTextCursor(document)
+    if direction < 0:
+        other = first_block.previous()
+        if not other.isValid():
+            return 0
+        text = other.text()
+        cursor.beginEditBlock()
+        remove_text(cursor, other.position(), other.length())  # The line above, and its newline
+        insert_text(cursor, last_block.position() + last_block.length() - 1, "\n" + text)
+        cursor.endEditBlock()
+        return -len(text) - 1
+    else:
+        other = last_block.next()
+        if not other.isValid():
+            return 0
+        text = other.text()
+        cursor.beginEditBlock()
+        remove_text(cursor, other.position() - 1, other.length())  # The line below, and the newline before it
+        insert_text(cursor, first_block.position(), text + "\n")
+        cursor.endEditBlock()
+        return len(text) + 1
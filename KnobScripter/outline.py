@@ -0,0 +1,347 @@
+# -*- coding: utf-8 -*-
+""" Outline of the python code in a KnobScripter's script editor: classes, functions, methods and top-level assignments.
+
+The KSOutlineIndex keeps the symbols of each top-level statement, relative to the line where the statement starts.
+It's maintained incrementally from QTextDocument.contentsChange: only the statements touched by an edit are
+scanned again, and the ones after it are just shifted by the number of lines added or removed. Symbols are found
+by a regex over the statement (skipping strings and comments), so code that doesn't parse while typing still
+gets its outline. The KSOutlinePanel shows the index as a tree, with click-to-jump.
+
+adrianpueyo.com
+
+"""
+
+import bisect
+import re
+import nuke
+
+try:
+    if nuke.NUKE_VERSION_MAJOR < 11:
+        from PySide import QtCore, QtGui, QtGui as QtWidgets
+        from PySide.QtCore import Qt
+    else:
+        from PySide2 import QtWidgets, QtGui, QtCore
+        from PySide2.QtCore import Qt
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+from KnobScripter import instrumentation
+from KnobScripter.semantic import statement_lines
+
+# Definitions (at any indentation), top-level assignments and other top-level lines, or a string or comment to skip
+SYMBOL = re.compile(r"""
+    (?P<skip>
+        [rRbBuUfF]{0,2}\'\'\'(?:\\.|[^\\])*?\'\'\'
+        |[rRbBuUfF]{0,2}\"\"\"(?:\\.|[^\\])*?\"\"\"
+        |'(?:\\.|[^\\'\n])*'
+        |"(?:\\.|[^\\"\n])*"
+        |\#[^\n]*
+    )
+    |^(?P<indent>[ \t]*)(?:async[ \t]+)?(?P<keyword>def|class)[ \t]+(?P<name>[A-Za-z_]\w*)
+    |^(?P<targets>[A-Za-z_]\w*(?:[ \t]*,[ \t]*[A-Za-z_]\w*)*)[ \t]*(?::[^\n=]*)?=(?!=)
+    |^(?P<top_level>)(?=[A-Za-z_@])
+""", re.MULTILINE | re.VERBOSE)
+
+
+def scan_symbols(text):
+    """
+    Finds the symbols in python code. Returns a list of (line, depth, kind, name), with lines relative to the text.
+    A def directly inside a class is a method. Definitions nest by indentation, within each top-level statement.
+    """
+    result = []
+    stack = []  # (indentation, kind) of the definitions enclosing the current line
+    line = 0
+    position = 0
+    for match in SYMBOL.finditer(text):
+        if match.group("skip") is not None:
+            continue
+        line += text.count("\n", position, match.start())
+        position = match.start()
+        if match.group("keyword") is None:
+            del stack[:]
+            if match.group("targets") is not None:
+                for name in match.group("targets").split(","):
+                    result.append((line, 0, "variable", name.strip()))
+            continue
+        indent = len(match.group("indent").expandtabs(4))
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        if match.group("keyword") == "class":
+            kind = "class"
+        elif stack and stack[-1][1] == "class":
+            kind = "method"
+        else:
+            kind = "function"
+        result.append((line, len(stack), kind, match.group("name")))
+        stack.append((indent, kind))
+    return result
+
+
+def symbol_keys(symbols):
+    """
+    Yields a key for each (line, depth, kind, name) of symbols, which finds the same symbol again after edits move it:
+    the names of the symbols it's inside, its kind and name, and how many symbols with all those came before it.
+    """
+    path = []
+    seen = dict()
+    for line, depth, kind, name in symbols:
+        del path[depth:]
+        key = (tuple(path), kind, name)
+        seen[key] = seen.get(key, -1) + 1
+        path.append(name)
+        yield key + (seen[key],)
+
+
+def block_lines(document, first, last):
+    """ Returns the text of the blocks first to last (excluded) of a QTextDocument, as a list of lines. """
+    lines = []
+    block = document.findBlockByNumber(first)
+    for _ in range(last - first):
+        if not block.isValid():
+            break
+        lines.append(block.text())
+        block = block.next()
+    return lines
+
+
+class KSOutlineIndex(QtCore.QObject):
+    """
+    Symbols of a QTextDocument's python code, by top-level statement. starts is the sorted list of the lines where
+    each statement starts, and symbols the list of (relative line, depth, kind, name) of each statement.
+    Emits changed when the outline changes (not when symbols just move to other lines).
+    """
+
+    changed = QtCore.Signal()
+
+    def __init__(self, document=None, parent=None):
+        super(KSOutlineIndex, self).__init__(parent)
+        self.document = None
+        self.active = False
+        self.starts = []
+        self.symbols = []
+        self.block_count = 0
+        self.setDocument(document)
+
+    def setDocument(self, document):
+        """ Indexes another document (i.e. when the editor's document is swapped). """
+        if self.document is not None and self.active:
+            self.disconnectDocument()
+        self.document = document
+        if self.document is not None and self.active:
+            self.document.contentsChange.connect(self.update)
+            self.rebuild()
+
+    def setActive(self, active=True):
+        """ Only an active index follows the edits. Activating it indexes the whole document again. """
+        if active == self.active or self.document is None:
+            self.active = active
+            return
+        self.active = active
+        if active:
+            self.document.contentsChange.connect(self.update)
+            self.rebuild()
+        else:
+            self.disconnectDocument()
+
+    def disconnectDocument(self):
+        try:
+            self.document.contentsChange.disconnect(self.update)
+        except RuntimeError:
+            pass  # The document was deleted meanwhile
+
+    def rebuild(self):
+        """ Indexes the whole document. """
+        self.block_count = self.document.blockCount()
+        self.starts, self.symbols = self.scan(0, self.block_count)
+        self.changed.emit()
+
+    def scan(self, first, last):
+        """ Scans the blocks first to last (excluded). Returns the starts and symbols of their statements. """
+        lines = block_lines(self.document, first, last)
+        starts = [first + line for line in statement_lines("\n".join(lines))]
+        if not starts or starts[0] != first:
+            starts.insert(0, first)  # Lines before the first statement (i.e. indented, or comments)
+        symbols = [[] for _ in starts]
+        i = 0
+        for line, depth, kind, name in scan_symbols("\n".join(lines)):
+            line += first
+            while i + 1 < len(starts) and starts[i + 1] <= line:
+                i += 1
+            symbols[i].append((line - starts[i], depth, kind, name))
+        return starts, symbols
+
+    def update(self, position, removed, added):
+        """
+        contentsChange slot: scans again the statements from the one containing the edit to the first one after it,
+        and shifts the ones after that by the number of blocks added or removed.
+        """
+        if not self.active:
+            return
+        instrumentation.count("outline_updates")
+        document = self.document
+        block_count = document.blockCount()
+        delta = block_count - self.block_count
+        self.block_count = block_count
+        if not self.starts:
+            return self.rebuild()
+
+        first = document.findBlock(position).blockNumber()
+        end_block = document.findBlock(position + added)
+        last = end_block.blockNumber() if end_block.isValid() else block_count - 1
+
+        # Statements touched: from the one containing the first line, to the first one starting after the last line
+        i = max(0, bisect.bisect_right(self.starts, first) - 1)
+        if i > 0 and self.starts[i] == first:
+            i -= 1  # The edit might make the first line continue the previous statement
+        j = bisect.bisect_right(self.starts, last - delta)
+        scan_first = self.starts[i]
+        scan_last = self.starts[j] + delta if j < len(self.starts) else block_count
+
+        starts, symbols = self.scan(scan_first, scan_last)
+        old_outline = [s[1:] for statement in self.symbols[i:j] for s in statement]
+        new_outline = [s[1:] for statement in symbols for s in statement]
+
+        self.starts[i:j] = starts
+        self.symbols[i:j] = symbols
+        if delta:
+            shifted = self.starts
+            for k in range(i + len(starts), len(shifted)):
+                shifted[k] += delta
+
+        if old_outline != new_outline:
+            self.changed.emit()
+
+    def items(self):
+        """ Yields the (line, depth, kind, name) of every symbol, in order, with absolute line numbers. """
+        for start, symbols in zip(self.starts, self.symbols):
+            for line, depth, kind, name in symbols:
+                yield start + line, depth, kind, name
+
+    def symbolLine(self, number):
+        """ Returns the current line of the symbol number (as ordered in items()), or -1. """
+        for symbol_number, symbol in enumerate(self.items()):
+            if symbol_number == number:
+                return symbol[0]
+        return -1
+
+    def symbolNumber(self, key):
+        """ Returns the number of the symbol with the key (see symbol_keys), or -1 if there's none anymore. """
+        for number, symbol_key in enumerate(symbol_keys(self.items())):
+            if symbol_key == key:
+                return number
+        return -1
+
+
+class KSOutlinePanel(QtWidgets.QWidget):
+    """
+    Side panel with the outline of a script editor's python code, and a filter field. Clicking a symbol moves the
+    editor's cursor to it. The tree is refreshed refresh_ms after the outline changes, and only while visible.
+    """
+
+    refresh_ms = 150
+
+    def __init__(self, editor, parent=None):
+        super(KSOutlinePanel, self).__init__(parent)
+        self.editor = editor
+        self.enabled = True  # Whether the editor's language has an outline
+        self.index = KSOutlineIndex(editor.document(), self)
+        self.keys = []  # symbol_keys of the symbols in the tree, by the number in their items
+
+        self.filter_line_edit = QtWidgets.QLineEdit()
+        self.filter_line_edit.setPlaceholderText("Filter...")
+        self.filter_line_edit.textChanged.connect(self.applyFilter)
+
+        self.tree = QtWidgets.QTreeWidget()
+        self.tree.setHeaderHidden(True)
+        self.tree.setIndentation(12)
+        self.tree.setUniformRowHeights(True)
+        self.tree.setFocusPolicy(Qt.NoFocus)
+        self.tree.itemClicked.connect(self.itemClicked)
+
+        layout = QtWidgets.QVBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(2)
+        layout.addWidget(self.filter_line_edit)
+        layout.addWidget(self.tree)
+        self.setLayout(layout)
+
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(self.refresh_ms)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.index.changed.connect(self.refresh_timer.start)
+
+    def setOutlineEnabled(self, enabled=True):
+        """ Disables the outline (i.e. for blink code, or in large file mode), or enables it again. """
+        self.enabled = enabled
+        self.updateActive()
+        if not enabled:
+            self.tree.clear()
+
+    def updateActive(self):
+        self.index.setActive(self.enabled and self.isVisible())
+
+    def showEvent(self, show_event):
+        self.updateActive()
+        super(KSOutlinePanel, self).showEvent(show_event)
+
+    def hideEvent(self, hide_event):
+        self.updateActive()
+        super(KSOutlinePanel, self).hideEvent(hide_event)
+
+    def refresh(self):
+        """ Fills the tree from the index. """
+        self.refresh_timer.stop()
+        self.tree.clear()
+        symbols = list(self.index.items())
+        self.keys = list(symbol_keys(symbols))
+        fonts = dict()
+        parents = []
+        for number, (line, depth, kind, name) in enumerate(symbols):
+            del parents[depth:]
+            parent = parents[-1] if parents else self.tree
+            item = QtWidgets.QTreeWidgetItem(parent)
+            item.setText(0, name + "()" if kind in ["function", "method"] else name)
+            item.setToolTip(0, "{0} {1}".format(kind, name))
+            item.setData(0, Qt.UserRole, number)
+            if kind == "class":
+                if kind not in fonts:
+                    fonts[kind] = item.font(0)
+                    fonts[kind].setBold(True)
+                item.setFont(0, fonts[kind])
+            parents.append(item)
+        self.tree.expandAll()
+        self.applyFilter()
+
+    def applyFilter(self):
+        """ Hides the symbols not containing the filter text (unless something inside them does). """
+        text = self.filter_line_edit.text().lower()
+
+        def filter_item(item):
+            visible = False
+            for i in range(item.childCount()):
+                visible = filter_item(item.child(i)) or visible
+            visible = visible or text in item.text(0).lower()
+            item.setHidden(not visible)
+            return visible
+
+        for i in range(self.tree.topLevelItemCount()):
+            filter_item(self.tree.topLevelItem(i))
+
+    def itemClicked(self, item, column=0):
+        """ Moves the editor's cursor to the symbol. """
+        number = item.data(0, Qt.UserRole)
+        if self.refresh_timer.isActive():
+            # The numbers of the items might be outdated: find the symbol in the refreshed outline
+            key = self.keys[number] if 0 <= number < len(self.keys) else None
+            self.refresh()
+            number = self.index.symbolNumber(key)
+        line = self.index.symbolLine(number)
+        block = self.editor.document().findBlockByNumber(line)
+        if line < 0 or not block.isValid():
+            return
+        cursor = self.editor.textCursor()
+        cursor.setPosition(block.position())
+        self.editor.setTextCursor(cursor)
+        self.editor.centerCursor()
+        self.editor.setFocus()
@@ -13,7 +13,7 @@ import os
 import nuke
 
 from KnobScripter.info import __version__, __author__, __date__
-from KnobScripter import config, widgets, utils
+from KnobScripter import config, widgets, utils, kshighlighter, apiindex, usage
 
 try:
     if nuke.NUKE_VERSION_MAJOR < 11:
@@ -79,6 +79,17 @@ def clear_py_state_history():
     with open(config.py_state_txt_path, "w") as f:
         json.dump({}, f)
 
+def build_api_index():
+    """ Builds the offline index of the nuke and nukescripts API for the running Nuke version. """
+    count = apiindex.build_index()
+    nuke.message("KnobScripter: Indexed {0} names of {1} for Nuke {2}.".format(
+        count, ", ".join(config.prefs["se_api_index_modules"]), apiindex.nuke_version()))
+
+def clear_usage_history():
+    if not nuke.ask("Are you sure you want to clear the usage history of completions and snippets?"):
+        return
+    usage.store().clear()
+
 class PrefsWidget(QtWidgets.QWidget):
     def __init__(self, knob_scripter="", _parent=QtWidgets.QApplication.activeWindow()):
         super(PrefsWidget, self).__init__(_parent)
@@ -239,6 +250,16 @@ class PrefsWidget(QtWidgets.QWidget):
         self.py_editor_state_box.setLayout(py_editor_state_layout)
         self.form_layout.addRow(".py Editor State:", self.py_editor_state_box)
 
+        # Large file mode
+        self.large_file_box = QtWidgets.QSpinBox()
+        self.large_file_box.setMinimum(1)
+        self.large_file_box.setMaximum(1000)
+        self.large_file_box.setSuffix(" MB")
+        self.large_file_box.setFixedHeight(24)
+        self.large_file_box.setToolTip("Scripts from this size on are loaded in chunks, with syntax highlighting,\n"
+                                       "completion and autosave diffing turned off.")
+        self.form_layout.addRow("Large file mode:", self.large_file_box)
+
 
         # 3.2. Python
         self.form_layout.addRow(" ", None)
@@ -270,6 +291,27 @@ class PrefsWidget(QtWidgets.QWidget):
                                                   "Otherwise, show the internal name only.")
         self.form_layout.addRow("", self.show_knob_labels_checkbox)
 
+        # Semantic highlighting
+        self.semantic_highlighting_checkbox = QtWidgets.QCheckBox("Semantic highlighting")
+        self.semantic_highlighting_checkbox.setToolTip("Analyze the code in the background to highlight\n"
+                                                       "parameters, imported modules and nuke calls.")
+        self.form_layout.addRow("", self.semantic_highlighting_checkbox)
+
+        # API index
+        self.build_api_index_button = QtWidgets.QPushButton("Build API index")
+        self.build_api_index_button.setToolTip("Index the nuke and nukescripts modules once, so completion and\n"
+                                               "call tips don't have to inspect them while typing.\n"
+                                               "Build it again after updating Nuke or the studio modules.")
+        self.build_api_index_button.clicked.connect(build_api_index)
+        self.form_layout.addRow("", self.build_api_index_button)
+
+        # Usage history
+        self.clear_usage_button = QtWidgets.QPushButton("Clear usage history")
+        self.clear_usage_button.setToolTip("Forget which completions and snippets you use most,\n"
+                                           "which are otherwise listed first.")
+        self.clear_usage_button.clicked.connect(clear_usage_history)
+        self.form_layout.addRow("", self.clear_usage_button)
+
         # 3.3. Blink
         self.form_layout.addRow(" ", None)
         self.form_layout.addRow("<b>Blink</b>", QtWidgets.QWidget())
@@ -323,7 +365,7 @@ class PrefsWidget(QtWidgets.QWidget):
     def color_scheme_changed(self):
         config.prefs["code_style_python"] = self.python_color_scheme_combobox.currentData()
         for ks in config.all_knobscripters:
-            if hasattr(ks, 'script_editor'):
+            if hasattr(ks, 'script_editor') and ks.script_editor.highlighter is not None:
                 if ks.script_editor.code_language == "python":
                     ks.script_editor.highlighter.setStyle(config.prefs["code_style_python"])
                 ks.script_editor.highlighter.rehighlight()
@@ -346,9 +388,11 @@ class PrefsWidget(QtWidgets.QWidget):
 
         self.show_knob_labels_checkbox.setChecked(config.prefs["ks_show_knob_labels"] is True)
         self.run_in_context_checkbox.setChecked(config.prefs["ks_run_in_context"] is True)
+        self.semantic_highlighting_checkbox.setChecked(config.prefs["se_semantic_highlighting"] is True)
 
         self.save_knob_editor_state_combobox.setCurrentIndex(config.prefs["ks_save_knob_state"])
         self.save_py_editor_state_combobox.setCurrentIndex(config.prefs["ks_save_py_state"])
+        self.large_file_box.setValue(config.prefs["ks_large_file_mb"])
 
         i = self.python_color_scheme_combobox.findData(config.prefs["code_style_python"])
         if i != -1:
@@ -369,10 +413,12 @@ class PrefsWidget(QtWidgets.QWidget):
             "ks_blink_autosave_on_compile": self.autosave_on_compile_checkbox.isChecked(),
             "ks_save_knob_state": self.save_knob_editor_state_combobox.currentData(),
             "ks_save_py_state": self.save_py_editor_state_combobox.currentData(),
+            "ks_large_file_mb": self.large_file_box.value(),
             "code_style_python": self.python_color_scheme_combobox.currentData(),
             "se_font_family": self.font_box.currentFont().family(),
             "se_font_size": self.font_size_box.value(),
             "se_tab_spaces": self.tab_spaces_combobox.currentData(),
+            "se_semantic_highlighting": self.semantic_highlighting_checkbox.isChecked(),
         }
         return ks_prefs
 
@@ -402,10 +448,12 @@ class PrefsWidget(QtWidgets.QWidget):
     def apply_prefs(self):
         """ Apply the current knob values to the KnobScripters """
         self.save_config()
+        kshighlighter.refresh_styles()
         for ks in config.all_knobscripters:
             ks.script_editor.setFont(config.script_editor_font)
             ks.script_editor.tab_spaces = config.prefs["se_tab_spaces"]
-            ks.script_editor.highlighter.rehighlight()
+            ks.script_editor.refreshHighlighterStyle()  # Only rehighlights if its styles changed
+            ks.script_editor.updateSemanticLayer()
             ks.runInContext = config.prefs["ks_run_in_context"]
             ks.runInContextAct.setChecked(config.prefs["ks_run_in_context"])
             ks.show_labels = config.prefs["ks_show_knob_labels"]
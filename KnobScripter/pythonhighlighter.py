@@ -22,8 +22,10 @@ try:
 except ImportError:
     from Qt import QtCore, QtGui, QtWidgets
 
+from KnobScripter import lexer, semantic
+from KnobScripter.kshighlighter import KSHighlighter
 
-class KSPythonHighlighter(QtGui.QSyntaxHighlighter):
+class KSPythonHighlighter(KSHighlighter):
     """
     Adapted from an original version by Wouter Gilsing. His comments:
     Modified, simplified version of some code found I found when researching:
@@ -39,7 +41,7 @@ class KSPythonHighlighter(QtGui.QSyntaxHighlighter):
 
         self.blocked = False
 
-        self.styles = self.loadStyles()  # Holds a dict for each style
+        self.styles = self.sharedStyles()  # Holds a dict for each style, compiled once per process
         self._style = style  # Can be set via setStyle
         self.setStyle(self._style)  # Set default style
         # self.updateStyle()  # Load ks color scheme
@@ -47,8 +49,9 @@ class KSPythonHighlighter(QtGui.QSyntaxHighlighter):
         super(KSPythonHighlighter, self).__init__(document)
 
     def loadStyles(self):
-        """ Loads the different sets of rules """
+        """ Loads the different styles. They all share the same lexer, and only differ in their formats """
         styles = dict()
+        block_lexer = self.loadLexer()
 
         # LOAD ANY STYLE
         default_styles_list = [
@@ -63,7 +66,6 @@ class KSPythonHighlighter(QtGui.QSyntaxHighlighter):
                     'string': self.format([242, 136, 135]),
                     'comment': self.format([143, 221, 144]),
                 },
-                "keywords": {},
             },
             {
                 "title": "monokai",
@@ -86,35 +88,48 @@ class KSPythonHighlighter(QtGui.QSyntaxHighlighter):
                     'blue': self.format([130, 226, 255], 'italic'),
                     'self': self.format([255, 170, 10], 'italic'),
                 },
-                "keywords": {
-                    'custom': ['nuke'],
-                    'blue': ['def', 'class', 'int', 'str', 'float',
-                             'bool', 'list', 'dict', 'set', ],
-                    'base': [],
-                    'self': ['self'],
-                },
             }
         ]
-        # TODO separate the format before the loadstyle thing. should be done here before looping.
         for style_dict in default_styles_list:
             if all(k in style_dict.keys() for k in ["title", "styles"]):
-                styles[style_dict["title"]] = self.loadStyle(style_dict)
+                styles[style_dict["title"]] = self.loadStyle(style_dict, block_lexer)
 
         return styles
 
-    def loadStyle(self, style_dict):
+    def loadStyle(self, style_dict, block_lexer):
         """
-        Given a dictionary of styles and keywords, returns the style as a dict
+        Given a dictionary of styles, returns the style as a dict: the lexer, and the format for each kind of token
         """
 
         styles = style_dict["styles"].copy()
 
-        # 1. Base settings
         if "base" in styles:
             base_format = styles["base"]
         else:
             base_format = self.format([255, 255, 255])
 
+        # Triple-quoted strings look like comments
+        if 'docstring' not in styles:
+            styles['docstring'] = styles['comment'] if 'comment' in styles else base_format
+
+        # Semantic kinds look like their lexical counterparts (i.e. parameters like the 'argument'), unless defined
+        for kind, lexical_kind in semantic.LEXICAL_KINDS.items():
+            if kind not in styles and lexical_kind in styles:
+                styles[kind] = styles[lexical_kind]
+
+        result = {
+            "lexer": block_lexer,
+            "formats": styles,
+        }
+
+        return result
+
+    def loadLexer(self):
+        """
+        Returns the lexer for python code. Lexing doesn't depend on the style: tokens get a kind (i.e. "keyword")
+        which each style maps to a format, so the same runs can be highlighted with any style.
+        """
+
         main_keywords = [
             'and', 'assert', 'break', 'continue',
             'del', 'elif', 'else', 'except', 'exec', 'finally',
@@ -133,92 +148,59 @@ class KSPythonHighlighter(QtGui.QSyntaxHighlighter):
                           'ValueError', 'ZeroDivisionError',
                           ]
 
-        base_keywords = [',']
-
         operator_keywords = [
             '=', '==', '!=', '<', '<=', '>', '>=',
-            '\+', '-', '\*', '/', '//', '\%', '\*\*',
-            '\+=', '-=', '\*=', '/=', '\%=',
-            '\^', '\|', '\&', '\~', '>>', '<<'
+            '+', '-', '*', '/', '//', '%', '**',
+            '+=', '-=', '*=', '/=', '%=',
+            '^', '|', '&', '~', '>>', '<<'
         ]
 
         singletons = ['True', 'False', 'None']
 
-        if 'comment' in styles:
-            tri_single = (QtCore.QRegExp("'''"), 1, styles['comment'])
-            tri_double = (QtCore.QRegExp('"""'), 2, styles['comment'])
-        else:
-            tri_single = (QtCore.QRegExp("'''"), 1, base_format)
-            tri_double = (QtCore.QRegExp('"""'), 2, base_format)
-
-        # 2. Rules
-        rules = []
-
-        if "argument" in styles:
-            # Everything inside parentheses
-            rules += [(r"def [\w]+[\s]*\((.*)\)", 1, styles['argument'])]
-            # Now restore unwanted stuff...
-            rules += [(i, 0, base_format) for i in base_keywords]
-            rules += [(r"[^\(\w),.][\s]*[\w]+", 0, base_format)]
-
-        if "callable" in styles:
-            rules += [(r"\b([\w]+)[\s]*[(]", 1, styles['callable'])]
-
-        if "keyword" in styles:
-            rules += [(r'\b%s\b' % i, 0, styles['keyword']) for i in main_keywords]
+        # Words with a kind of their own
+        custom_keywords = [
+            ('custom', ['nuke']),
+            ('blue', ['def', 'class', 'int', 'str', 'float', 'bool', 'list', 'dict', 'set']),
+            ('self', ['self']),
+        ]
 
-        if "error" in styles:
-            rules += [(r'\b%s\b' % i, 0, styles['error']) for i in error_keywords]
+        # 1. Regions: strings and comments, which are lexed first and can be left open for the next block.
+        # Block states: 1 = inside ''', 2 = inside """, 3 and 4 = single-quoted string continued with a backslash.
+        string_prefix = r"(?:\b[rRbBuUfF]{1,2})?"
+        regions = [
+            lexer.Region('docstring', string_prefix + "'''", "'''", state=1, multiline=True, escape=True),
+            lexer.Region('docstring', string_prefix + '"""', '"""', state=2, multiline=True, escape=True),
+            lexer.Region('string', string_prefix + "'", "'", state=3, escape=True, continuation=True),
+            lexer.Region('string', string_prefix + '"', '"', state=4, escape=True, continuation=True),
+            lexer.Region('comment', "#"),
+        ]
 
-        if "operator" in styles:
-            rules += [(i, 0, styles['operator']) for i in operator_keywords]
+        # 2. Rules for the code between regions, in order of precedence (the first rule matching at a position wins)
+        rules = []
 
-        if "singleton" in styles:
-            rules += [(r'\b%s\b' % i, 0, styles['singleton']) for i in singletons]
+        # Function definitions, and the function's first argument
+        rules += [(r"\bdef[\s]+([\w\.]+)(?:[\s]*\([\s]*([\w]+))?", ('function', 'argument'))]
 
-        if "number" in styles:
-            rules += [(r'\b[0-9]+\b', 0, styles['number'])]
+        # Class definitions, and the class arguments (which are also classes so must be same color)
+        rules += [(r"\bclass[\s]+([\w\.]+)(?:[\s]*\(([\w\.,\s]+)\))?", ('class', 'class'))]
 
-        # Function definitions
-        if "function" in styles:
-            rules += [(r"def[\s]+([\w\.]+)", 1, styles['function'])]
+        # Custom keywords
+        for kind, words in custom_keywords:
+            rules += [(lexer.words_pattern(words), kind)]
 
-        # Class definitions
-        if "class" in styles:
-            rules += [(r"class[\s]+([\w\.]+)", 1, styles['class'])]
-            # Class argument (which is also a class so must be same color)
-            rules += [(r"class[\s]+[\w\.]+[\s]*\((.*)\)", 1, styles['class'])]
+        rules += [(r'\b[0-9]+\b', 'number')]
+        rules += [(lexer.words_pattern(singletons), 'singleton')]
+        rules += [(lexer.words_pattern(error_keywords), 'error')]
+        rules += [(lexer.words_pattern(main_keywords), 'keyword')]
+        rules += [(r"\b([\w]+)[\s]*[(]", ('callable',))]
 
-        # Function arguments
-        if "argument" in styles:
-            rules += [(r"def[\s]+[\w]+[\s]*\(([\w]+)", 1, styles['argument'])]
+        # Any other word is skipped as a whole
+        rules += [(r"[A-Za-z_][\w]*", None)]
 
-        # Custom keywords
-        if "keywords" in style_dict.keys():
-            keywords = style_dict["keywords"]
-            for k in keywords.keys():
-                if k in styles:
-                    rules += [(r'\b%s\b' % i, 0, styles[k]) for i in keywords[k]]
-
-        if "string" in styles:
-            # Double-quoted string, possibly containing escape sequences
-            rules += [(r'"[^"\\]*(\\.[^"\\]*)*"', 0, styles['string'])]
-            # Single-quoted string, possibly containing escape sequences
-            rules += [(r"'[^'\\]*(\\.[^'\\]*)*'", 0, styles['string'])]
-
-        # Comments from '#' until a newline
-        if "comment" in styles:
-            rules += [(r'#[^\n]*', 0, styles['comment'])]
-
-        # 3. Resulting dictionary
-        result = {
-            "rules": [(QtCore.QRegExp(pat), index, fmt) for (pat, index, fmt) in rules],
-            # Build a QRegExp for each pattern
-            "tri_single": tri_single,
-            "tri_double": tri_double,
-        }
+        rules += [(lexer.symbols_pattern(operator_keywords), 'operator')]
 
-        return result
+        # All rules compiled into a single regex
+        return lexer.BlockLexer(regions, lexer.RuleSet(rules))
 
     @staticmethod
     def format(rgb, style=''):
@@ -239,33 +221,11 @@ class KSPythonHighlighter(QtGui.QSyntaxHighlighter):
 
         return text_format
 
-    def highlightBlock(self, text):
+    def lex(self, text, state):
         """
-        Apply syntax highlighting to the given block of text.
+        Single left-to-right pass over the block, starting from the state left open by the previous block.
         """
-
-        for expression, nth, text_format in self.styles[self._style]["rules"]:
-            index = expression.indexIn(text, 0)
-
-            while index >= 0:
-                # We actually want the index of the nth match
-                index = expression.pos(nth)
-                length = len(expression.cap(nth))
-                try:
-                    self.setFormat(index, length, text_format)
-                except:
-                    return False
-                index = expression.indexIn(text, index + length)
-
-        self.setCurrentBlockState(0)
-
-        # Multi-line strings etc. based on selected scheme
-        in_multiline = self.match_multiline(text, *self.styles[self._style]["tri_single"])
-        if not in_multiline:
-            in_multiline = self.match_multiline(text, *self.styles[self._style]["tri_double"])
-
-        # TODO if there's a selection, highlight same occurrences in the full document.
-        #   If no selection but something highlighted, unhighlight full document. (do it thru regex or sth)
+        return self.styles[self._style]["lexer"].scan(text, state)
 
     def setStyle(self, style_name="nuke"):
         if style_name in self.styles.keys():
@@ -273,43 +233,6 @@ class KSPythonHighlighter(QtGui.QSyntaxHighlighter):
         else:
             raise Exception("Style {} not found.".format(str(style_name)))
 
-    def match_multiline(self, text, delimiter, in_state, style):
-        """
-        Check whether highlighting requires multiple lines.
-        """
-        # If inside triple-single quotes, start at 0
-        if self.previousBlockState() == in_state:
-            start = 0
-            add = 0
-        # Otherwise, look for the delimiter on this line
-        else:
-            start = delimiter.indexIn(text)
-            # Move past this match
-            add = delimiter.matchedLength()
-
-        # As long as there's a delimiter match on this line...
-        while start >= 0:
-            # Look for the ending delimiter
-            end = delimiter.indexIn(text, start + add)
-            # Ending delimiter on this line?
-            if end >= add:
-                length = end - start + add + delimiter.matchedLength()
-                self.setCurrentBlockState(0)
-            # No; multi-line string
-            else:
-                self.setCurrentBlockState(in_state)
-                length = len(text) - start + add
-            # Apply formatting
-            self.setFormat(start, length, style)
-            # Look for the next match
-            start = delimiter.indexIn(text, start + length)
-
-        # Return True if still inside a multi-line string, False otherwise
-        if self.currentBlockState() == in_state:
-            return True
-        else:
-            return False
-
     @property
     def style(self):
         return self._style
@@ -42,7 +42,7 @@ class ScriptOutputWidget(QtWidgets.QTextEdit):
 
     def keyPressEvent(self, event):
         # ctrl = ((event.modifiers() and Qt.ControlModifier) != 0)
-        ctrl = bool(event.modifiers() & Qt.ControlModifier)
+        ctrl = bool(int(event.modifiers()) & int(Qt.ControlModifier))
         # alt = ((event.modifiers() and Qt.AltModifier) != 0)
         # shift = ((event.modifiers() and Qt.ShiftModifier) != 0)
         key = event.key()
@@ -0,0 +1,511 @@
+# -*- coding: utf-8 -*-
+""" Semantic highlighting for KnobScripter: an optional layer on top of the (regex) python highlighter.
+
+The document is parsed with ast in a worker thread, and the names are classified by what they refer to:
+parameters, locals, globals, imported modules, and calls to the nuke API. Each result is tagged with the
+document revision it was computed from, so results that arrive after further edits are discarded. The
+semantic runs are stored in the blocks (KSBlockData) and only the blocks whose runs changed are rehighlighted,
+visible blocks first, and the rest in small time slices.
+
+adrianpueyo.com
+
+"""
+
+import ast
+import re
+import threading
+import time
+import nuke
+
+try:
+    if nuke.NUKE_VERSION_MAJOR < 11:
+        from PySide import QtCore, QtGui, QtGui as QtWidgets
+        from PySide.QtCore import Qt
+    else:
+        from PySide2 import QtWidgets, QtGui, QtCore
+        from PySide2.QtCore import Qt
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+from KnobScripter.kshighlighter import KSBlockData
+
+# Semantic kinds, and the lexical kind each one looks like unless the style gives it a format of its own
+LEXICAL_KINDS = {
+    "parameter": "argument",
+    "self": "self",
+    "module": "custom",
+    "nuke_call": "callable",
+    "local": None,
+    "global": None,
+}
+
+NUKE_MODULES = ["nuke", "nukescripts"]  # Already imported in Nuke's script editor, so they count even if unbound
+
+PARAM_CONTEXT = getattr(ast, "Param", ())  # Context of the arguments in python 2
+
+PIECE_LINES = 200  # The code is parsed in pieces of (about) this many lines
+MAX_MERGED_PIECES = 4
+
+# Start of the lines with a top-level statement (except the ones continuing a compound statement), or a string or
+# comment to skip, as they can contain lines that look like statements
+STATEMENT_START = re.compile(r"""
+    (?P<skip>
+        [rRbBuUfF]{0,2}\'\'\'(?:\\.|[^\\])*?\'\'\'
+        |[rRbBuUfF]{0,2}\"\"\"(?:\\.|[^\\])*?\"\"\"
+        |'(?:\\.|[^\\'\n])*'
+        |"(?:\\.|[^\\"\n])*"
+        |\#[^\n]*
+    )
+    |^(?=[A-Za-z_@])(?!(?:else|elif|except|finally)\b)
+""", re.MULTILINE | re.VERBOSE)
+
+
+class Scope(object):
+    """ Names bound in a module, function or class body. """
+
+    def __init__(self, kind, parent=None):
+        self.kind = kind  # "module", "function" or "class"
+        self.parent = parent
+        self.params = set()
+        self.locals = set()
+        self.globals = set()
+        self.nonlocals = set()
+        self.modules = dict()  # Imported name -> full module (or module.name) path
+
+    def bind(self, name):
+        if name not in self.params and name not in self.globals and name not in self.nonlocals:
+            self.locals.add(name)
+
+
+class Analyzer(ast.NodeVisitor):
+    """
+    Collects the scopes of a module and the names used in them. Names can be used before the statement that binds
+    them (i.e. a local assigned at the end of a function), so they're only resolved once the whole tree is visited.
+    """
+
+    def __init__(self):
+        self.module_scope = Scope("module")
+        self.scope = self.module_scope
+        self.names = []  # (lineno, col_offset, name, scope)
+        self.calls = []  # (ast.Attribute, root name, scope) of calls like nuke.toNode()
+        self.imports = []  # (lineno, name, scope) of the imported names, which don't have a position
+
+    def visit_FunctionDef(self, node):
+        self.scope.bind(node.name)
+        for expr in node.decorator_list:
+            self.visit(expr)
+        # Defaults and annotations are evaluated in the enclosing scope
+        args = node.args
+        for expr in args.defaults + [d for d in getattr(args, "kw_defaults", []) if d is not None]:
+            self.visit(expr)
+        for arg in self.arguments(args):
+            if getattr(arg, "annotation", None) is not None:
+                self.visit(arg.annotation)
+        if getattr(node, "returns", None) is not None:
+            self.visit(node.returns)
+
+        self.scope = Scope("function", self.scope)
+        self.visitArguments(args)
+        for statement in node.body:
+            self.visit(statement)
+        self.scope = self.scope.parent
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Lambda(self, node):
+        for expr in node.args.defaults:
+            self.visit(expr)
+        self.scope = Scope("function", self.scope)
+        self.visitArguments(node.args)
+        self.visit(node.body)
+        self.scope = self.scope.parent
+
+    def visit_ClassDef(self, node):
+        self.scope.bind(node.name)
+        for expr in node.decorator_list + node.bases + getattr(node, "keywords", []):
+            self.visit(expr)
+        self.scope = Scope("class", self.scope)
+        for statement in node.body:
+            self.visit(statement)
+        self.scope = self.scope.parent
+
+    @staticmethod
+    def arguments(args):
+        """ Returns the argument nodes of an ast.arguments: ast.arg in python 3, ast.Name (or str) in python 2. """
+        result = list(getattr(args, "posonlyargs", [])) + list(args.args)
+        if args.vararg is not None:
+            result.append(args.vararg)
+        result += getattr(args, "kwonlyargs", [])
+        if args.kwarg is not None:
+            result.append(args.kwarg)
+        return result
+
+    def visitArguments(self, args):
+        for arg in self.arguments(args):
+            if isinstance(arg, ast.AST) and not hasattr(arg, "arg"):
+                self.visit(arg)  # Python 2: a Name with a Param context, or a Tuple of them
+                continue
+            name = getattr(arg, "arg", arg)
+            self.scope.params.add(name)
+            if hasattr(arg, "lineno"):
+                self.names.append((arg.lineno, arg.col_offset, name, self.scope))
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, PARAM_CONTEXT):
+            self.scope.params.add(node.id)
+        elif not isinstance(node.ctx, ast.Load):
+            self.scope.bind(node.id)
+        self.names.append((node.lineno, node.col_offset, node.id, self.scope))
+
+    def visit_Global(self, node):
+        self.scope.globals.update(node.names)
+        self.module_scope.locals.update(node.names)
+
+    def visit_Nonlocal(self, node):
+        self.scope.nonlocals.update(node.names)
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.asname:
+                self.importName(node, alias.asname, alias.name)
+            else:
+                name = alias.name.split(".")[0]
+                self.importName(node, name, name)
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            if alias.name != "*":
+                path = "{0}.{1}".format(node.module, alias.name) if node.module else alias.name
+                self.importName(node, alias.asname or alias.name, path)
+
+    def importName(self, node, name, path):
+        self.scope.modules[name] = path
+        self.imports.append((node.lineno, name, self.scope))
+
+    def visit_ExceptHandler(self, node):
+        if isinstance(node.name, str):
+            self.scope.bind(node.name)  # Python 3: the name is a str without position
+        self.generic_visit(node)
+
+    def visit_Call(self, node):
+        root = node.func
+        while isinstance(root, ast.Attribute):
+            root = root.value
+        if isinstance(node.func, ast.Attribute) and isinstance(root, ast.Name):
+            self.calls.append((node.func, root.id, self.scope))
+        self.generic_visit(node)
+
+    def visit_JoinedStr(self, node):
+        pass  # The positions inside f-strings aren't reliable in every python version, and they're strings anyway
+
+    def resolve(self, name, scope):
+        """ Returns the semantic kind of a name used in the given scope, or None (i.e. builtins). """
+        current = scope
+        while current is not None:
+            if current.kind == "class" and current is not scope:
+                current = current.parent  # Class bodies aren't visible from their methods
+                continue
+            if name in current.globals and current is not self.module_scope:
+                current = self.module_scope
+                continue
+            if name in current.nonlocals:
+                current = current.parent
+                continue
+            if name in current.modules:
+                return "module"
+            if name in current.params:
+                return "self" if name == "self" else "parameter"
+            if name in current.locals:
+                return "global" if current.kind == "module" else "local"
+            current = current.parent
+        return None
+
+    def module(self, name, scope):
+        """ Returns the module path a name refers to in the given scope, or None if it's not a module. """
+        current = scope
+        while current is not None:
+            if current.kind == "class" and current is not scope:
+                current = current.parent
+                continue
+            if name in current.modules:
+                return current.modules[name]
+            if name in current.params or name in current.locals:
+                return None
+            current = current.parent
+        return name if name in NUKE_MODULES else None
+
+
+def char_column(line, col_offset):
+    """ Converts an ast col_offset (in utf-8 bytes) to a column in characters of the line. """
+    encoded = line.encode("utf-8")
+    if len(encoded) == len(line):
+        return col_offset
+    return len(encoded[:col_offset].decode("utf-8", "ignore"))
+
+
+def statement_lines(text):
+    """ Returns the numbers (0-based) of the lines where a top-level statement starts, skipping strings. """
+    result = []
+    line = 0
+    position = 0
+    for match in STATEMENT_START.finditer(text):
+        if match.group("skip") is None:
+            line += text.count("\n", position, match.start())
+            position = match.start()
+            result.append(line)
+    return result
+
+
+def parse_pieces(lines):
+    """
+    Parses python code (a list of lines) in pieces of about PIECE_LINES lines, split between top-level statements,
+    so the worker thread never holds the GIL for long. A piece that can't be parsed (i.e. while typing) is merged with
+    the next ones, up to MAX_MERGED_PIECES, in case it was split wrongly (i.e. brackets continued at column 0).
+    Returns the list of trees (with their line numbers relative to the whole code), and the set of line numbers
+    that couldn't be parsed.
+    """
+    bounds = []
+    for line_number in statement_lines("\n".join(lines)) + [len(lines)]:
+        if not bounds or line_number - bounds[-1] >= PIECE_LINES:
+            bounds.append(line_number)
+    if bounds[0] != 0:
+        bounds.insert(0, 0)
+    if bounds[-1] != len(lines):
+        bounds.append(len(lines))
+
+    trees = []
+    skipped = set()
+    i = 0
+    while i < len(bounds) - 1:
+        for j in range(i + 1, min(i + 1 + MAX_MERGED_PIECES, len(bounds))):
+            try:
+                tree = ast.parse("\n".join(lines[bounds[i]:bounds[j]]))
+            except (SyntaxError, ValueError, TypeError, RuntimeError, MemoryError):
+                continue
+            ast.increment_lineno(tree, bounds[i])
+            trees.append(tree)
+            i = j
+            break
+        else:
+            skipped.update(range(bounds[i], bounds[i + 1]))
+            i += 1
+    return trees, skipped
+
+
+def analyze(text):
+    """
+    Parses python code and returns a dict {line number (0-based): sorted (start, length, kind) runs}, along with
+    the set of line numbers that couldn't be parsed (so they must keep their previous runs).
+    """
+    lines = text.split("\n")
+    trees, skipped = parse_pieces(lines)
+    analyzer = Analyzer()
+    for tree in trees:
+        analyzer.visit(tree)
+    result = dict()
+
+    def add(line_number, start, length, kind):
+        if kind is not None and 0 <= line_number < len(lines):
+            result.setdefault(line_number, []).append((start, length, kind))
+
+    for lineno, col_offset, name, scope in analyzer.names:
+        add(lineno - 1, char_column(lines[lineno - 1], col_offset), len(name), analyzer.resolve(name, scope))
+
+    for lineno, name, scope in analyzer.imports:
+        line = lines[lineno - 1] if lineno <= len(lines) else ""
+        match = re.search(r"\b{0}\b".format(re.escape(name)), line)
+        if match:
+            add(lineno - 1, match.start(), len(name), "module")
+
+    for node, root, scope in analyzer.calls:
+        module = analyzer.module(root, scope)
+        if module is None or module.split(".")[0] not in NUKE_MODULES:
+            continue
+        if getattr(node, "end_col_offset", None) is not None:
+            line_number = node.end_lineno - 1
+            attr_offset = node.end_col_offset - len(node.attr.encode("utf-8"))
+            start = char_column(lines[line_number], attr_offset)
+        else:
+            line_number = node.lineno - 1
+            line = lines[line_number]
+            match = re.compile(r"\.[\s]*({0})\b".format(re.escape(node.attr))).search(
+                line, char_column(line, node.col_offset))
+            if not match:
+                continue
+            start = match.start(1)
+        add(line_number, start, len(node.attr), "nuke_call")
+
+    for line_number in result:
+        result[line_number] = tuple(sorted(set(result[line_number])))
+    return result, skipped
+
+
+class KSSemanticLayer(QtCore.QObject):
+    """
+    Semantic highlighting of a KSScriptEditor's python code.
+
+    Edits are debounced, and the analysis runs in a worker thread on a snapshot of the text, so it never blocks
+    typing. Only one analysis runs at a time: edits made meanwhile schedule a new one when it finishes.
+    Edits are counted from contentsChange (which, unlike the document's revision, highlighting doesn't trigger), and
+    a result is only applied while the count is the one its text was taken at.
+    """
+
+    analyzed = QtCore.Signal(int, object)
+
+    delay_ms = 400  # Time without edits before analyzing
+    apply_time_slice = 0.008
+    max_blocks = 20000  # Bigger documents don't get semantic highlighting
+
+    def __init__(self, editor):
+        super(KSSemanticLayer, self).__init__(editor)
+        self.editor = editor
+        self.stopped = False
+        self._thread = None
+        self._dirty = False  # An analysis was requested while the worker was busy
+        self._edits = 0  # Edits of the document so far
+        self._analyzed_edits = None  # Edits when the text of the last analysis started was taken
+        self._runs = dict()  # Result being applied: line number -> semantic runs
+        self._skipped = set()  # Line numbers that couldn't be parsed
+        self._next_block = None  # Next block to apply the result to
+        self._next_number = 0
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(self.delay_ms)
+        self.timer.timeout.connect(self.startAnalysis)
+
+        self.apply_timer = QtCore.QTimer(self)
+        self.apply_timer.setInterval(0)
+        self.apply_timer.timeout.connect(self.applyStep)
+
+        self.analyzed.connect(self.applyResult)
+        self.editor.document().contentsChange.connect(self.schedule)
+
+    def schedule(self, *args):
+        """ contentsChange slot: counts the edit, and analyzes the document after delay_ms without edits. """
+        self._edits += 1
+        if not self.stopped:
+            self.timer.start()
+
+    def startAnalysis(self):
+        if self.stopped:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            self._dirty = True
+            return
+        document = self.editor.document()
+        if document.blockCount() > self.max_blocks or self._edits == self._analyzed_edits:
+            return
+        self._analyzed_edits = self._edits
+        self._thread = threading.Thread(target=self.work, args=(self._edits, document.toPlainText()))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def work(self, edits, text):
+        """ Worker thread: analyzes the text and sends the result back to the main thread. """
+        try:
+            result = analyze(text)
+        except Exception:  # i.e. RecursionError on very deeply nested code
+            result = None
+        try:
+            self.analyzed.emit(edits, result)
+        except RuntimeError:
+            pass  # The layer was deleted meanwhile
+
+    def applyResult(self, edits, result):
+        """ Starts applying an analysis result: the visible blocks right away, the rest in time slices. """
+        if self.stopped:
+            return
+        if self._dirty:
+            self._dirty = False
+            self.timer.start()
+        document = self.editor.document()
+        if result is None or edits != self._edits or edits != self._analyzed_edits:
+            return  # Stale: the text was edited meanwhile, or it's from the document shown before
+
+        self._runs, self._skipped = result
+        first, last = self.editor.visibleBlockRange()
+        block = document.findBlockByNumber(first)
+        while block.isValid() and block.blockNumber() <= last:
+            self.applyBlock(block, block.blockNumber())
+            block = block.next()
+        self._next_block = document.begin()
+        self._next_number = 0
+        self.apply_timer.start()
+
+    def applyStep(self):
+        """ Applies the result to the next blocks, for apply_time_slice seconds at most. """
+        if self.stopped or self.editor.highlighter is None:
+            self.apply_timer.stop()
+            return
+        if self._edits != self._analyzed_edits:
+            self.apply_timer.stop()  # Edited meanwhile: the line numbers of the result aren't valid anymore
+            return
+
+        deadline = time.time() + self.apply_time_slice
+        block = self._next_block
+        number = self._next_number
+        while block.isValid() and time.time() < deadline:
+            self.applyBlock(block, number)
+            block = block.next()
+            number += 1
+        self._next_block = block
+        self._next_number = number
+        if not block.isValid():
+            self.apply_timer.stop()
+
+    def applyBlock(self, block, number):
+        """ Stores the semantic runs of a block, and rehighlights it if they changed. """
+        if number in self._skipped:
+            return  # Couldn't be parsed: keeps its previous runs, which only apply while its text doesn't change
+        runs = self._runs.get(number, ())
+        data = block.userData()
+        if isinstance(data, KSBlockData):
+            if data.semantic == runs and (not runs or data.semantic_text == block.text()):
+                return
+        elif runs:
+            data = KSBlockData(None, -1, (), 0)
+            block.setUserData(data)
+        else:
+            return
+        data.semantic = runs
+        data.semantic_text = block.text()
+        self.editor.highlighter.rehighlightBlock(block)
+
+    def documentChanged(self, old_document):
+        """
+        The editor shows another document: follows its edits instead, and analyzes it. The runs applied to the old
+        document stay in it, as they're still valid for its text.
+        """
+        self.timer.stop()
+        self.apply_timer.stop()
+        try:
+            old_document.contentsChange.disconnect(self.schedule)
+        except (RuntimeError, TypeError):
+            pass
+        self.editor.document().contentsChange.connect(self.schedule)
+        self._edits += 1
+        self._analyzed_edits = None  # A result still being computed is for the old document: it's discarded
+        self._next_block = None
+        self.timer.start()
+
+    def stop(self):
+        """ Stops analyzing, and removes the semantic runs from the document. """
+        self.stopped = True
+        self.timer.stop()
+        self.apply_timer.stop()
+        document = self.editor.document()
+        try:
+            document.contentsChange.disconnect(self.schedule)
+        except (RuntimeError, TypeError):
+            pass
+        highlighter = self.editor.highlighter
+        block = document.begin()
+        while block.isValid():
+            data = block.userData()
+            if isinstance(data, KSBlockData) and data.semantic:
+                data.semantic = ()
+                data.semantic_text = None
+                if highlighter is not None:
+                    highlighter.rehighlightBlock(block)
+            block = block.next()
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+""" Index of the python symbols defined in a script editor's document, for the completer.
+
+Symbols are found line by line with the rules completion always used: assigned names, defs and their arguments,
+lambda arguments and classes. Strings and comments are left out using the runs the highlighter stored in each
+block, or by stripping quotes on the line for blocks it hasn't lexed yet. The KSSymbolIndex keeps the names of
+every block, plus a sorted list of all the names with the number of blocks defining each. An edit (contentsChange)
+only marks the blocks it changed as pending, as does the highlighter lexing a block again (blockRelexed). They are scanned again the next time the index is queried, and a
+prefix query is then a bisect, so completing costs the same in a 10-line script as in a 10k-line one.
+
+adrianpueyo.com
+
+"""
+
+import bisect
+import re
+
+from KnobScripter import lineops, instrumentation
+from KnobScripter.kshighlighter import is_long_block, is_long_line, region_runs
+
+ASSIGNED = re.compile(r"([\w.]+)(?=[,\s\w]*=[^=]+$)")
+DEF = re.compile(r"[\s]*def[\s]+([\w.]+)[\s]*\([\s]*")
+ARGUMENT = re.compile(r"(?<![=\"\'])[\s]*([\w.]+)[\s]*(?=[=,)])")
+LAMBDA = re.compile(r"^[^#]*lambda[\s]+([\w.]+)[\s()\w,]+")
+CLASS = re.compile(r"^[^#]*class[\s]+([\w.]+)[\s()\w,]+")
+SEGMENT = re.compile(r"[^\n;]+")
+
+
+def segment_symbols(segment):
+    """ Returns the names defined in a segment of code (a line or part of it, between ";"), without strings. """
+    matches = ASSIGNED.findall(segment)
+    function = DEF.findall(segment)
+    if function:
+        matches += function
+        args = DEF.split(segment)
+        if len(args) > 1:
+            matches += ARGUMENT.findall(args[-1])
+    matches += LAMBDA.findall(segment)
+    matches += CLASS.findall(segment)
+    return matches
+
+
+def clean_line(text, skip_runs=None):
+    """
+    Returns a line with its strings emptied and its comments removed. skip_runs are the (start, length, kind) runs
+    of its strings and comments if known; otherwise they're found by splitting the line on quotes.
+    """
+    if skip_runs is not None:
+        pieces = []
+        position = 0
+        for start, length, _ in skip_runs:
+            pieces.append(text[position:start])
+            pieces.append('""')
+            position = start + length
+        pieces.append(text[position:])
+        return "".join(pieces)
+    text = '""'.join(text.split('"""')[::2])
+    text = '""'.join(text.split("'''")[::2])
+    text = '""'.join(text.split('"')[::2])
+    text = '""'.join(text.split("'")[::2])
+    return text.split("#")[0]
+
+
+def line_symbols(text, skip_runs=None):
+    """ Returns the names defined in a line of python code (see clean_line for skip_runs). """
+    if is_long_line(text):
+        return []  # Scanning pathological long lines (i.e. pasted JSON) could hang the completer
+    matches = []
+    for segment in SEGMENT.findall(clean_line(text, skip_runs)):
+        matches += segment_symbols(segment)
+    return matches
+
+
+class KSSymbolIndex(object):
+    """
+    Names defined in a script editor's document (see line_symbols). block_symbols has the names of each block, or
+    None for the blocks pending a scan, and names is the sorted list of all the names defined, counted in counts.
+    version changes whenever names does.
+    """
+
+    max_pending = 5000  # From this many pending blocks on, the whole document is scanned again instead
+
+    def __init__(self, editor):
+        self.editor = editor
+        self.block_symbols = []
+        self.pending = set()
+        self.stale = True  # Everything has to be scanned again
+        self.names = []
+        self.counts = dict()
+        self.version = 0
+        self.highlighter = None  # Highlighter the region kinds are from
+        self.region_kinds = frozenset()
+        self.reset()
+
+    def reset(self):
+        """ Forgets everything (i.e. when the document or its highlighter change): the next query scans it all. """
+        self.block_symbols = []
+        self.pending = set()
+        self.stale = True
+        self.names = []
+        self.counts = dict()
+        self.version += 1
+
+    def update(self, position, removed, added):
+        """ contentsChange slot: forgets the names of the blocks changed, which are scanned again when queried. """
+        if self.stale:
+            return
+        changed = lineops.changed_blocks(self.editor.document(), position, added, len(self.block_symbols))
+        if changed is None:
+            return self.reset()
+        first, last, old_last = changed
+        for symbols in self.block_symbols[first:old_last + 1]:
+            if symbols:
+                self.removeNames(symbols)
+        self.block_symbols[first:old_last + 1] = [None] * (last - first + 1)
+        delta = last - old_last
+        if delta and self.pending:
+            self.pending = set(number + delta if number > old_last else number for number in self.pending
+                               if not first <= number <= old_last)
+        self.pending.update(range(first, last + 1))
+        if len(self.pending) > self.max_pending:
+            self.reset()  # i.e. the whole document got replaced: scanning it all at once is faster
+
+    def relexed(self, number):
+        """ blockRelexed slot: forgets the names of a block whose strings or comments might have changed. """
+        if self.stale or number >= len(self.block_symbols):
+            return
+        symbols = self.block_symbols[number]
+        if symbols is None:
+            return
+        if symbols:
+            self.removeNames(symbols)
+        self.block_symbols[number] = None
+        self.pending.add(number)
+        if len(self.pending) > self.max_pending:
+            self.reset()  # i.e. the whole document got highlighted
+
+    def addNames(self, symbols):
+        counts = self.counts
+        for name in symbols:
+            count = counts.get(name, 0)
+            if not count:
+                bisect.insort(self.names, name)
+                self.version += 1
+            counts[name] = count + 1
+
+    def removeNames(self, symbols):
+        counts = self.counts
+        for name in symbols:
+            count = counts[name] - 1
+            if count:
+                counts[name] = count
+            else:
+                del counts[name]
+                del self.names[bisect.bisect_left(self.names, name)]
+                self.version += 1
+
+    def scanBlock(self, block):
+        """ Returns the names defined in a block (unique, as a tuple). """
+        if is_long_block(block):
+            return ()
+        text = block.text()
+        skip_runs = None
+        if self.highlighter is not None:
+            skip_runs = region_runs(block, self.region_kinds, text)
+        return tuple(set(line_symbols(text, skip_runs)))
+
+    def refresh(self):
+        """ Scans the pending blocks, or the whole document if stale. """
+        highlighter = self.editor.highlighter
+        if highlighter is not self.highlighter:
+            try:
+                self.highlighter.blockRelexed.disconnect(self.relexed)
+            except (AttributeError, RuntimeError, TypeError):
+                pass  # No highlighter before, or already deleted
+            self.highlighter = highlighter
+            self.region_kinds = frozenset()
+            if highlighter is not None:
+                self.region_kinds = highlighter.regionKinds()
+                highlighter.blockRelexed.connect(self.relexed)
+            self.reset()  # What's a string or a comment might have changed
+        document = self.editor.document()
+        if not self.stale and len(self.block_symbols) != document.blockCount():
+            self.reset()  # An edit wasn't notified
+        if self.stale:
+            block_symbols = []
+            all_names = dict()
+            block = document.firstBlock()
+            while block.isValid():
+                symbols = self.scanBlock(block)
+                block_symbols.append(symbols)
+                for name in symbols:
+                    all_names[name] = all_names.get(name, 0) + 1
+                block = block.next()
+            self.block_symbols = block_symbols
+            self.counts = all_names
+            self.names = sorted(all_names)
+            self.version += 1
+            self.stale = False
+            instrumentation.count("symbol_blocks_scanned", len(block_symbols))
+            return
+        if not self.pending:
+            return
+        block = None
+        previous = -2
+        for number in sorted(self.pending):
+            if number == previous + 1:
+                block = block.next()  # Pending blocks are mostly consecutive
+            else:
+                block = document.findBlockByNumber(number)
+            previous = number
+            if not block.isValid():
+                continue
+            symbols = self.scanBlock(block)
+            self.block_symbols[number] = symbols
+            self.addNames(symbols)
+        instrumentation.count("symbol_blocks_scanned", len(self.pending))
+        self.pending = set()
+
+    def complete(self, prefix):
+        """ Returns the names starting with prefix, sorted. Costs a bisect, plus the names returned. """
+        self.refresh()
+        names = self.names
+        i = bisect.bisect_left(names, prefix)
+        matches = []
+        while i < len(names) and names[i].startswith(prefix):
+            matches.append(names[i])
+            i += 1
+        return matches
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+""" Usage frequency of completions and snippets, to rank them by how often and how recently they're picked.
+
+Each pick (a completion inserted, a snippet expanded) adds 1 to the score of its name within a scope, such as
+"completions/python" or "snippets/blink", and scores decay exponentially, halving every se_usage_half_life_days.
+Instead of decaying every score as time goes by, a pick made at time t adds 2 ** ((t - EPOCH) / half_life), and the
+log2 of the sum is kept. Scores of different ages then compare directly, so ranking never recomputes them, and the
+current score of a name is just 2 ** (log score - (now - EPOCH) / half_life).
+
+The store is a small json file in the KnobScripter directory (ks_usage_file, usage.json), read the first time
+it's needed. Picks only change it in memory: it's written in the background a few seconds after the last one (and on
+exit), replacing the file in one step, and each scope keeps its best se_usage_max_entries names, so ranking never
+adds file access to typing.
+
+adrianpueyo.com
+
+"""
+
+import atexit
+import io
+import json
+import math
+import os
+import threading
+import time
+
+from KnobScripter import config
+
+FORMAT = 1
+EPOCH = 1577836800.0  # 2020-01-01, so the log scores stay small numbers
+FLUSH_DELAY = 5.0  # Seconds without picks before writing the store
+PRUNE_MARGIN = 1.1  # Scopes are pruned once they grow this much over the maximum, to do it seldom
+
+_store = None
+
+
+def store():
+    """ Returns the KSUsageStore shared by all the script editors, sized after the se_usage prefs. """
+    global _store
+    if _store is None:
+        _store = KSUsageStore(os.path.join(config.ks_directory, config.prefs["ks_usage_file"]),
+                              config.prefs["se_usage_half_life_days"], config.prefs["se_usage_max_entries"])
+        atexit.register(_store.flush)
+    return _store
+
+
+def replace_file(source, destination):
+    """
+    Moves the file source over destination in a single step, so destination is never missing nor half written.
+    Python 2 has no os.replace, and its os.rename only replaces existing files on posix: on Windows, the destination
+    is removed first there.
+    """
+    if hasattr(os, "replace"):
+        os.replace(source, destination)
+        return
+    try:
+        os.rename(source, destination)
+    except OSError:
+        if not os.path.isfile(destination):
+            raise
+        os.remove(destination)
+        os.rename(source, destination)
+
+
+def add_log2(a, b):
+    """ Returns log2(2 ** a + 2 ** b), without overflowing. """
+    high, low = max(a, b), min(a, b)
+    return high + math.log(1 + 2 ** (low - high), 2)
+
+
+class KSUsageStore(object):
+    """
+    Decaying usage scores by scope and name, kept as scope -> {name: log score} (see the module docstring).
+    scores() is what ranking uses: the higher, the more (and more recently) used.
+    """
+
+    def __init__(self, path, half_life_days=14, max_entries=2000):
+        self.path = path
+        self.half_life = half_life_days * 86400.0
+        self.max_entries = max_entries
+        self.loaded = False
+        self.scopes = dict()
+        self.writes = 0
+        self._names = dict()  # scope -> its names sorted, until some are added or pruned
+        self._lock = threading.Lock()  # Picks happen in the main thread, writes in a timer's
+        self._timer = None
+        self._dirty = False
+
+    def load(self):
+        """ Reads the store file, if not done already. A missing, broken or outdated file leaves the store empty. """
+        if self.loaded:
+            return
+        self.loaded = True
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with io.open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") == FORMAT:
+                self.scopes = dict((scope, dict(names)) for scope, names in data["scopes"].items())
+        except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.scopes = dict()
+        self._names.clear()
+
+    def logScore(self, when=None):
+        """ Returns what a pick at time when (now by default) adds to a score, as a log score. """
+        return ((time.time() if when is None else when) - EPOCH) / self.half_life
+
+    def record(self, scope, name, when=None):
+        """ Counts a pick of name in scope (i.e. "completions/python"), and schedules writing the store. """
+        if not name:
+            return
+        self.load()
+        pick = self.logScore(when)
+        with self._lock:
+            names = self.scopes.setdefault(scope, dict())
+            if name in names:
+                names[name] = add_log2(names[name], pick)
+            else:
+                names[name] = pick
+                self._names.pop(scope, None)
+                if len(names) > self.max_entries * PRUNE_MARGIN:
+                    self.prune(names)
+            self._dirty = True
+        self.scheduleFlush()
+
+    def prune(self, names):
+        """ Leaves the max_entries highest scores in names (a scope). """
+        kept = sorted(names, key=names.get, reverse=True)[:self.max_entries]
+        kept = dict((name, names[name]) for name in kept)
+        names.clear()
+        names.update(kept)
+
+    def scores(self, scope):
+        """ Returns the {name: log score} of a scope. Don't modify it. """
+        self.load()
+        return self.scopes.get(scope, {})
+
+    def names(self, scope):
+        """ Returns the names of a scope, sorted. It's the same list until names are added or pruned. """
+        self.load()
+        if scope not in self._names:
+            self._names[scope] = sorted(self.scores(scope))
+        return self._names[scope]
+
+    def score(self, scope, name, when=None):
+        """ Returns the current (decayed) score of name: about how many times it was picked in the last half life. """
+        log_score = self.scores(scope).get(name)
+        if log_score is None:
+            return 0.0
+        return 2 ** (log_score - self.logScore(when))
+
+    def scheduleFlush(self):
+        """ Writes the store FLUSH_DELAY seconds after the last pick, in a background thread. """
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(FLUSH_DELAY, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        """ Writes the store now, if it changed since the last write. """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            data = {"format": FORMAT, "half_life_days": self.half_life / 86400.0,
+                    "scopes": dict((scope, dict((name, round(value, 4)) for name, value in names.items()))
+                                   for scope, names in self.scopes.items())}
+        try:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"), sort_keys=True)
+            replace_file(temp_path, self.path)
+            self.writes += 1
+        except (IOError, OSError):
+            with self._lock:
+                self._dirty = True  # Tried again on the next pick or on exit
+
+    def clear(self):
+        """ Forgets every score, and writes the empty store. """
+        self.load()
+        with self._lock:
+            self.scopes = dict()
+            self._names.clear()
+            self._dirty = True
+        self.flush()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: per-block cost of the Blink highlighter on generated kernels.
+
+Compares the single-pass block lexer (lexer.py) against the previous engine, which ran every QRegExp rule over
+the whole block and then looked for /* */ comments. Runs headless:
+python benchmarks/bench_blink_highlighter.py [--lines N] [--repeat R]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import timeit
+
+import benchtools
+import corpora
+from benchtools import QtCore, QtGui
+
+# Rules of the previous engine, as (pattern, nth, kind), in the order they were applied
+LEGACY_RULES = (
+    [(r'\b%s\b' % w, 0, 'keyword') for w in [
+        "char", "class", "const", "double", "enum", "explicit", "friend", "inline", "int", "long", "namespace",
+        "operator", "private", "protected", "public", "short", "signed", "static", "struct", "template", "typedef",
+        "typename", "union", "unsigned", "virtual", "void", "volatile", "local", "param", "kernel"]] +
+    [(r'\b%s\b' % w, 0, 'function') for w in [
+        "define", "defineParam", "process", "init", "setRange", "setAxis", "median", "bilinear"]] +
+    [(r'\b%s\b' % w, 0, 'type') for w in [
+        "Image", "eRead", "eWrite", "eReadWrite", "eEdgeClamped", "eEdgeConstant", "eEdgeNull", "eAccessPoint",
+        "eAccessRanged1D", "eAccessRanged2D", "eAccessRandom", "eComponentWise", "ePixelWise",
+        "ImageComputationKernel"]] +
+    [(r'\b%s\b' % w, 0, 'variableKeyword') for w in [
+        "int", "int2", "int3", "int4", "float", "float2", "float3", "float4", "float3x3", "float4x4", "bool"]] +
+    [(r"\"([^\"\\\\]|\\\\.)*\"", 0, 'stringDoubleQuote'), (r"'([^'\\\\]|\\\\.)*'", 0, 'stringSingleQuote'),
+     (r"//[^\n]*", 0, 'comment')]
+)
+
+
+def legacy_scan(expressions, delimiters, text, state):
+    """ The previous highlightBlock: every rule rescans the block, then the /* */ comments are looked for. """
+    runs = []
+    for expression, nth, kind in expressions:
+        index = expression.indexIn(text, 0)
+        while index >= 0:
+            index = expression.pos(nth)
+            length = len(expression.cap(nth))
+            runs.append((index, length, kind))
+            index = expression.indexIn(text, index + length)
+
+    delimiter_start, delimiter_end = delimiters
+    if state == 1:
+        start = 0
+        add = 0
+    else:
+        start = delimiter_start.indexIn(text)
+        add = delimiter_start.matchedLength()
+    state = 0
+    while start >= 0:
+        end = delimiter_end.indexIn(text, start + add)
+        if end >= add:
+            length = end - start + add + delimiter_end.matchedLength()
+            state = 0
+        else:
+            state = 1
+            length = len(text) - start + add
+        runs.append((start, length, 'multiline_comment'))
+        start = delimiter_start.indexIn(text, start + length)
+    return runs, state
+
+
+def scan_all(scan, lines):
+    state = 0
+    for line in lines:
+        runs, state = scan(line, state)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=10000, help="Number of kernel lines to highlight.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions (the best one is reported).")
+    args = parser.parse_args()
+
+    benchtools.application(load_prefs=False)
+    from KnobScripter import blinkhighlighter
+
+    lines = corpora.blink_regular(args.lines)
+    highlighter = blinkhighlighter.KSBlinkHighlighter(QtGui.QTextDocument())
+    block_lexer = highlighter.styles["default"]["lexer"]
+    expressions = [(QtCore.QRegExp(pattern), nth, kind) for (pattern, nth, kind) in LEGACY_RULES]
+    delimiters = (QtCore.QRegExp("/\\*"), QtCore.QRegExp("\\*/"))
+
+    legacy = min(timeit.repeat(lambda: scan_all(lambda t, s: legacy_scan(expressions, delimiters, t, s), lines),
+                               number=1, repeat=args.repeat))
+    combined = min(timeit.repeat(lambda: scan_all(block_lexer.scan, lines), number=1, repeat=args.repeat))
+
+    table = benchtools.Table("Blink highlighter rules, us per block:",
+                             ["blocks", "previous_rule_loop", "single_pass_lexer", "speedup"], [7, 18, 17, 7],
+                             [0, 2, 2, 1])
+    table.row(len(lines), legacy * 1e6 / len(lines), combined * 1e6 / len(lines), legacy / combined)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: bracket matching (brackets.KSBracketIndex) across a whole document.
+
+The corpus is wrapped in a list, so the first bracket's partner is on the last line. For each document size, times:
+    - frame_match_ms: matching it as a cursor frame does (with frame_blocks of budget), right after loading, which
+      gives UNKNOWN on big documents and leaves the rest to the background.
+    - background_ms: the background steps summarizing all the blocks and building the trees, in total.
+    - cold_match_ms: matching it with no block summarized yet and no budget (i.e. Ctrl+M right after loading).
+    - warm_match_ms: median of matching it again.
+    - edit_match_ms: median of typing a character mid-document and matching it again, as a cursor frame does.
+    - newline_match_ms: the same, typing a new line (which moves the blocks after it to other numbers).
+    - text_scan_ms: reading the whole text and counting brackets up to the partner, as a baseline (which doesn't
+      even skip strings and comments).
+Runs headless: python benchmarks/bench_brackets.py [--sizes 3000 20000] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import timeit
+
+import benchtools
+import corpora
+from benchtools import QtGui, median_ms, yes_no
+
+COLUMNS = ["frame_match_ms", "background_ms", "cold_match_ms", "warm_match_ms", "edit_match_ms", "newline_match_ms",
+           "text_scan_ms"]
+
+
+def text_scan(editor):
+    """ Finds the partner of the first bracket by counting brackets in the document's text. """
+    depth = 0
+    for position, char in enumerate(editor.toPlainText()):
+        if char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+            if depth == 0:
+                return position
+    return -1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3000, 20000, 100000], help="Document sizes.")
+    parser.add_argument("--repeats", type=int, default=30, help="Runs of each median timing.")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditor, brackets
+
+    table = benchtools.Table("Bracket matching, ms:", ["lines"] + COLUMNS + ["correct"],
+                             [7] + [16] * len(COLUMNS) + [8])
+    for size in args.sizes:
+        editor = ksscripteditor.KSScriptEditor()
+        editor.set_code_language("python")
+        lines = corpora.generate("python", "regular", size).split("\n")
+        editor.setPlainText("values = [\n" + "\n".join("    " + line for line in lines) + "\n]")
+        app.processEvents()
+        document = editor.document()
+        index = editor.bracket_index
+        opener = len("values = ")
+        index.reset()
+
+        expected = document.characterCount() - 2  # The last character, as characterCount includes a paragraph separator
+        start = timeit.default_timer()
+        frame_partner = index.match(opener, index.frame_blocks)
+        row = [(timeit.default_timer() - start) * 1000]
+
+        start = timeit.default_timer()
+        while index.timer.isActive():
+            index.summarizeStep()
+        row.append((timeit.default_timer() - start) * 1000)
+
+        index.reset()
+        index.timer.stop()
+        start = timeit.default_timer()
+        partner = index.match(opener)
+        row.append((timeit.default_timer() - start) * 1000)
+        index.timer.start()
+        while index.timer.isActive():
+            index.summarizeStep()  # Builds the trees
+        row.append(median_ms(lambda: index.match(opener), args.repeats))
+
+        def edit_match(text):
+            middle = document.findBlockByNumber(size // 2)
+            position = middle.position() + 4
+            QtGui.QTextCursor(middle).insertText(text)
+            index.update(position, 0, len(text))  # contentsChange isn't delivered to python in some bindings
+            index.match(opener, index.frame_blocks)
+
+        row.append(median_ms(lambda: edit_match("x"), args.repeats))
+        row.append(median_ms(lambda: edit_match("\n"), args.repeats))
+        row.append(median_ms(lambda: text_scan(editor), 3))
+        correct = partner == expected and frame_partner in (expected, brackets.UNKNOWN) and \
+            index.match(opener) == text_scan(editor)
+
+        table.row(size, *row + [yes_no(correct)])
+        benchtools.release(editor)
+
+
+if __name__ == "__main__":
+    main()
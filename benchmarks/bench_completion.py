@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: ranking completion candidates and updating the completer's model (completion.py).
+
+Types a few words one keystroke at a time against a list of synthetic names (camelCase and snake_case), and times
+(median, per keystroke):
+    - linear_ms: filtering the whole list with startswith, as completion did.
+    - search_ms: KSCompletionSearch.search, with prefix and fuzzy matches (KSCandidates built beforehand).
+    - set_list_ms: pushing the matches into a QStringListModel with setStringList, as the completer did.
+    - set_matches_ms: pushing them into a KSCompletionModel, which only changes the rows that differ.
+Also prints the time to build the KSCandidates of the list (done once per list), and whether "tN" finds thisNode.
+Runs headless: python benchmarks/bench_completion.py [--sizes 5000 50000] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import random
+import timeit
+
+import benchtools
+from benchtools import QtCore, median_ms, yes_no
+
+COLUMNS = ["linear_ms", "search_ms", "set_list_ms", "set_matches_ms"]
+WORDS = ["node", "knob", "value", "this", "set", "get", "read", "write", "frame", "input", "channel", "format",
+         "layer", "name", "script", "panel", "menu", "selected", "all", "to", "from", "expression", "animation"]
+TYPED = ["thisNode", "tN", "set_value", "gsn", "knobChanged", "inp"]
+
+
+def synthetic_names(count):
+    """ Returns count unique names made of two to four words, in camelCase or snake_case. """
+    random.seed(count)
+    names = set(["thisNode", "knobChanged", "getSelectedNodes"])
+    while len(names) < count:
+        words = random.sample(WORDS, random.randint(2, 4))
+        if random.random() < 0.5:
+            name = words[0] + "".join(word.capitalize() for word in words[1:])
+        else:
+            name = "_".join(words)
+        names.add(name + (str(random.randint(0, 99)) if random.random() < 0.5 else ""))
+    return list(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5000, 50000], help="Numbers of candidates.")
+    parser.add_argument("--repeats", type=int, default=15, help="Runs of each median timing.")
+    args = parser.parse_args()
+
+    benchtools.application()
+    from KnobScripter import completion
+
+    table = benchtools.Table("Completion per keystroke, ms:", ["names"] + COLUMNS + ["build_ms", "tN_found"],
+                             [7] + [14] * len(COLUMNS) + [9, 8], [0] + [3] * len(COLUMNS) + [1, 0])
+    for size in args.sizes:
+        names = synthetic_names(size)
+        keystrokes = [word[:i] for word in TYPED for i in range(1, len(word) + 1)]
+
+        start = timeit.default_timer()
+        candidates = completion.candidates(names)
+        build_ms = (timeit.default_timer() - start) * 1000
+
+        def linear():
+            for typed in keystrokes:
+                [name for name in names if name.startswith(typed)]
+
+        search = completion.KSCompletionSearch()
+        results = []
+
+        def ranked():
+            del results[:]
+            for typed in keystrokes:
+                results.append(search.search(typed, [candidates]))
+
+        row = [median_ms(linear, args.repeats) / len(keystrokes), median_ms(ranked, args.repeats) / len(keystrokes)]
+
+        string_model = QtCore.QStringListModel()
+        completion_model = completion.KSCompletionModel()
+
+        def set_list():
+            for matches in results:
+                string_model.setStringList(matches)
+
+        def set_matches():
+            for matches in results:
+                completion_model.setMatches(matches)
+
+        row.append(median_ms(set_list, args.repeats) / len(results))
+        row.append(median_ms(set_matches, args.repeats) / len(results))
+        found = "thisNode" in search.search("tN", [candidates])[:10]
+
+        table.row(size, *row + [build_ms, yes_no(found)])
+
+
+if __name__ == "__main__":
+    main()
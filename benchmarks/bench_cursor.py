@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: cursor-dependent updates of the script editor while the cursor keeps moving.
+
+Simulates holding an arrow key (a key press on every event loop pass) for a while, and reports the instrumentation
+counters per second: cursor moves, coalesced cursor frames, extra selection updates and editor viewport updates.
+Cursor frames and extra selection updates should stay around the frame rate, however fast the cursor moves.
+idle_frames is the cursor frames per second once the key is released, which should be none.
+Runs headless: python benchmarks/bench_cursor.py [--sizes 50 50000] [--seconds S]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import time
+
+import benchtools
+import corpora
+from benchtools import QtGui
+
+COUNTERS = ["cursor_moves", "cursor_frames", "extra_selections", "editor_updates"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 5000, 50000], help="Document sizes.")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Time to hold the key down, per document.")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditor, instrumentation
+
+    table = benchtools.Table("Cursor updates per second, holding the down arrow:",
+                             ["lines"] + COUNTERS + ["idle_frames"], [7] + [16] * len(COUNTERS) + [11], 1)
+    for size in args.sizes:
+        editor = ksscripteditor.KSScriptEditor()
+        editor.resize(800, 600)
+        editor.show()
+        editor.set_code_language("python")
+        editor.setPlainText(corpora.generate("python", "regular", size))
+        app.processEvents()
+
+        instrumentation.reset()
+        deadline = time.time() + args.seconds
+        while time.time() < deadline:
+            cursor = editor.textCursor()
+            if not cursor.movePosition(QtGui.QTextCursor.Down):
+                cursor.movePosition(QtGui.QTextCursor.Start)
+            editor.setTextCursor(cursor)
+            app.processEvents()
+
+        rates = instrumentation.rates()
+
+        app.processEvents()
+        instrumentation.reset()
+        deadline = time.time() + args.seconds
+        while time.time() < deadline:
+            app.processEvents()
+            time.sleep(0.001)
+        idle_frames = instrumentation.rates().get("cursor_frames", 0)
+
+        table.row(size, *[float(rates.get(c, 0)) for c in COUNTERS] + [float(idle_frames)])
+        benchtools.release(editor)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: switching between knobs or scripts with the document cache (doccache.KSDocumentCache).
+
+Cycles the script editor through a few documents of the same size, as when flipping between knobChanged, onCreate
+and a couple of scripts. For each document size, times (median, including the repaint of the viewport):
+    - set_text_ms: setting the text of the next one into the same document, as before the cache.
+    - cached_switch_ms: showing its cached document again.
+    - undo_kept: whether an edit made before switching away can still be undone after switching back.
+Runs headless: python benchmarks/bench_doccache.py [--sizes 3000 20000] [--documents N] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+
+import benchtools
+import corpora
+from benchtools import QtGui, median_ms, yes_no
+
+COLUMNS = ["set_text_ms", "cached_switch_ms", "undo_kept"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3000, 20000], help="Document sizes.")
+    parser.add_argument("--documents", type=int, default=3, help="Documents to cycle through.")
+    parser.add_argument("--repeats", type=int, default=15, help="Runs of each median timing.")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditor, doccache
+
+    table = benchtools.Table("Switching documents, ms:", ["lines"] + COLUMNS, [7] + [16] * len(COLUMNS))
+    for size in args.sizes:
+        editor = ksscripteditor.KSScriptEditor()
+        editor.resize(800, 600)
+        editor.show()
+        editor.set_code_language("python")
+        texts = [corpora.generate("python", "regular", size + i) for i in range(args.documents)]
+        app.processEvents()
+        turn = [0]
+
+        def next_text():
+            turn[0] = (turn[0] + 1) % len(texts)
+            return turn[0], texts[turn[0]]
+
+        def set_text():
+            editor.setPlainText(next_text()[1])
+            editor.viewport().repaint()
+
+        row = [median_ms(set_text, args.repeats)]
+
+        cache = doccache.KSDocumentCache(editor, 64 * 1024 * 1024)
+        for _ in texts:
+            number, text = next_text()
+            cache.show(number, text)
+        app.processEvents()
+
+        def cached_switch():
+            number, text = next_text()
+            cache.show(number, text)
+            editor.viewport().repaint()
+
+        row.append(median_ms(cached_switch, args.repeats))
+
+        number = cache.key
+        QtGui.QTextCursor(editor.document()).insertText("edited = True\n")
+        texts[number] = editor.toPlainText()
+        for _ in texts:
+            cached_switch()
+        editor.undo()
+        undo_kept = cache.key == number and editor.toPlainText() == texts[number][len("edited = True\n"):]
+
+        table.row(size, *row + [yes_no(undo_kept)])
+        cache.clear()
+        benchtools.release(editor)
+
+
+if __name__ == "__main__":
+    main()
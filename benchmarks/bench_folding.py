@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: indentation-based folding (folding.KSFoldTree) in the script editor.
+
+The corpus is wrapped in a class, so it's one big fold with many folds inside. For each document size, times:
+    - update_ms: median fold tree update after typing a character (what every keystroke pays).
+    - fold_ms / unfold_ms: folding and unfolding the whole class.
+    - scroll_paint_ms: median repaint after jumping to another scroll position, with nothing folded.
+    - scroll_paint_folded_ms: the same, with every def and class inside the big class folded.
+    - visible_lines: lines left to scroll through with those folds (the document has one per block unfolded).
+Runs headless: python benchmarks/bench_folding.py [--sizes 3000 50000] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import timeit
+
+import benchtools
+import corpora
+from benchtools import QtGui, median_ms
+
+COLUMNS = ["update_ms", "fold_ms", "unfold_ms", "scroll_paint_ms", "scroll_paint_folded_ms", "visible_lines"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3000, 50000], help="Document sizes.")
+    parser.add_argument("--repeats", type=int, default=30, help="Runs of each median timing.")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditor
+
+    table = benchtools.Table("Folding, ms:", ["lines"] + COLUMNS, [7] + [22] * len(COLUMNS))
+    for size in args.sizes:
+        editor = ksscripteditor.KSScriptEditor()
+        editor.resize(800, 600)
+        editor.show()
+        editor.set_code_language("python")
+        lines = corpora.generate("python", "regular", size).split("\n")
+        editor.setPlainText("class Big(object):\n" + "\n".join("    " + line for line in lines))
+        app.processEvents()
+        document = editor.document()
+        tree = editor.fold_tree
+        header = document.firstBlock()
+        scrollbar = editor.verticalScrollBar()
+        positions = [0]
+
+        def update():
+            middle = document.findBlockByNumber(size // 2)
+            position = middle.position() + 4
+            QtGui.QTextCursor(middle).insertText("x")
+            editor.updateFolds(position, 0, 1)  # contentsChange isn't delivered to python in some bindings
+
+        def scroll_paint():
+            positions[0] = (positions[0] + 7919) % max(1, scrollbar.maximum())
+            scrollbar.setValue(positions[0])
+            editor.viewport().repaint()
+            editor.lineNumberArea.repaint()
+
+        row = [median_ms(update, args.repeats)]
+        start = timeit.default_timer()
+        editor.toggleFold(header)
+        row.append((timeit.default_timer() - start) * 1000)
+        start = timeit.default_timer()
+        editor.toggleFold(header)
+        row.append((timeit.default_timer() - start) * 1000)
+        row.append(median_ms(scroll_paint, args.repeats))
+
+        block = header.next()
+        while block.isValid():
+            if tree.level(block) == 4 and tree.isHeader(block):
+                tree.fold(block)
+            block = block.next()
+        app.processEvents()
+        row.append(median_ms(scroll_paint, args.repeats))
+        row.append(scrollbar.maximum() + scrollbar.pageStep())
+
+        table.row(size, *row)
+        benchtools.release(editor)
+
+
+if __name__ == "__main__":
+    main()
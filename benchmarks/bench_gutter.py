@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: painting of the line number gutter (KSLineNumberArea), depending on the size of the document.
+
+Times a full repaint of the gutter, the repaint after scrolling a few lines (where only the exposed strip gets
+painted), a cursor move to another line and the width update when a line is added. All of them should stay flat.
+Runs headless: python benchmarks/bench_gutter.py [--sizes 50 50000] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+
+import benchtools
+import corpora
+from benchtools import median_ms
+
+COLUMNS = ["full_paint", "scroll_paint", "cursor_move", "add_line"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000, 50000], help="Document sizes.")
+    parser.add_argument("--repeats", type=int, default=50, help="Runs of each timing (the median is reported).")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditor
+
+    table = benchtools.Table("Gutter paint, median ms:", ["lines"] + COLUMNS, [7] + [12] * len(COLUMNS), 3)
+    for size in args.sizes:
+        editor = ksscripteditor.KSScriptEditor()
+        editor.resize(800, 600)
+        editor.show()
+        editor.setPlainText(corpora.generate("python", "regular", size))
+        app.processEvents()
+        area = editor.lineNumberArea
+        scrollbar = editor.verticalScrollBar()
+        middle = editor.document().findBlockByNumber(size // 2).position()
+
+        def full_paint():
+            area.repaint()
+
+        def scroll_paint():
+            scrollbar.setValue((scrollbar.value() + 3) % max(1, scrollbar.maximum()))
+            app.processEvents()
+
+        def cursor_move():
+            cursor = editor.textCursor()
+            cursor.setPosition(middle if cursor.position() != middle else 0)
+            editor.setTextCursor(cursor)
+            app.processEvents()
+
+        def add_line():
+            cursor = editor.textCursor()
+            cursor.insertText("\n")
+            app.processEvents()
+
+        scrollbar.setValue(scrollbar.maximum() // 2)
+        app.processEvents()
+        table.row(size, *[median_ms(func, args.repeats) for func in [full_paint, scroll_paint, cursor_move, add_line]])
+        benchtools.release(editor)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: python completion of modules and attributes (introspection.KSIntrospectionCache).
+
+Completes a few typical prefixes, as when typing them one keystroke at a time, and times (median, per keystroke):
+    - uncached_ms: the way completion worked before the cache (merging sys.modules and globals, sorting all their
+      names and calling dir() on every keystroke).
+    - cached_ms: KSScriptEditorMain.pythonCompletions through the cache.
+    - hit_rate: attributes() calls answered from the cache, after the first round.
+    - same: whether both give the same completions (leaving out the fuzzy matches, see completion.py, and up to
+      se_completion_max_results).
+Runs headless: python benchmarks/bench_introspection.py [--modules N] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import sys
+import types
+
+import benchtools
+from benchtools import median_ms, yes_no
+
+PREFIXES = ["nuke.thisNo", "os.path.joi", "re.comp", "Qt", "sys.modu"]
+
+
+def uncached_completions(completion_part, namespace):
+    """ Python completion as it was: everything is listed again on each call. """
+    module_search = '.'.join(completion_part.split('.')[:-1])
+    fragment = completion_part.split('.')[-1] if completion_part.split('.')[-1] != module_search else ''
+    all_modules = dict(sys.modules, **namespace)
+    sorted(set(list(namespace.keys()) + list(sys.modules.keys())))
+    if module_search == '':
+        names = list(all_modules)
+    elif module_search in sys.modules:
+        names = dir(sys.modules[module_search])
+    elif module_search in namespace:
+        names = dir(namespace[module_search])
+    else:
+        try:
+            parent, attribute = module_search.rsplit('.', 1)
+            names = dir(getattr(sys.modules[parent], attribute))
+        except Exception:
+            names = []
+    return sorted(x for x in names if '__' not in x and x.startswith(fragment))
+
+
+class Knobscripter(object):
+    code_language = "python"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", type=int, default=2000, help="Extra (empty) modules loaded, as in Nuke.")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs of each median timing.")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditormain, introspection, config
+    for i in range(args.modules):
+        name = "bench_module_{0}".format(i)
+        sys.modules[name] = types.ModuleType(name)
+
+    editor = ksscripteditormain.KSScriptEditorMain(Knobscripter())
+    namespace = vars(ksscripteditormain)
+    keystrokes = [prefix[:i] for prefix in PREFIXES for i in range(1, len(prefix) + 1)]
+
+    def uncached():
+        for part in keystrokes:
+            uncached_completions(part, namespace)
+
+    def cached():
+        for part in keystrokes:
+            editor.pythonCompletions(part)
+
+    row = [median_ms(uncached, args.repeats) / len(keystrokes)]
+    cache = introspection.cache()
+    cache.hits = cache.misses = 0
+    row.append(median_ms(cached, args.repeats) / len(keystrokes))
+    limit = config.prefs["se_completion_max_results"]
+    same = all(sorted(name for name in editor.pythonCompletions(part) if name.startswith(part.split('.')[-1])) ==
+               uncached_completions(part, namespace)[:limit] for part in keystrokes)  # Leaving fuzzy matches out
+
+    title = "Completing {0} keystrokes with {1} modules loaded, ms per keystroke:".format(
+        len(keystrokes), len(sys.modules))
+    table = benchtools.Table(title, ["uncached_ms", "cached_ms", "hit_rate", "same"], [12, 12, 10, 6], [3, 3, 2, 0])
+    table.row(row[0], row[1], cache.hitRate(), yes_no(same))
+    editor.deleteLater()
+    app.processEvents()
+
+
+if __name__ == "__main__":
+    main()
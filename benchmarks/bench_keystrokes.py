@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: key press latency of the script editors, depending on the size of the document.
+
+Times KSScriptEditor.keyPressEvent (and KSScriptEditorMain's for Tab) with the cursor in the middle of documents
+of growing size. Latency should stay flat. As a reference, also times the text access the key handlers did before
+(copying the whole document three times and slicing it around the cursor), which grows with the document.
+Tab after a word opens the completer, whose cost includes collecting the symbols of the document.
+Runs headless: python benchmarks/bench_keystrokes.py [--sizes 50 50000] [--presses N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+
+import benchtools
+import corpora
+from benchtools import QtCore, QtGui, median_ms
+
+Qt = QtCore.Qt
+
+# Key presses to time: (name, editor, key, modifiers, text)
+KEYS = [
+    ("character", "editor", Qt.Key_X, Qt.NoModifier, "x"),
+    ("parenthesis", "editor", Qt.Key_ParenLeft, Qt.NoModifier, "("),
+    ("quote", "editor", Qt.Key_QuoteDbl, Qt.NoModifier, '"'),
+    ("return", "editor", Qt.Key_Return, Qt.NoModifier, "\n"),
+    ("tab", "main", Qt.Key_Tab, Qt.NoModifier, "\t"),
+]
+
+
+class KnobScripterStub(object):
+    """ The little of a KnobScripter that KSScriptEditorMain needs to handle keys. """
+    code_language = "python"
+
+
+def legacy_context(editor):
+    """ The text access of the previous key handlers, for reference. """
+    cursor = editor.textCursor()
+    cpos = cursor.position()
+    apos = cursor.anchor()
+    text_before_cursor = editor.toPlainText()[:min(cpos, apos)]
+    text_after_cursor = editor.toPlainText()[max(cpos, apos):]
+    text_all = editor.toPlainText()
+    return text_before_cursor[::-1].find("\n"), text_after_cursor.find("\n"), len(text_all)
+
+
+def press(editor, key, modifiers, text):
+    """ Sends a key press to the editor's handler, at the end of the word "node" in the middle of the document. """
+    cursor = editor.textCursor()
+    cursor.setPosition(editor.middle)
+    editor.setTextCursor(cursor)
+    editor.keyPressEvent(QtGui.QKeyEvent(QtCore.QEvent.KeyPress, key, modifiers, text))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000, 50000], help="Document sizes.")
+    parser.add_argument("--presses", type=int, default=50, help="Key presses to time (the median is reported).")
+    args = parser.parse_args()
+
+    benchtools.application()
+    from KnobScripter import ksscripteditor, ksscripteditormain
+
+    table = benchtools.Table("Key press latency, median ms (cursor in the middle of the document):",
+                             ["lines", "reference"] + [k[0] for k in KEYS], [7, 10] + [11] * len(KEYS), 3)
+    for size in args.sizes:
+        text = corpora.generate("python", "regular", size)
+        editors = {
+            "editor": ksscripteditor.KSScriptEditor(),
+            "main": ksscripteditormain.KSScriptEditorMain(KnobScripterStub()),
+        }
+        for editor in editors.values():
+            editor.set_code_language("python")
+            editor.setPlainText(text)
+            block = editor.document().findBlockByNumber(size // 2)
+            while block.isValid() and "node" not in block.text():
+                block = block.next()
+            editor.middle = block.position() + block.text().find("node") + len("node") if block.isValid() else 0
+
+        row = [median_ms(lambda: legacy_context(editors["editor"]), args.presses)]
+        for name, editor_name, key, modifiers, key_text in KEYS:
+            editor = editors[editor_name]
+            row.append(median_ms(lambda: press(editor, key, modifiers, key_text), args.presses))
+        table.row(size, *row)
+        benchtools.release(*editors.values())
+
+
+if __name__ == "__main__":
+    main()
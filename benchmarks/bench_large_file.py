@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: opening big scripts, in one go (as before) and in large file mode.
+
+Writes a python corpus of each size (in MB) to a temporary file, and times:
+    - legacy_s: reading the whole file and setPlainText on a python script editor, which blocks the UI throughout.
+    - chunked_s: loading it with largefile.KSChunkedLoader (no highlighting), until it's done.
+    - max_stall_ms: the longest a single loader step kept the UI busy.
+    - rss_mb: resident memory growth after the chunked load.
+Runs headless: python benchmarks/bench_large_file.py [--sizes 10 100] [--skip-legacy]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import io
+import os
+import shutil
+import tempfile
+import timeit
+
+import benchtools
+import corpora
+from benchtools import release, rss_kb
+
+
+def rss_mb():
+    """ Returns the resident memory of the process in MB, or 0 if unknown. """
+    return (rss_kb() or 0) / 1024.0
+
+
+def write_corpus(path, megabytes):
+    """ Writes a python corpus of about the given size to path. """
+    block = corpora.generate("python", "regular", 2000) + "\n"
+    repeats = max(1, int(megabytes * 1024 * 1024 / len(block.encode("utf-8"))))
+    with io.open(path, "w", encoding="utf-8") as f:
+        for _ in range(repeats):
+            f.write(block)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[10, 100], help="File sizes, in MB.")
+    parser.add_argument("--skip-legacy", action="store_true", help="Don't time the one-go loading.")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditor, largefile
+
+    directory = tempfile.mkdtemp()
+    try:
+        table = benchtools.Table("Opening big scripts:", ["size_mb", "legacy_s", "chunked_s", "max_stall_ms", "rss_mb"],
+                                 [8, 10, 10, 13, 8], [1, 2, 2, 1, 0])
+        for size in args.sizes:
+            path = os.path.join(directory, "big_{0}.py".format(size))
+            write_corpus(path, size)
+
+            legacy = float("nan")
+            if not args.skip_legacy:
+                editor = ksscripteditor.KSScriptEditor()
+                editor.set_code_language("python")
+                start = timeit.default_timer()
+                with io.open(path, "r", encoding="utf-8") as script:
+                    editor.setPlainText(script.read())
+                legacy = timeit.default_timer() - start
+                release(editor)
+
+            rss_before = rss_mb()
+            editor = ksscripteditor.KSScriptEditor()
+            editor.set_code_language(None)
+            loader = largefile.KSChunkedLoader(editor, path)
+            stalls = []
+            step = loader.step
+
+            def timed_step():
+                step_start = timeit.default_timer()
+                step()
+                stalls.append(timeit.default_timer() - step_start)
+
+            loader.timer.timeout.disconnect()
+            loader.timer.timeout.connect(timed_step)
+            start = timeit.default_timer()
+            loader.start()
+            while loader.isLoading():
+                app.processEvents()
+            chunked = timeit.default_timer() - start
+
+            table.row(size, legacy, chunked, max(stalls) * 1000, rss_mb() - rss_before)
+            release(editor)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: line operations on a whole document (lineops, through the script editor).
+
+Selects every line of a document and times (median, including the repaint of the viewport):
+    - indent_ms / unindent_ms: Tab and Shift+Tab on the selection.
+    - comment_ms / uncomment_ms: toggling the comment of the selection, twice.
+    - restored: whether indenting and unindenting, and commenting and uncommenting, leave the text as it was.
+    - single_undo: whether a single undo reverts an indent, and a comment.
+Runs headless: python benchmarks/bench_lineops.py [--sizes 1000 10000] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+
+import benchtools
+import corpora
+from benchtools import time_ms, yes_no
+
+COLUMNS = ["indent_ms", "unindent_ms", "comment_ms", "uncomment_ms"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="Document sizes.")
+    parser.add_argument("--repeats", type=int, default=9, help="Runs of each median timing.")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditor
+
+    table = benchtools.Table("Line operations on every line, ms:", ["lines"] + COLUMNS + ["restored", "single_undo"],
+                             [7] + [12] * len(COLUMNS) + [9, 11])
+    for size in args.sizes:
+        editor = ksscripteditor.KSScriptEditor()
+        editor.resize(800, 600)
+        editor.show()
+        editor.set_code_language("python")
+        text = corpora.generate("python", "regular", size)
+        editor.setPlainText(text)
+        app.processEvents()
+
+        def run(operation):
+            editor.selectAll()
+            elapsed = time_ms(lambda: (operation(), editor.viewport().repaint()))
+            app.processEvents()
+            return elapsed
+
+        timings = dict((column, []) for column in COLUMNS)
+        restored = True
+        for _ in range(args.repeats):
+            timings["indent_ms"].append(run(lambda: editor.indentation("indent")))
+            timings["unindent_ms"].append(run(lambda: editor.indentation("unindent")))
+            restored = restored and editor.toPlainText() == text
+            timings["comment_ms"].append(run(editor.toggleComment))
+            timings["uncomment_ms"].append(run(editor.toggleComment))
+            restored = restored and editor.toPlainText() == text
+
+        single_undo = True
+        for operation in (lambda: editor.indentation("indent"), editor.toggleComment):
+            run(operation)
+            editor.undo()
+            single_undo = single_undo and editor.toPlainText() == text
+
+        row = [sorted(timings[column])[len(timings[column]) // 2] for column in COLUMNS]
+        table.row(size, *row + [yes_no(restored), yes_no(single_undo)])
+        benchtools.release(editor)
+
+
+if __name__ == "__main__":
+    main()
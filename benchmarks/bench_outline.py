@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: incremental outline (outline.KSOutlineIndex) of a python script while typing.
+
+For each document size, times:
+    - rebuild_ms: indexing the whole document (when the outline panel is shown).
+    - update_median_ms / update_max_ms: the incremental update after each edit, over a series of edits at random
+      places (characters, new lines, new definitions, deleted lines).
+    - jump_ms: clicking a symbol near the end of the outline, until the editor's cursor is on it.
+And checks that the incremental outline matches a full rebuild after all the edits.
+Runs headless: python benchmarks/bench_outline.py [--sizes 3000 20000] [--edits N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import random
+import timeit
+
+import benchtools
+import corpora
+from benchtools import QtGui, yes_no
+
+EDITS = ["x", "\n", "def added_function(value):\n    return value\n", "class Added(object):\n", "    ", None]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[300, 3000, 20000], help="Document sizes.")
+    parser.add_argument("--edits", type=int, default=300, help="Edits per document.")
+    args = parser.parse_args()
+
+    benchtools.application()
+    from KnobScripter import ksscripteditor, outline
+
+    table = benchtools.Table("Outline of a python script, ms:", ["lines", "rebuild_ms", "update_median_ms",
+                             "update_max_ms", "jump_ms", "consistent"], [7, 10, 16, 13, 8, 10], [0, 2, 3, 3, 2, 0])
+    for size in args.sizes:
+        editor = ksscripteditor.KSScriptEditor()
+        editor.set_code_language("python")
+        editor.setPlainText(corpora.generate("python", "regular", size))
+        panel = outline.KSOutlinePanel(editor)
+        index = panel.index
+        document = editor.document()
+
+        start = timeit.default_timer()
+        index.setActive(True)
+        rebuild = timeit.default_timer() - start
+        try:
+            document.contentsChange.disconnect(index.update)  # Updated by hand below, to time it
+        except (RuntimeError, TypeError):
+            pass
+
+        rng = random.Random(size)
+        times = []
+        for _ in range(args.edits):
+            block = document.findBlockByNumber(rng.randrange(document.blockCount()))
+            cursor = QtGui.QTextCursor(block)
+            edit = rng.choice(EDITS)
+            position = cursor.position()
+            removed = 0
+            if edit is None:
+                cursor.movePosition(QtGui.QTextCursor.NextBlock, QtGui.QTextCursor.KeepAnchor)
+                removed = len(cursor.selectedText())
+                cursor.removeSelectedText()
+                added = 0
+            else:
+                cursor.insertText(edit)
+                added = len(edit)
+            start = timeit.default_timer()
+            index.update(position, removed, added)
+            times.append(timeit.default_timer() - start)
+
+        incremental = list(index.items())
+        index.rebuild()
+        consistent = incremental == list(index.items())
+
+        panel.refresh()
+        tree = panel.tree
+        item = tree.topLevelItem(tree.topLevelItemCount() - 1)
+        start = timeit.default_timer()
+        panel.itemClicked(item)
+        jump = timeit.default_timer() - start
+
+        times.sort()
+        table.row(size, rebuild * 1000, times[len(times) // 2] * 1000, times[-1] * 1000, jump * 1000,
+                  yes_no(consistent))
+        benchtools.release(panel, editor)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: per-block cost of the Python highlighter's rule engine.
+
+Compares the single-pass lexer (lexer.py) against the previous engine, which ran every QRegExp rule
+over the whole block. Runs headless: python benchmarks/bench_python_highlighter.py [--lines N] [--repeat R]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import timeit
+
+import benchtools
+import corpora
+from benchtools import QtCore, QtGui
+
+# Rules of the previous engine for the monokai style, as (pattern, nth, kind), in the order they were applied.
+LEGACY_RULES = (
+    [(r"def [\w]+[\s]*\((.*)\)", 1, "argument"), (",", 0, "base"), (r"[^\(\w),.][\s]*[\w]+", 0, "base"),
+     (r"\b([\w]+)[\s]*[(]", 1, "callable")] +
+    [(r"\b%s\b" % w, 0, "keyword") for w in [
+        'and', 'assert', 'break', 'continue', 'del', 'elif', 'else', 'except', 'exec', 'finally', 'for', 'from',
+        'global', 'if', 'import', 'in', 'is', 'lambda', 'not', 'or', 'pass', 'print', 'raise', 'return', 'try',
+        'while', 'yield', 'with', 'as']] +
+    [(r"\b%s\b" % w, 0, "error") for w in [
+        'AssertionError', 'AttributeError', 'EOFError', 'FloatingPointError', 'FloatingPointError',
+        'GeneratorExit', 'ImportError', 'IndexError', 'KeyError', 'KeyboardInterrupt', 'MemoryError', 'NameError',
+        'NotImplementedError', 'OSError', 'OverflowError', 'ReferenceError', 'RuntimeError', 'StopIteration',
+        'SyntaxError', 'IndentationError', 'TabError', 'SystemError', 'SystemExit', 'TypeError',
+        'UnboundLocalError', 'UnicodeError', 'UnicodeEncodeError', 'UnicodeDecodeError', 'UnicodeTranslateError',
+        'ValueError', 'ZeroDivisionError']] +
+    [(o, 0, "operator") for o in [
+        '=', '==', '!=', '<', '<=', '>', '>=', r'\+', '-', r'\*', '/', '//', r'\%', r'\*\*', r'\+=', '-=', r'\*=',
+        '/=', r'\%=', r'\^', r'\|', r'\&', r'\~', '>>', '<<']] +
+    [(r"\b%s\b" % w, 0, "singleton") for w in ['True', 'False', 'None']] +
+    [(r"\b[0-9]+\b", 0, "number"), (r"def[\s]+([\w\.]+)", 1, "function"), (r"class[\s]+([\w\.]+)", 1, "class"),
+     (r"class[\s]+[\w\.]+[\s]*\((.*)\)", 1, "class"), (r"def[\s]+[\w]+[\s]*\(([\w]+)", 1, "argument")] +
+    [(r"\b%s\b" % w, 0, "custom") for w in ['nuke']] +
+    [(r"\b%s\b" % w, 0, "blue") for w in ['def', 'class', 'int', 'str', 'float', 'bool', 'list', 'dict', 'set']] +
+    [(r"\bself\b", 0, "self"), (r'"[^"\\]*(\\.[^"\\]*)*"', 0, "string"), (r"'[^'\\]*(\\.[^'\\]*)*'", 0, "string"),
+     (r"#[^\n]*", 0, "comment")]
+)
+
+
+def legacy_scan(expressions, text):
+    """ The previous highlightBlock loop: every rule rescans the block from column 0. """
+    runs = []
+    for expression, nth, kind in expressions:
+        index = expression.indexIn(text, 0)
+        while index >= 0:
+            index = expression.pos(nth)
+            length = len(expression.cap(nth))
+            runs.append((index, length, kind))
+            index = expression.indexIn(text, index + length)
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=5000, help="Number of lines to highlight.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions (the best one is reported).")
+    args = parser.parse_args()
+
+    benchtools.application(load_prefs=False)
+    from KnobScripter import pythonhighlighter
+
+    lines = corpora.python_regular(args.lines)
+    highlighter = pythonhighlighter.KSPythonHighlighter(QtGui.QTextDocument())
+    block_lexer = highlighter.styles["monokai"]["lexer"]
+    expressions = [(QtCore.QRegExp(pattern), nth, kind) for (pattern, nth, kind) in LEGACY_RULES]
+
+    legacy = min(timeit.repeat(lambda: [legacy_scan(expressions, line) for line in lines],
+                               number=1, repeat=args.repeat))
+    combined = min(timeit.repeat(lambda: [block_lexer.scan(line, 0) for line in lines],
+                                 number=1, repeat=args.repeat))
+
+    table = benchtools.Table("Python highlighter rules, us per block:",
+                             ["blocks", "previous_rule_loop", "single_pass_lexer", "speedup"], [7, 18, 17, 7],
+                             [0, 2, 2, 1])
+    table.row(len(lines), legacy * 1e6 / len(lines), combined * 1e6 / len(lines), legacy / combined)
+
+
+if __name__ == "__main__":
+    main()
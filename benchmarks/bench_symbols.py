@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: python completion of the names defined in the document (symbols.KSSymbolIndex).
+
+For each document size, times:
+    - getpyobjects_ms: median of finding the names with getPyObjects over the whole text, as completion did.
+    - index_build_ms: building the index from scratch (i.e. right after loading).
+    - complete_ms: median of completing a prefix with the index up to date.
+    - edit_complete_ms: median of typing a line mid-document and completing again (one block is scanned again).
+    - same_names: whether the index has the names getPyObjects finds, plus the ones in the edits.
+Runs headless: python benchmarks/bench_symbols.py [--sizes 3000 20000] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import timeit
+
+import benchtools
+import corpora
+from benchtools import QtGui, median_ms, yes_no
+
+COLUMNS = ["getpyobjects_ms", "index_build_ms", "complete_ms", "edit_complete_ms"]
+
+
+class Knobscripter(object):
+    code_language = "python"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3000, 20000], help="Document sizes.")
+    parser.add_argument("--repeats", type=int, default=15, help="Runs of each median timing.")
+    args = parser.parse_args()
+
+    app = benchtools.application()
+    from KnobScripter import ksscripteditormain
+
+    table = benchtools.Table("Completing document names, ms:", ["lines"] + COLUMNS + ["same_names"],
+                             [7] + [16] * len(COLUMNS) + [10])
+    for size in args.sizes:
+        editor = ksscripteditormain.KSScriptEditorMain(Knobscripter())
+        editor.set_code_language("python")
+        editor.setPlainText(corpora.generate("python", "regular", size))
+        while editor.highlighter.lazy:
+            app.processEvents()
+        app.processEvents()
+        index = editor.symbol_index
+
+        row = [median_ms(lambda: editor.getPyObjects(editor.toPlainText()), 3)]
+        index.reset()
+        start = timeit.default_timer()
+        index.refresh()
+        row.append((timeit.default_timer() - start) * 1000)
+        row.append(median_ms(lambda: index.complete("n"), args.repeats))
+
+        edits = [0]
+
+        def edit_complete():
+            edits[0] += 1
+            middle = editor.document().findBlockByNumber(size // 2)
+            position = middle.position()
+            line = "bench_name_{0} = {0}\n".format(edits[0])
+            QtGui.QTextCursor(middle).insertText(line)
+            index.update(position, 0, len(line))  # contentsChange isn't delivered to python in some bindings
+            index.complete("bench_name")
+
+        row.append(median_ms(edit_complete, args.repeats))
+        expected = set(editor.getPyObjects(editor.toPlainText()))
+        same = set(index.complete("")) == expected
+
+        table.row(size, *row + [yes_no(same)])
+        benchtools.release(editor)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+""" Benchmark: usage-ranked completion (usage.KSUsageStore, and the scores given to KSCompletionSearch).
+
+Fills a store with picks of synthetic names spread over a few months, then times (median):
+    - record_us: counting one pick (in memory, the file is written later in the background).
+    - search_ms / ranked_ms: a keystroke of completion without and with the usage scores.
+    - flush_ms: writing the store, and its size in KB.
+Also checks the ranking: a name picked often a week ago, and one picked as often long ago, against alphabetical order.
+Runs headless: python benchmarks/bench_usage.py [--names N] [--picks N] [--repeats N]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+import timeit
+
+import benchtools
+from bench_completion import synthetic_names
+from benchtools import median_ms
+
+TYPED = ["thisNode", "set_value", "knobChanged", "inp"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--names", type=int, default=50000, help="Number of completion candidates.")
+    parser.add_argument("--picks", type=int, default=20000, help="Picks recorded before timing.")
+    parser.add_argument("--repeats", type=int, default=15, help="Runs of each median timing.")
+    args = parser.parse_args()
+
+    from KnobScripter import prefs, completion, usage
+    prefs.load_prefs()
+    directory = tempfile.mkdtemp()
+    try:
+        store = usage.KSUsageStore(os.path.join(directory, "usage.json"), half_life_days=14, max_entries=2000)
+        store.scheduleFlush = lambda: None  # Flushed by hand below
+        names = synthetic_names(args.names)
+        random.seed(args.picks)
+        now = time.time()
+        for _ in range(args.picks):
+            store.record("completions/python", random.choice(names), now - random.uniform(0, 120 * 86400))
+
+        start = timeit.default_timer()
+        for name in names[:1000]:
+            store.record("completions/python", name, now)
+        record_us = (timeit.default_timer() - start) * 1000
+
+        candidates = completion.candidates(names)
+        scores = store.scores("completions/python")
+        used = completion.candidates(store.names("completions/python"))
+        keystrokes = [word[:i] for word in TYPED for i in range(1, len(word) + 1)]
+        search = completion.KSCompletionSearch()
+
+        def plain():
+            for typed in keystrokes:
+                search.search(typed, [candidates])
+
+        def ranked():
+            for typed in keystrokes:
+                search.search(typed, [candidates], scores=scores, used=used)
+
+        search_ms = median_ms(plain, args.repeats) / len(keystrokes)
+        ranked_ms = median_ms(ranked, args.repeats) / len(keystrokes)
+
+        store._dirty = True
+        flush_ms = median_ms(lambda: (setattr(store, "_dirty", True), store.flush()), args.repeats)
+        size_kb = os.path.getsize(store.path) / 1024.0
+
+        # Ranking: "setValueRecent" picked 5 times a week ago, "setValueOld" 5 times a year ago
+        for when in (now - 7 * 86400, now - 365 * 86400):
+            for _ in range(5):
+                store.record("completions/python", "setValueRecent" if when > now - 30 * 86400 else "setValueOld", when)
+        extra = completion.candidates(["setValueAlpha", "setValueOld", "setValueRecent"])
+        order = search.search("setValue", [extra], scores=store.scores("completions/python"))
+
+        title = "Usage store with {0} picks of {1} names ({2} kept):".format(
+            args.picks + 1000, args.names, len(store.scores("completions/python")))
+        table = benchtools.Table(title, ["record_us", "search_ms", "ranked_ms", "flush_ms", "size_kb"],
+                                 [10, 10, 10, 9, 8], [2, 3, 3, 2, 1])
+        table.row(record_us, search_ms, ranked_ms, flush_ms, size_kb)
+        print("  Ranked: {0} (week-old score {1:.2f}, year-old {2:.4f})".format(
+            ", ".join(order), store.score("completions/python", "setValueRecent"),
+            store.score("completions/python", "setValueOld")))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
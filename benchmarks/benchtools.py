@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+""" Shared setup and helpers of the KnobScripter benchmarks.
+
+Importing it makes KnobScripter importable headless: the repository and the benchmarks are put in sys.path, Qt
+uses the offscreen platform (unless another one is set), and the nuke stub (nuke_stub.py) is installed. Every
+benchmark imports it before anything else, and takes the Qt modules from it:
+    from benchtools import QtCore, QtGui, QtWidgets
+It also has the timing helpers the benchmarks share, and Table, which prints their results.
+
+adrianpueyo.com
+
+"""
+
+import os
+import sys
+import timeit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+for path in (REPOSITORY_DIR, BENCHMARKS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import nuke_stub
+
+nuke_stub.install()
+
+try:
+    from PySide2 import QtCore, QtGui, QtWidgets
+except ImportError:
+    from Qt import QtCore, QtGui, QtWidgets
+
+
+def application(load_prefs=True):
+    """ Returns the QApplication (created if needed), with the KnobScripter prefs loaded unless load_prefs is False. """
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv)
+    if load_prefs:
+        from KnobScripter import prefs
+        prefs.load_prefs()
+    return app
+
+
+def time_ms(func):
+    """ Returns the time of a single run of func, in ms. """
+    start = timeit.default_timer()
+    func()
+    return (timeit.default_timer() - start) * 1000
+
+
+def median_ms(func, count):
+    """ Returns the median time of count runs of func, in ms. """
+    times = sorted(time_ms(func) for _ in range(count))
+    return times[len(times) // 2]
+
+
+def best_ms(func, setup=None, repeat=1):
+    """ Returns the best time of func in ms, over repeat runs. setup's result (if any) is passed to func. """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = timeit.default_timer()
+        func(arg)
+        times.append(timeit.default_timer() - start)
+    return min(times) * 1000
+
+
+def rss_kb():
+    """ Returns the resident memory of the process in KB, or None if unknown. """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (IOError, OSError, ValueError, AttributeError):
+        return None
+
+
+def yes_no(value):
+    """ Formats a check for a table: failures stand out. """
+    return "yes" if value else "NO"
+
+
+def release(*widgets):
+    """ Deletes the widgets (i.e. the editors of a size) now, so they don't weigh on the next measures. """
+    for widget in widgets:
+        widget.close()
+        widget.deleteLater()
+    QtWidgets.QApplication.sendPostedEvents(None, QtCore.QEvent.DeferredDelete)
+
+
+class Table(object):
+    """
+    Prints results as a table, a row at a time: the title and the column names when created, then row(values).
+    widths and precisions are either one for all the columns or a list, one per column. Floats are printed with
+    their column's precision, anything else as is.
+    """
+
+    def __init__(self, title, columns, widths=12, precisions=2):
+        self.columns = columns
+        self.widths = widths if isinstance(widths, (list, tuple)) else [widths] * len(columns)
+        self.precisions = precisions if isinstance(precisions, (list, tuple)) else [precisions] * len(columns)
+        print(title)
+        print("".join("  {0:>{1}}".format(column, width) for column, width in zip(columns, self.widths)))
+
+    def row(self, *values):
+        cells = []
+        for value, width, precision in zip(values, self.widths, self.precisions):
+            if isinstance(value, float):
+                cells.append("  {0:>{1}.{2}f}".format(value, width, precision))
+            else:
+                cells.append("  {0:>{1}}".format("-" if value is None else value, width))
+        print("".join(cells))
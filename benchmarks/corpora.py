@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+""" Synthetic Python and Blink documents for the KnobScripter benchmarks.
+
+All generators are deterministic, and return a list of lines. Each language has three corpora:
+    - regular: Typical (and quite repetitive) Nuke callback code, or templated blink kernels.
+    - long_lines: The regular corpus, with a pathological very long line every LONG_LINE_EVERY lines.
+    - nesting: Deep nesting of multi-line regions: triple-quoted strings containing the other quotes
+      and escaped delimiters (python), or /* */ comments and continued preprocessor lines (blink).
+
+adrianpueyo.com
+
+"""
+
+LONG_LINE_EVERY = 100
+LONG_LINE_LENGTH = 20000
+
+PYTHON_LINES = [
+    "n = nuke.thisNode()",
+    "k = nuke.thisKnob()",
+    "if k.name() == \"inputChange\":",
+    "    for i in range(n.inputs()):  # Check every input",
+    "        n.knob('label').setValue(\"Input %d\" % i)",
+    "def update_knobs_{i}(node, knob=None, force=False):",
+    "    \"\"\" Updates the knobs of the node. \"\"\"",
+    "    value = int(node['size'].value()) * 2 + {i}",
+    "    try:",
+    "        node.knob(\"mix\").setValue(float(value) / 100.0)",
+    "    except (ValueError, NameError):",
+    "        return None",
+    "class Helper{i}(object):",
+    "    def __init__(self, name):",
+    "        self.name = name",
+    "",
+]
+
+PYTHON_NESTING_LINES = [
+    "def nested_{i}():",
+    "    '''Docstring with \"\"\" inside, and an escaped \\''' too.",
+    "    text = \"\"\"not a string start, still in the docstring",
+    "    '''",
+    "    text = \"\"\"Triple-quoted {i} with ''' and \\\"\"\" inside",
+    "    def fake():  # Still inside the string",
+    "        return 'quotes \" and \\' everywhere'",
+    "    \"\"\" + r'''raw ''' + f\"\"\"{{x}} \"\"\"  # Several on one line",
+    "    s = 'continued \\",
+    "    string' + \"another \\\\\" + \"{i}\"",
+    "",
+]
+
+BLINK_HEADER = [
+    "#define CLAMP_{n}(x) \\",
+    "    clamp(x, 0.0f, 1.0f)",
+    "/* Kernel {n}: templated blur",
+    "   with a multi-line comment */",
+    "kernel BlurKernel{n} : ImageComputationKernel<ePixelWise>",
+    "{{",
+    "  Image<eRead, eAccessRanged2D, eEdgeClamped> src;",
+    "  Image<eWrite> dst;",
+    "  param:",
+    "    int radius;  // Blur radius",
+    "    float4 tint;",
+    "  local:",
+    "    float3x3 weights;",
+    "  void define() {{",
+    "    defineParam(radius, \"Radius\", 5);",
+    "  }}",
+    "  void init() {{",
+    "    src.setRange(-radius, -radius, radius, radius);",
+    "  }}",
+    "  void process(int2 pos) {{",
+    "    float4 sum = 0.0f;",
+]
+
+BLINK_BODY = [
+    "    for (int j = -radius; j <= radius; j++) {{",
+    "      for (int i = -radius; i <= radius; i++) {{",
+    "        sum += src(i, j) * weights[{k} % 3][{k} % 3];  /* inline */",
+    "      }}",
+    "    }}",
+]
+
+BLINK_FOOTER = [
+    "    dst() = CLAMP_{n}(sum / float((2 * radius + 1) * (2 * radius + 1))) * tint;",
+    "  }}",
+    "}};",
+    "",
+]
+
+BLINK_NESTING_LINES = [
+    "/* Outer comment {i} /* not nested in C,",
+    "   \"strings /* are comments here\" */ int a{i} = 0; /* and",
+    "   another one */ float b{i} = 1.0f; // trailing /* ignored",
+    "#define MACRO_{i}(x) \\",
+    "    /* comment in a macro */ \\",
+    "    ((x) * 2)",
+    "float4 s{i} = \"a string with /* and */ and \\\" inside\";",
+    "",
+]
+
+
+def python_regular(count):
+    """ Returns count lines of typical Nuke python code. """
+    return [PYTHON_LINES[i % len(PYTHON_LINES)].format(i=i // len(PYTHON_LINES)) for i in range(count)]
+
+
+def python_nesting(count):
+    """ Returns count lines of python with deeply nested and escaped triple-quoted strings. """
+    return [PYTHON_NESTING_LINES[i % len(PYTHON_NESTING_LINES)].format(i=i) for i in range(count)]
+
+
+def blink_regular(count):
+    """ Returns count lines of generated, templated blink kernels. """
+    lines = []
+    n = 0
+    while len(lines) < count:
+        lines += [line.format(n=n) for line in BLINK_HEADER]
+        for k in range(20):
+            lines += [line.format(k=k) for line in BLINK_BODY]
+        lines += [line.format(n=n) for line in BLINK_FOOTER]
+        n += 1
+    return lines[:count]
+
+
+def blink_nesting(count):
+    """ Returns count lines of blink with many multi-line comments and continued preprocessor lines. """
+    return [BLINK_NESTING_LINES[i % len(BLINK_NESTING_LINES)].format(i=i) for i in range(count)]
+
+
+def with_long_lines(lines, long_line):
+    """ Replaces one line every LONG_LINE_EVERY with the given (very long) line. """
+    lines = list(lines)
+    for i in range(LONG_LINE_EVERY // 2, len(lines), LONG_LINE_EVERY):
+        lines[i] = long_line
+    return lines
+
+
+def python_long_lines(count):
+    item = "'knob_{0}': nuke.toNode('Node{0}')['value'].getValue() * {0}, "
+    long_line = "values = {" + "".join(item.format(i) for i in range(LONG_LINE_LENGTH // len(item)))
+    return with_long_lines(python_regular(count), long_line + "}")
+
+
+def blink_long_lines(count):
+    item = "src({0}, {0}) * weights[{0} % 3][0] + "
+    long_line = "    sum += " + "".join(item.format(i) for i in range(LONG_LINE_LENGTH // len(item)))
+    return with_long_lines(blink_regular(count), long_line + "0.0f;")
+
+
+CORPORA = {
+    "python": {
+        "regular": python_regular,
+        "long_lines": python_long_lines,
+        "nesting": python_nesting,
+    },
+    "blink": {
+        "regular": blink_regular,
+        "long_lines": blink_long_lines,
+        "nesting": blink_nesting,
+    },
+}
+
+
+def generate(language, corpus, count):
+    """ Returns the text of the given corpus, with count lines. """
+    return "\n".join(CORPORA[language][corpus](count))
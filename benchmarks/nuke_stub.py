@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+""" Nuke stub: minimal stand-in for the nuke and nukescripts modules, so KnobScripter can be imported headless.
+
+Only meant for the benchmarks and the tests. Any attribute or call that isn't defined here returns a permissive
+dummy object.
+
+adrianpueyo.com
+
+"""
+
+import sys
+import types
+
+
+class _Dummy(object):
+    """ Object that accepts any attribute access or call. """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return _Dummy()
+
+    def __getattr__(self, name):
+        return _Dummy()
+
+    def __iter__(self):
+        return iter([])
+
+    def __bool__(self):
+        return False
+
+    __nonzero__ = __bool__
+
+    def name(self):
+        return "untitled"
+
+    def fullName(self):
+        return "root"
+
+    def value(self):
+        return ""
+
+
+def install(nuke_version_major=13):
+    """ Registers the stub nuke and nukescripts modules in sys.modules (unless the real ones are available). """
+    if "nuke" in sys.modules:
+        return sys.modules["nuke"]
+
+    nuke = types.ModuleType("nuke")
+    nuke.NUKE_VERSION_MAJOR = nuke_version_major
+    nuke.NUKE_VERSION_MINOR = 0
+    nuke.NUKE_VERSION_STRING = "{0}.0v1".format(nuke_version_major)
+    nuke.tprint = lambda *args: None
+    nuke.message = lambda *args: None
+    nuke.ask = lambda *args: True
+    nuke.selectedNodes = lambda *args: []
+    nuke.exists = lambda *args: False
+    nuke.menu = _Dummy()
+    nuke.toNode = _Dummy()
+    nuke.root = _Dummy()
+    nuke.getPaneFor = lambda *args: None
+    nuke.runIn = lambda *args: None
+
+    nukescripts = types.ModuleType("nukescripts")
+    panels = types.ModuleType("nukescripts.panels")
+    panels.registerWidgetAsPanel = lambda *args, **kwargs: None
+    nukescripts.panels = panels
+
+    sys.modules["nuke"] = nuke
+    sys.modules["nukescripts"] = nukescripts
+    sys.modules["nukescripts.panels"] = panels
+    return nuke
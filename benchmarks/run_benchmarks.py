@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+""" KnobScripter benchmark suite: highlighters and script editor, headless, on synthetic corpora.
+
+For each language (python, blink), corpus (see corpora.py) and document size, measures:
+    - load_plain_ms: KSScriptEditor.setPlainText with no highlighter, as a baseline.
+    - load_ms: setPlainText with the highlighter and default prefs (big documents get lazy highlighting,
+      so this is the time until the viewport is highlighted).
+    - full_highlight_ms: setPlainText highlighting the whole document synchronously, with a cold run cache.
+    - full_highlight_warm_ms: The same, with the run cache already filled.
+    - rehighlight_ms: highlighter.rehighlight() on the highlighted document (restyle).
+    - keystroke_ms: Median time to insert a character mid-document (rehighlight of the edited block).
+    - keypress_ms: Median time of a key press through KSScriptEditor.keyPressEvent.
+    - open_region_ms: Time to open a multi-line region at the top (\"\"\" or /*), re-lexing the rest.
+    - python_kb / rss_kb: Python heap (tracemalloc) and resident memory growth for a highlighted editor.
+
+Results are printed and can be saved as JSON (--output), and compared against a previous run (--compare).
+Usage: python benchmarks/run_benchmarks.py [--sizes 100 1000] [--languages python] [--output results.json]
+
+adrianpueyo.com
+
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import benchtools
+import corpora
+from benchtools import QtCore, QtGui, best_ms, median_ms, rss_kb
+
+DEFAULT_SIZES = [100, 1000, 10000, 100000]
+BIG_DOCUMENT_LINES = 10000  # From this size on, the timings are run only once
+REGION_OPENERS = {"python": '"""', "blink": "/*"}
+METRICS = ["load_plain_ms", "load_ms", "full_highlight_ms", "full_highlight_warm_ms", "rehighlight_ms",
+           "keystroke_ms", "keypress_ms", "open_region_ms", "python_kb", "rss_kb"]
+
+
+class Suite(object):
+
+    def __init__(self, args):
+        self.args = args
+        self.app = benchtools.application()
+
+        from KnobScripter import config, kshighlighter, ksscripteditor
+        self.config = config
+        self.kshighlighter = kshighlighter
+        self.ksscripteditor = ksscripteditor
+        self.lazy_blocks = config.prefs["se_lazy_highlight_blocks"]
+
+    def editor(self, language=None, lazy=True):
+        self.config.prefs["se_lazy_highlight_blocks"] = self.lazy_blocks if lazy else sys.maxsize
+        editor = self.ksscripteditor.KSScriptEditor()
+        editor.resize(800, 600)
+        if language:
+            editor.set_code_language(language)
+        return editor
+
+    def release(self, *editors):
+        benchtools.release(*editors)
+
+    def load_ms(self, text, language, repeat, lazy=True, cold=False):
+        """ Returns the best time to setPlainText on a new editor, in ms. """
+        times = []
+        for _ in range(repeat):
+            if cold:
+                self.kshighlighter.run_cache().clear()
+            editor = self.editor(language, lazy)
+            times.append(best_ms(lambda e: editor.setPlainText(text)))
+            self.release(editor)
+        return min(times)
+
+    @staticmethod
+    def optional(metric, func, *args):
+        """ Returns func(*args), or None if it fails (i.e. Qt bindings without support for something). """
+        try:
+            return func(*args)
+        except Exception as e:
+            sys.stderr.write("Couldn't measure {0}: {1!r}\n".format(metric, e))
+            return None
+
+    def run_case(self, language, corpus, size):
+        text = corpora.generate(language, corpus, size)
+        repeat = 1 if size >= BIG_DOCUMENT_LINES else self.args.repeat
+        result = {"language": language, "corpus": corpus, "lines": size, "chars": len(text)}
+
+        result["load_plain_ms"] = self.load_ms(text, None, repeat)
+        result["load_ms"] = self.load_ms(text, language, repeat)
+        result["full_highlight_ms"] = self.load_ms(text, language, repeat, lazy=False, cold=True)
+        result["full_highlight_warm_ms"] = self.load_ms(text, language, repeat, lazy=False)
+
+        editor = self.editor(language, lazy=False)
+        editor.setPlainText(text)
+        result["rehighlight_ms"] = best_ms(lambda e: editor.highlighter.rehighlight(), repeat=repeat)
+
+        # Keystrokes in the middle of the document
+        block = editor.document().findBlockByNumber(size // 2)
+        cursor = QtGui.QTextCursor(block)
+        cursor.movePosition(QtGui.QTextCursor.Right, QtGui.QTextCursor.MoveAnchor, min(4, block.length() - 1))
+        result["keystroke_ms"] = median_ms(lambda: cursor.insertText("x"), self.args.keystrokes)
+
+        editor.setTextCursor(cursor)
+        event = QtGui.QKeyEvent(QtCore.QEvent.KeyPress, QtCore.Qt.Key_X, QtCore.Qt.NoModifier, "x")
+        result["keypress_ms"] = self.optional("keypress_ms", median_ms, lambda: editor.keyPressEvent(event),
+                                              self.args.keystrokes)
+
+        # Opening a multi-line region at the top re-lexes everything after it
+        cursor = QtGui.QTextCursor(editor.document())
+        result["open_region_ms"] = best_ms(lambda e: cursor.insertText(REGION_OPENERS[language]))
+        self.release(editor)
+
+        # Memory of a highlighted editor
+        rss_before = rss_kb()
+        tracemalloc.start()
+        self.kshighlighter.run_cache().clear()
+        editor = self.editor(language, lazy=False)
+        editor.setPlainText(text)
+        result["python_kb"] = tracemalloc.get_traced_memory()[0] // 1024
+        tracemalloc.stop()
+        rss_after = rss_kb()
+        result["rss_kb"] = rss_after - rss_before if rss_before is not None else None
+        self.release(editor)
+
+        self.config.prefs["se_lazy_highlight_blocks"] = self.lazy_blocks
+        return result
+
+    def run(self):
+        results = []
+        for language in self.args.languages:
+            for corpus in self.args.corpora:
+                for size in self.args.sizes:
+                    result = self.run_case(language, corpus, size)
+                    results.append(result)
+                    print_result(result)
+        return results
+
+
+def metadata():
+    from KnobScripter.info import __version__
+    return {
+        "knobscripter_version": __version__,
+        "python": platform.python_version(),
+        "qt": QtCore.qVersion(),
+        "platform": platform.platform(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+def print_result(result):
+    print("{language:6} {corpus:10} {lines:>7} lines".format(**result))
+    for metric in METRICS:
+        if result.get(metric) is not None:
+            print("    {0:24} {1:12.2f}".format(metric, result[metric]))
+
+
+def compare(results, baseline_path):
+    """ Prints the ratio of each metric against a previous JSON run (< 1 means faster or smaller). """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    baseline_results = dict(((r["language"], r["corpus"], r["lines"]), r) for r in baseline["results"])
+    print("\nCompared to {0} ({1}):".format(baseline_path, baseline["meta"].get("knobscripter_version")))
+    for result in results:
+        old = baseline_results.get((result["language"], result["corpus"], result["lines"]))
+        if old is None:
+            continue
+        ratios = []
+        for metric in METRICS:
+            if result.get(metric) is not None and old.get(metric):
+                ratios.append("{0}={1:.2f}".format(metric, float(result[metric]) / old[metric]))
+        print("{language:6} {corpus:10} {lines:>7}: ".format(**result) + ", ".join(ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Document sizes, in lines.")
+    parser.add_argument("--languages", nargs="+", default=sorted(corpora.CORPORA.keys()), help="Languages.")
+    parser.add_argument("--corpora", nargs="+", default=["regular", "long_lines", "nesting"], help="Corpora.")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetitions (the best one is reported).")
+    parser.add_argument("--keystrokes", type=int, default=20, help="Keystrokes to time (the median is reported).")
+    parser.add_argument("--output", help="Save the results to this JSON file.")
+    parser.add_argument("--compare", help="Compare the results against this JSON file from a previous run.")
+    args = parser.parse_args()
+
+    suite = Suite(args)
+    results = suite.run()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"meta": metadata(), "results": results}, f, indent=4, sort_keys=True)
+        print("\nResults saved to {0}".format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+""" Shared setup of the KnobScripter tests: KnobScripter runs headless, as in the benchmarks (see benchtools.py).
+
+Run from the repository: python -m pytest tests
+
+adrianpueyo.com
+
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import benchtools
+
+
+@pytest.fixture(scope="session")
+def app():
+    return benchtools.application()
+
+
+@pytest.fixture
+def document(app):
+    """ Returns a function making a QTextDocument with the given text, laid out as in a script editor. """
+    documents = []
+
+    def make(text):
+        document = benchtools.QtGui.QTextDocument()
+        document.setDocumentLayout(benchtools.QtWidgets.QPlainTextDocumentLayout(document))
+        document.setPlainText(text)
+        documents.append(document)
+        return document
+
+    return make
+
+
+@pytest.fixture
+def editor(app):
+    """ A python KSScriptEditor, deleted after the test. """
+    from KnobScripter import ksscripteditor
+    editor = ksscripteditor.KSScriptEditor()
+    editor.set_code_language("python")
+    yield editor
+    benchtools.release(editor)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+""" Tests of brackets: KSBracketIndex.match skips strings and comments, and finds partners across chunks of blocks.
+
+adrianpueyo.com
+
+"""
+
+import pytest
+
+from KnobScripter import brackets
+
+LINES = [
+    "values = [",  # 0
+    "    ']', \"[\",  # ] (",  # 1
+    "    (1, {2: [3]}),",  # 2
+    "]",  # 3
+]
+
+
+def set_text(editor, text, chunk_blocks=None):
+    index = editor.bracket_index
+    if chunk_blocks:
+        index.chunk_blocks = chunk_blocks
+    editor.setPlainText(text)
+    editor.highlighter.rehighlight()  # Lexed, so the brackets in strings and comments are known
+    index.reset()
+    return index
+
+
+def finish(index):
+    """ Runs the background summaries to the end. """
+    while index.timer.isActive():
+        index.summarizeStep()
+
+
+def position(editor, number, column):
+    return editor.document().findBlockByNumber(number).position() + column
+
+
+def test_code_brackets():
+    assert brackets.code_brackets("a(b[')'])", [(4, 3)]) == [(1, "("), (3, "["), (7, "]"), (8, ")")]
+
+
+def test_match_skips_strings_and_comments(editor):
+    index = set_text(editor, "\n".join(LINES))
+    opener = position(editor, 0, 9)
+    closer = position(editor, 3, 0)
+    assert index.match(opener) == closer
+    assert index.match(closer) == opener
+    assert index.match(position(editor, 1, 5)) is None  # In a string
+    assert index.match(position(editor, 1, 16)) is None  # In a comment
+    assert index.match(position(editor, 0, 0)) is None
+
+
+def test_match_nested(editor):
+    index = set_text(editor, "\n".join(LINES))
+    assert index.match(position(editor, 2, 4)) == position(editor, 2, 16)
+    assert index.match(position(editor, 2, 12)) == position(editor, 2, 14)
+    assert index.match(position(editor, 2, 15)) == position(editor, 2, 8)
+    assert index.enclosing(position(editor, 2, 13)) == position(editor, 2, 12)
+    assert index.enclosing(position(editor, 0, 3)) == -1
+
+
+def test_unmatched(editor):
+    index = set_text(editor, "((\n)\n]")
+    assert index.match(0) == -1
+    assert index.match(1) == position(editor, 1, 0)
+    assert index.match(position(editor, 2, 0)) == -1
+
+
+@pytest.mark.parametrize("background", [False, True])
+def test_match_across_chunks(editor, background):
+    lines = ["data = {"] + ["    'k{0}': (v[{0}], \"}}\"),".format(i) for i in range(60)] + ["}", "x = ()"]
+    index = set_text(editor, "\n".join(lines), chunk_blocks=8)
+    assert len(index.chunks) > 4
+    if background:
+        finish(index)  # Chunks found through the trees
+        assert index.trees is not None
+    else:
+        index.timer.stop()  # Chunks walked
+    opener = position(editor, 0, 7)
+    closer = position(editor, 61, 0)
+    assert index.match(opener) == closer
+    assert index.match(closer) == opener
+    assert index.match(position(editor, 62, 4)) == position(editor, 62, 5)
+
+
+def test_match_within_budget(editor):
+    lines = ["values = ["] + ["    {0},".format(i) for i in range(100)] + ["]"]
+    index = set_text(editor, "\n".join(lines), chunk_blocks=8)
+    index.timer.stop()
+    assert index.match(position(editor, 0, 9), budget=10) == brackets.UNKNOWN
+    assert index.waiting
+    finish(index)
+    assert index.match(position(editor, 0, 9), budget=10) == position(editor, 101, 0)
+
+
+def test_edits_forget_summaries(editor):
+    lines = ["values = ["] + ["    {0},".format(i) for i in range(40)] + ["]"]
+    index = set_text(editor, "\n".join(lines), chunk_blocks=8)
+    finish(index)
+    cursor = brackets.QtGui.QTextCursor(editor.document().findBlockByNumber(20))
+    cursor.insertText("]\n")
+    index.update(cursor.position() - 2, 0, 2)
+    assert index.match(position(editor, 0, 9)) == position(editor, 20, 0)
+    cursor.deletePreviousChar()
+    cursor.deletePreviousChar()
+    index.update(cursor.position(), 2, 0)
+    assert index.match(position(editor, 0, 9)) == position(editor, 41, 0)
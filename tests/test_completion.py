@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+""" Tests of completion: how KSCompletionSearch ranks prefix, other case and fuzzy matches, and usage scores.
+
+adrianpueyo.com
+
+"""
+
+from KnobScripter import completion
+
+NAMES = ["thisNode", "toNode", "TNode", "tnode", "atn", "nodes", "t_n"]
+
+
+def search(query, names=NAMES, **kwargs):
+    kwargs.setdefault("limit", 10)
+    return completion.KSCompletionSearch().search(query, [completion.KSCandidates(names)], **kwargs)
+
+
+def test_fuzzy_score():
+    assert completion.fuzzy_score("tn", "thisNode") == 4  # Both on word starts
+    assert completion.fuzzy_score("tn", "t_n") == 4
+    assert completion.fuzzy_score("tn", "atn") == 2  # After a gap, then consecutive
+    assert completion.fuzzy_score("tn", "nodes") is None
+
+
+def test_ranking():
+    # Prefix as typed, then in another case, then fuzzy by score and length
+    assert search("tn") == ["tnode", "TNode", "t_n", "toNode", "thisNode", "atn"]
+
+
+def test_single_character():
+    assert search("n") == ["nodes"]  # No fuzzy matches
+    assert search("") == sorted(NAMES)
+
+
+def test_limit():
+    assert search("tn", limit=3) == ["tnode", "TNode", "t_n"]
+    assert search("", limit=2) == ["TNode", "atn"]
+
+
+def test_usage_scores():
+    scores = {"thisNode": 5, "TNode": 1}
+    assert search("tn", scores=scores) == ["tnode", "TNode", "thisNode", "t_n", "toNode", "atn"]
+    assert search("", scores=scores) == ["thisNode", "TNode", "atn", "nodes", "t_n", "tnode", "toNode"]
+
+
+def test_used_past_limit():
+    names = ["node{0:02}".format(i) for i in range(100)]
+    used = completion.KSCandidates(["node99", "other"])
+    assert search("node", names, limit=5) == names[:5]
+    assert search("node", names, limit=5, scores={"node99": 2}, used=used) == ["node99"] + names[:4]
+
+
+def test_incremental_search():
+    searcher = completion.KSCompletionSearch()
+    sources = [completion.KSCandidates(NAMES), completion.KSCandidates(["thenNext", "tN"])]
+    for query in ["t", "th", "thn", "thN", "to", "toN"]:
+        fresh = completion.KSCompletionSearch().search(query, sources, limit=10)
+        assert searcher.search(query, sources, limit=10) == fresh
+
+
+def test_big_lists():
+    candidates = completion.KSCandidates(NAMES)
+    candidates.fuzzy_scan_limit = 2  # Only the names starting with the same character are tried
+    assert "atn" not in completion.KSCompletionSearch().search("tn", [candidates], limit=10)
+
+
+def test_candidates():
+    candidates = completion.KSCandidates(["b", "a", "__init__", "a"], hide_dunder=True)
+    assert candidates.names == ["a", "b"]
+    assert candidates.prefixed("a") == ["a"]
+    names = ["x", "y"]
+    assert completion.candidates(names) is completion.candidates(names)
+    assert completion.candidates(names, key="v2") is not completion.candidates(names, key="v1")
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+""" Tests of folding: the fold ranges KSFoldTree finds by indentation, and folding, unfolding and restoring them.
+
+adrianpueyo.com
+
+"""
+
+import pytest
+
+from KnobScripter import folding
+
+TEXT = "\n".join([
+    "def a():",  # 0
+    "    if x:",  # 1
+    "        pass",  # 2
+    "",  # 3
+    "    return 1",  # 4
+    "",  # 5
+    "def b():",  # 6
+    "\tpass",  # 7
+    "end",  # 8
+])
+
+
+@pytest.fixture
+def tree(document):
+    return folding.KSFoldTree(document(TEXT))
+
+
+def block(tree, number):
+    return tree.document.findBlockByNumber(number)
+
+
+def visible(tree):
+    return [number for number in range(tree.document.blockCount()) if block(tree, number).isVisible()]
+
+
+@pytest.mark.parametrize("number, end", [(0, 4), (1, 2), (2, -1), (3, -1), (4, -1), (5, -1), (6, 7), (7, -1), (8, -1)])
+def test_fold_end(tree, number, end):
+    assert tree.foldEnd(block(tree, number)) == end
+    assert tree.isHeader(block(tree, number)) == (end >= 0)
+
+
+def test_indentation_level():
+    assert folding.indentation_level("  \t x") == 5
+    assert folding.indentation_level("   ") == folding.BLANK
+
+
+def test_levels_follow_edits(tree):
+    assert tree.foldEnd(block(tree, 6)) == 7
+    cursor = folding.QtGui.QTextCursor(block(tree, 8))
+    cursor.insertText("    ")
+    tree.update(cursor.position() - 4, 0, 4)
+    assert tree.foldEnd(block(tree, 6)) == 8
+    cursor.movePosition(folding.QtGui.QTextCursor.EndOfBlock)
+    cursor.insertText("\n    x")  # An edit that isn't notified: the levels are measured again
+    assert tree.foldEnd(block(tree, 6)) == 9
+
+
+def test_fold_and_unfold(tree):
+    assert tree.fold(block(tree, 2)) is False
+    assert tree.fold(block(tree, 0)) is True
+    assert visible(tree) == [0, 5, 6, 7, 8]
+    assert tree.isFolded(block(tree, 0))
+    tree.unfold(block(tree, 0))
+    assert visible(tree) == list(range(9))
+    assert tree.foldedLines() == []
+
+
+def test_nested_folds(tree):
+    tree.fold(block(tree, 1))
+    tree.fold(block(tree, 0))
+    assert tree.foldedLines() == [0, 1]
+    tree.unfold(block(tree, 0))
+    assert visible(tree) == [0, 1, 3, 4, 5, 6, 7, 8]  # The inner fold stays folded
+    tree.reveal(block(tree, 2))
+    assert visible(tree) == list(range(9))
+
+
+def test_restore_folds(tree):
+    tree.fold(block(tree, 1))
+    tree.fold(block(tree, 0))
+    tree.fold(block(tree, 6))
+    lines = tree.foldedLines()
+    tree.unfoldAll()
+    assert visible(tree) == list(range(9))
+
+    restored = folding.KSFoldTree(tree.document)
+    restored.setFoldedLines(lines)
+    assert visible(restored) == [0, 5, 6, 8]
+    assert restored.foldedLines() == [0, 1, 6]
+    restored.unfold(block(restored, 0))
+    assert visible(restored) == [0, 1, 3, 4, 5, 6, 8]
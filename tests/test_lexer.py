@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+""" Tests of lexer: RuleSet precedence and groups, and the states BlockLexer carries from block to block.
+
+adrianpueyo.com
+
+"""
+
+import pytest
+
+from KnobScripter import lexer
+
+RULES = lexer.RuleSet([
+    (r"\bdef\s+(\w+)", ("function",)),
+    (r"\b(?:def|return)\b", "keyword"),
+    (r"\b\d+\b", "number"),
+])
+
+REGIONS = [
+    lexer.Region("docstring", '"""', '"""', state=2, multiline=True, escape=True),
+    lexer.Region("string", '"', '"', state=4, escape=True, continuation=True),
+    lexer.Region("comment", "#"),
+]
+
+
+def block_lexer():
+    return lexer.BlockLexer(REGIONS, RULES)
+
+
+def test_ruleset_rescans_around_groups():
+    # Only the name is formatted by the def rule, so "def" is left to the keyword rule
+    assert RULES.scan("def foo(): return 1") == [(0, 3, "keyword"), (4, 3, "function"), (11, 6, "keyword"),
+                                                 (18, 1, "number")]
+
+
+def test_ruleset_first_rule_wins():
+    rules = lexer.RuleSet([(r"x\w+", None), (r"\w+", "name")])
+    assert rules.scan("xyz abc") == [(4, 3, "name")]
+
+
+def test_ruleset_range():
+    assert RULES.scan("return 1 return 2", 7, 13) == [(7, 1, "number")]
+
+
+def test_ruleset_more_kinds_than_groups():
+    with pytest.raises(ValueError):
+        lexer.RuleSet([(r"\w+", ("name", "other"))])
+
+
+def test_block_lexer_regions_and_code():
+    runs, state = block_lexer().scan('return "a # b" # 1')
+    assert runs == [(0, 6, "keyword"), (7, 7, "string"), (15, 3, "comment")]
+    assert state == 0
+
+
+def test_block_lexer_escape():
+    runs, state = block_lexer().scan(r'"a\"b" 1')
+    assert runs == [(0, 6, "string"), (7, 1, "number")]
+    assert state == 0
+
+
+def test_block_lexer_multiline_state():
+    lexer_ = block_lexer()
+    runs, state = lexer_.scan('x = """doc')
+    assert runs == [(4, 6, "docstring")]
+    assert state == 2
+
+    runs, state = lexer_.scan("return 1", state)
+    assert runs == [(0, 8, "docstring")]
+    assert state == 2
+
+    runs, state = lexer_.scan('end""" + 1', state)
+    assert runs == [(0, 6, "docstring"), (9, 1, "number")]
+    assert state == 0
+
+
+def test_block_lexer_continuation_state():
+    lexer_ = block_lexer()
+    runs, state = lexer_.scan('"abc\\')
+    assert state == 4
+    runs, state = lexer_.scan('def" 1', state)
+    assert runs == [(0, 4, "string"), (5, 1, "number")]
+    assert state == 0
+
+    # An escaped backslash doesn't continue the string
+    assert lexer_.scan('"abc\\\\')[1] == 0
+
+
+def test_block_lexer_unknown_state():
+    assert block_lexer().scan("return 1", 7) == ([(0, 6, "keyword"), (7, 1, "number")], 0)
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+""" Tests of lineops: each line operation gives the expected text, in a single step of the document's undo stack.
+
+adrianpueyo.com
+
+"""
+
+import pytest
+
+from KnobScripter import lineops
+
+TEXT = "def f():\n    a = 1\n\n  b = 2\n    # c\nend"
+
+
+@pytest.mark.parametrize("operation, expected", [
+    (lambda d: lineops.indent(d, 1, 3, 4), "def f():\n        a = 1\n    \n      b = 2\n    # c\nend"),
+    (lambda d: lineops.unindent(d, 1, 3, 4), "def f():\na = 1\n\n b = 2\n    # c\nend"),
+    (lambda d: lineops.toggle_comment(d, 1, 3), "def f():\n  #  a = 1\n\n  #b = 2\n    # c\nend"),
+    (lambda d: lineops.toggle_comment(d, 4, 4, "# "), "def f():\n    a = 1\n\n  b = 2\n    c\nend"),
+    (lambda d: lineops.duplicate(d, 0, 1), "def f():\n    a = 1\ndef f():\n    a = 1\n\n  b = 2\n    # c\nend"),
+    (lambda d: lineops.move(d, 1, 2, -1), "    a = 1\n\ndef f():\n  b = 2\n    # c\nend"),
+    (lambda d: lineops.move(d, 4, 4, 1), "def f():\n    a = 1\n\n  b = 2\nend\n    # c"),
+])
+def test_single_undo(document, operation, expected):
+    doc = document(TEXT)
+    operation(doc)
+    assert doc.toPlainText() == expected
+    doc.undo()
+    assert doc.toPlainText() == TEXT
+
+
+def test_toggle_comment_twice(document):
+    doc = document(TEXT)
+    assert lineops.toggle_comment(doc, 0, 3) is True
+    assert lineops.toggle_comment(doc, 0, 3) is False
+    assert doc.toPlainText() == TEXT
+
+
+def test_no_change_no_undo_step(document):
+    doc = document(TEXT)
+    assert lineops.toggle_comment(doc, 2, 2) is False  # Blank lines only
+    lineops.unindent(doc, 0, 0, 4)
+    assert not doc.isUndoAvailable()
+
+
+def test_move_at_the_ends(document):
+    doc = document(TEXT)
+    assert lineops.move(doc, 0, 1, -1) == 0
+    assert lineops.move(doc, 4, 5, 1) == 0
+    assert lineops.move(doc, 0, 0, 1) == len("    a = 1\n")
+
+
+@pytest.mark.parametrize("old, new", [
+    (["abc", "abd"], ["abc", "abxd"]),
+    (["x", "y", "z"], ["x", "y", "z"]),
+    (["same", "", "same"], ["same", "new", "same"]),
+    (["aaa"], ["aa"]),
+    (["ab", "cd", "ef"], ["abX", "cd", "Xef"]),
+])
+def test_replace_lines(document, old, new):
+    doc = document("before\n" + "\n".join(old) + "\nafter")
+    lineops.replace_lines(doc, 1, lineops.line_texts(doc, 1, len(old)), new)
+    assert doc.toPlainText() == "before\n" + "\n".join(new) + "\nafter"
+
+
+def test_replace_lines_keeps_cursors(document):
+    doc = document("line one\nline two")
+    after = lineops.QtGui.QTextCursor(doc.findBlockByNumber(1))
+    after.setPosition(after.position() + 2)
+    lineops.replace_lines(doc, 0, ["line one"], ["    line one"])
+    assert after.position() == len("    line one\nli")
+
+
+def test_line_texts(document):
+    doc = document(TEXT)
+    assert lineops.line_texts(doc, 1, 3) == ["    a = 1", "", "  b = 2"]
+    assert lineops.block_range(lineops.QtGui.QTextCursor(doc)) == (0, 0)